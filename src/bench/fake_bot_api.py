@@ -0,0 +1,201 @@
+import io
+import json
+import asyncio
+from time import perf_counter, time
+from collections import Counter
+from typing import Any, NamedTuple
+
+import uvicorn
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, Response
+from PIL import Image
+
+from loguru import logger
+
+FAKE_BOT_ID = 1
+"""ИД бота, которого изображает поддельный Bot API"""
+
+FAKE_BOT_USERNAME = 'box_bot_bench_bot'
+"""Имя бота, которого изображает поддельный Bot API"""
+
+SENDING_METHODS = ('sendMessage', 'sendPhoto', 'sendDocument', 'sendMediaGroup', 'copyMessage')
+"""Методы Bot API, ответы которых считаются сообщениями бота пользователю"""
+
+class BotReply(NamedTuple):
+    """
+    Сообщение, отправленное ботом в чат
+    """
+    method:       str
+    text:         str|None
+    reply_markup: dict|None
+    received_at:  float
+
+class FakeBotApi:
+    """
+    Локальная замена Telegram Bot API для нагрузочного тестирования
+
+    Выдаёт боту обновления через `getUpdates`, принимает отправку сообщений и раздаёт файлы,
+    не обращаясь к telegram. Ответы бота складываются в очереди по чатам для симулируемых пользователей
+    """
+
+    GET_UPDATES_LIMIT = 100
+    """Максимальное число обновлений в одном ответе `getUpdates`"""
+
+    def __init__(self, host: str = '127.0.0.1', port: int = 8081, photos_count: int = 20) -> None:
+        self.host = host
+        self.port = port
+
+        self.calls: Counter[str] = Counter()
+        """Число вызовов каждого метода Bot API"""
+
+        self._updates: asyncio.Queue[dict] = asyncio.Queue()
+        self._update_id  = 0
+        self._message_id = 0
+        self._replies: dict[int, asyncio.Queue[BotReply]] = {}
+        self._photos = [self._make_photo(idx) for idx in range(photos_count)]
+
+        self._server: uvicorn.Server | None = None
+        self._server_task: asyncio.Task | None = None
+
+        self.app = FastAPI()
+        self.app.add_api_route('/bot{token}/{method}', self._handle_method, methods=['GET', 'POST'])
+        self.app.add_api_route('/file/bot{token}/{file_path:path}', self._handle_file, methods=['GET'])
+
+    @property
+    def base_url(self) -> str:
+        return f"http://{self.host}:{self.port}/bot"
+
+    @property
+    def base_file_url(self) -> str:
+        return f"http://{self.host}:{self.port}/file/bot"
+
+    @staticmethod
+    def _make_photo(idx: int) -> bytes:
+        """
+        Внутренняя функция создания различающегося по содержимому JPEG изображения
+        """
+        image = Image.new('RGB', (1280, 960), ((idx * 37) % 256, (idx * 91) % 256, (idx * 53) % 256))
+        in_memory = io.BytesIO()
+        image.save(in_memory, format='JPEG', quality=90)
+        return in_memory.getvalue()
+
+    def photo_file_unique_id(self, idx: int) -> str:
+        return f"bench_photo_{idx % len(self._photos)}"
+
+    def next_message_id(self) -> int:
+        self._message_id += 1
+        return self._message_id
+
+    def put_update(self, update: dict) -> None:
+        """
+        Поставить обновление в очередь выдачи боту
+        """
+        self._update_id += 1
+        update['update_id'] = self._update_id
+        self._updates.put_nowait(update)
+
+    def replies(self, chat_id: int) -> asyncio.Queue[BotReply]:
+        """
+        Очередь сообщений бота в чат
+        """
+        return self._replies.setdefault(chat_id, asyncio.Queue())
+
+    def _message(self, chat_id: int, **fields: Any) -> dict:
+        """
+        Внутренняя функция построения сообщения бота в формате Bot API
+        """
+        return {
+            'message_id': self.next_message_id(),
+            'date': int(time()),
+            'chat': {'id': chat_id, 'type': 'private'},
+            'from': {'id': FAKE_BOT_ID, 'is_bot': True, 'first_name': 'Bench', 'username': FAKE_BOT_USERNAME},
+            **fields
+        }
+
+    async def _get_updates(self, params: dict) -> list[dict]:
+        """
+        Внутренняя функция длинного опроса обновлений
+        """
+        timeout = float(params.get('timeout') or 0)
+        try:
+            updates = [await asyncio.wait_for(self._updates.get(), timeout)] if timeout else []
+        except asyncio.TimeoutError:
+            return []
+        limit = int(params.get('limit') or self.GET_UPDATES_LIMIT)
+        while len(updates) < limit and not self._updates.empty():
+            updates.append(self._updates.get_nowait())
+        return updates
+
+    def _send(self, method: str, params: dict) -> dict:
+        """
+        Внутренняя функция приёма сообщения бота в чат
+        """
+        chat_id = int(params['chat_id'])
+        reply_markup = json.loads(params['reply_markup']) if params.get('reply_markup') else None
+        text = params.get('text') or params.get('caption')
+        self.replies(chat_id).put_nowait(BotReply(method, text, reply_markup, perf_counter()))
+
+        if method == 'sendPhoto':
+            return self._message(chat_id, photo=[{'file_id': 'sent_photo', 'file_unique_id': 'sent_photo', 'width': 320, 'height': 240}])
+        if method == 'sendDocument':
+            return self._message(chat_id, document={'file_id': 'sent_document', 'file_unique_id': 'sent_document'})
+        return self._message(chat_id, text=text or '')
+
+    async def _handle_method(self, token: str, method: str, request: Request) -> JSONResponse:
+        """
+        Ответ на вызов метода Bot API
+        """
+        self.calls[method] += 1
+        params = {key: value for key, value in (await request.form()).items() if isinstance(value, str)}
+
+        if method == 'getUpdates':
+            result = await self._get_updates(params)
+        elif method == 'getMe':
+            result = {'id': FAKE_BOT_ID, 'is_bot': True, 'first_name': 'Bench', 'username': FAKE_BOT_USERNAME}
+        elif method in SENDING_METHODS:
+            result = self._send(method, params)
+        elif method == 'getFile':
+            file_id = params['file_id']
+            result = {'file_id': file_id, 'file_unique_id': file_id, 'file_path': f"photos/{file_id}.jpg"}
+        elif method == 'getMyName':
+            result = {'name': ''}
+        elif method == 'getMyShortDescription':
+            result = {'short_description': ''}
+        elif method == 'getMyDescription':
+            result = {'description': ''}
+        elif method == 'getMyCommands':
+            result = []
+        else:
+            result = True
+        return JSONResponse({'ok': True, 'result': result})
+
+    async def _handle_file(self, token: str, file_path: str) -> Response:
+        """
+        Выдача содержимого файла, загружаемого ботом
+        """
+        file_id = file_path.rsplit('/', 1)[-1].removesuffix('.jpg')
+        try:
+            photo = self._photos[int(file_id.rsplit('_', 1)[-1]) % len(self._photos)]
+        except ValueError:
+            photo = self._photos[0]
+        return Response(photo, media_type='image/jpeg')
+
+    async def start(self) -> None:
+        """
+        Запустить сервер поддельного Bot API
+        """
+        self._server = uvicorn.Server(uvicorn.Config(self.app, host=self.host, port=self.port, log_level='warning'))
+        self._server_task = asyncio.create_task(self._server.serve())
+        while not self._server.started:
+            if self._server_task.done():
+                raise RuntimeError(f"Fake Bot API could not start on {self.host}:{self.port}")
+            await asyncio.sleep(0.05)
+        logger.info(f"Fake Bot API is listening on {self.base_url}")
+
+    async def stop(self) -> None:
+        """
+        Остановить сервер поддельного Bot API
+        """
+        if self._server:
+            self._server.should_exit = True
+            await self._server_task
@@ -0,0 +1,165 @@
+import os
+import asyncio
+import argparse
+from time import perf_counter
+from collections import Counter
+
+from sqlalchemy import select, delete
+from loguru import logger
+
+BENCH_TOKEN = '1:box-bot-bench'
+"""Токен бота при нагрузочном тестировании - запросы всё равно уходят только в поддельный Bot API"""
+
+os.environ['TG_TOKEN'] = BENCH_TOKEN
+os.environ.setdefault('QUERY_BUDGET__ENABLED', 'true')
+os.environ.setdefault('QUERY_BUDGET__REPORT_INTERVAL', '86400')
+
+from utils.db_model import User, Field, UserFieldValue, NotificationDelivery
+from utils.custom_types import BotStatusEnum
+
+from bot.application_builder import BBApplicationBuilder
+from bot.application import BBApplication
+from bot.map_handlers import map_default_handlers
+from bot.handlers.default import error_handler
+
+from bench.fake_bot_api import FakeBotApi
+from bench.simulated_users import (
+    BENCH_CHAT_ID_OFFSET,
+    SimulatedUsersSettings,
+    UserActionSample,
+    run_simulated_users
+)
+
+def _percentile(values: list[float], percent: float) -> float:
+    """
+    Внутренняя функция получения перцентиля по ближайшему рангу
+    """
+    if not values:
+        return float('nan')
+    values = sorted(values)
+    return values[min(len(values) - 1, max(0, round(percent / 100 * len(values)) - 1))]
+
+def _format_latencies(samples: list[UserActionSample]) -> str:
+    latencies = [sample.latency for sample in samples if sample.latency is not None]
+    return (
+        f"{len(samples)} updates, {len(samples) - len(latencies)} unanswered, "
+        f"p50 {_percentile(latencies, 50) * 1000:.1f} ms, p99 {_percentile(latencies, 99) * 1000:.1f} ms"
+    )
+
+async def _get_image_questions(app: BBApplication) -> set[str]:
+    """
+    Внутренняя функция получения текстов вопросов, на которые отвечают изображением или документом
+    """
+    async with app.provider.db_session() as session:
+        selected = await session.execute(
+            select(Field.question_markdown)
+            .where(Field.image_bucket.is_not(None) | Field.document_bucket.is_not(None))
+        )
+        return {question for question in selected.scalars() if question}
+
+async def _delete_bench_users(app: BBApplication) -> None:
+    """
+    Внутренняя функция удаления симулированных пользователей и их данных
+    """
+    bench_users_ids = select(User.id).where(User.chat_id >= BENCH_CHAT_ID_OFFSET)
+    async with app.provider.db_session() as session:
+        await session.execute(delete(UserFieldValue).where(UserFieldValue.user_id.in_(bench_users_ids)))
+        await session.execute(delete(NotificationDelivery).where(NotificationDelivery.user_id.in_(bench_users_ids)))
+        deleted = await session.execute(delete(User).where(User.chat_id >= BENCH_CHAT_ID_OFFSET))
+        await session.commit()
+    logger.info(f"Deleted {deleted.rowcount} simulated users")
+
+def _report(app: BBApplication, api: FakeBotApi, samples: list[UserActionSample], elapsed: float) -> None:
+    """
+    Внутренняя функция вывода результатов нагрузочного тестирования
+    """
+    lines = [
+        f"Throughput: {len(samples) / elapsed:.1f} updates/s over {elapsed:.1f} s",
+        f"Latency (update to first reply): {_format_latencies(samples)}"
+    ]
+    for kind in sorted({sample.kind for sample in samples}):
+        lines.append(f"  {kind}: {_format_latencies([sample for sample in samples if sample.kind == kind])}")
+
+    summaries = app.query_stats.pop_top()
+    updates    = sum(summary.updates for summary in summaries)
+    statements = sum(summary.statements for summary in summaries)
+    if updates:
+        lines.append(f"DB: {statements / updates:.1f} statements per handled update")
+    for summary in summaries:
+        lines.append((
+            f"  {summary.name}: {summary.statements_per_update:.1f} avg / {summary.max_statements} max statements, "
+            f"{summary.duration / summary.updates * 1000:.1f} ms avg DB time, {summary.over_budget}/{summary.updates} over budget"
+        ))
+
+    calls: Counter[str] = api.calls
+    lines.append("Bot API calls: " + ', '.join(f"{method} {count}" for method, count in calls.most_common()))
+    logger.info("Bench results:\n" + '\n'.join(lines))
+
+async def run_bench(args: argparse.Namespace) -> None:
+    """
+    Запустить бота против поддельного Bot API и симулировать пользователей
+    """
+    api = FakeBotApi(args.api_host, args.api_port, args.photos)
+    await api.start()
+
+    app: BBApplication = BBApplicationBuilder() \
+        .base_url(api.base_url) \
+        .base_file_url(api.base_file_url) \
+        .build()
+    app.add_error_handler(error_handler)
+
+    await app.update_bot_status()
+    if app.status != BotStatusEnum.ON:
+        await api.stop()
+        logger.error(f"Bot status is {app.status=}, switch it on before running the bench")
+        exit(1)
+    map_default_handlers(app)
+
+    image_questions = await _get_image_questions(app)
+    settings = SimulatedUsersSettings(
+        steps            = args.steps,
+        key_tap_ratio    = args.key_tap_ratio,
+        inline_tap_ratio = args.inline_tap_ratio,
+        think_time       = args.think_time,
+        reply_timeout    = args.reply_timeout
+    )
+
+    try:
+        async with app:
+            await app.post_init(app)
+            await app.updater.start_polling(timeout=1, allowed_updates=app.ALLOWED_UPDATES)
+            await app.start()
+
+            logger.info(f"Simulating {args.users} users, {args.concurrency} at once, {args.steps} actions each")
+            started = perf_counter()
+            samples = await run_simulated_users(api, args.users, args.concurrency, image_questions, settings, args.seed)
+            elapsed = perf_counter() - started
+
+            await app.updater.stop()
+            await app.stop()
+            await app.post_stop(app)
+
+            _report(app, api, samples, elapsed)
+            if not args.keep_users:
+                await _delete_bench_users(app)
+    finally:
+        await api.stop()
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Нагрузочное тестирование бота с поддельным Bot API")
+    parser.add_argument('--users',       type=int,   default=1000, help="Число симулируемых пользователей")
+    parser.add_argument('--concurrency', type=int,   default=200,  help="Число одновременно активных пользователей")
+    parser.add_argument('--steps',       type=int,   default=20,   help="Число действий каждого пользователя после /start")
+    parser.add_argument('--key-tap-ratio',    type=float, default=0.5, help="Доля ответов нажатием кнопки клавиатуры")
+    parser.add_argument('--inline-tap-ratio', type=float, default=0.5, help="Доля нажатий на inline-кнопки")
+    parser.add_argument('--think-time',    type=float, default=0.0,  help="Средняя пауза пользователя перед действием в секундах")
+    parser.add_argument('--reply-timeout', type=float, default=10.0, help="Время ожидания ответа бота в секундах")
+    parser.add_argument('--photos',   type=int, default=20,   help="Число различных изображений, отправляемых пользователями")
+    parser.add_argument('--seed',     type=int, default=0,    help="Начальное значение генератора случайных действий")
+    parser.add_argument('--api-host', default='127.0.0.1',    help="Адрес поддельного Bot API")
+    parser.add_argument('--api-port', type=int, default=8081, help="Порт поддельного Bot API")
+    parser.add_argument('--keep-users', action='store_true',  help="Не удалять симулированных пользователей после теста")
+
+    logger.info("Starting bench...")
+    asyncio.run(run_bench(parser.parse_args()))
+    logger.info("Done! Have a great day!")
@@ -0,0 +1,163 @@
+import random
+import asyncio
+from time import perf_counter, time
+from typing import NamedTuple
+
+from bench.fake_bot_api import FakeBotApi, BotReply
+
+BENCH_CHAT_ID_OFFSET = 7_000_000_000_000
+"""Начало диапазона ИД чатов симулируемых пользователей, не пересекающегося с реальными"""
+
+class UserActionSample(NamedTuple):
+    """
+    Результат одного действия симулируемого пользователя
+    """
+    kind:     str
+    latency:  float|None
+    """Время от выдачи обновления боту до первого ответа в чат, `None` если ответа не было"""
+
+class SimulatedUsersSettings(NamedTuple):
+    """
+    Поведение симулируемых пользователей
+    """
+    steps:           int   = 20    # Число действий каждого пользователя после /start
+    key_tap_ratio:   float = 0.5   # Доля ответов нажатием кнопки клавиатуры, когда она есть
+    inline_tap_ratio: float = 0.5  # Доля нажатий на inline-кнопку, когда она есть
+    think_time:      float = 0.0   # Пауза пользователя перед каждым действием в секундах
+    reply_timeout:   float = 10.0  # Время ожидания ответа бота в секундах
+    settle_time:     float = 0.05  # Время ожидания следующих сообщений бота после первого ответа
+
+class SimulatedUser:
+    """
+    Пользователь, проходящий ветки регистрации через поддельный Bot API
+
+    Следующее действие выбирается по последнему ответу бота: фото на вопрос с изображением,
+    нажатие кнопки reply или inline клавиатуры или текстовый ответ
+    """
+
+    def __init__(
+            self, idx: int, api: FakeBotApi,
+            image_questions: set[str], settings: SimulatedUsersSettings,
+            rng: random.Random
+        ) -> None:
+        self.chat_id  = BENCH_CHAT_ID_OFFSET + idx
+        self.username = f"bench_user_{idx}"
+        self.api      = api
+        self.image_questions = image_questions
+        self.settings = settings
+        self.rng      = rng
+        self.samples: list[UserActionSample] = []
+
+    def _message(self, **fields) -> dict:
+        """
+        Внутренняя функция построения сообщения пользователя в формате Bot API
+        """
+        return {
+            'message_id': self.api.next_message_id(),
+            'date': int(time()),
+            'chat': {'id': self.chat_id, 'type': 'private', 'username': self.username},
+            'from': {'id': self.chat_id, 'is_bot': False, 'first_name': 'Bench', 'username': self.username},
+            **fields
+        }
+
+    def _command_update(self, command: str) -> dict:
+        return {'message': self._message(
+            text = f"/{command}",
+            entities = [{'type': 'bot_command', 'offset': 0, 'length': len(command) + 1}]
+        )}
+
+    def _text_update(self, text: str) -> dict:
+        return {'message': self._message(text = text)}
+
+    def _photo_update(self) -> dict:
+        file_id = self.api.photo_file_unique_id(self.rng.randrange(1 << 16))
+        return {'message': self._message(photo = [{
+            'file_id': file_id, 'file_unique_id': file_id,
+            'width': 1280, 'height': 960
+        }])}
+
+    def _callback_update(self, data: str, reply: BotReply) -> dict:
+        return {'callback_query': {
+            'id': f"{self.chat_id}_{self.api.next_message_id()}",
+            'from': {'id': self.chat_id, 'is_bot': False, 'first_name': 'Bench', 'username': self.username},
+            'chat_instance': str(self.chat_id),
+            'data': data,
+            'message': self._message(text = reply.text or '')
+        }}
+
+    async def _send_and_wait(self, kind: str, update: dict) -> list[BotReply]:
+        """
+        Внутренняя функция отправки обновления и ожидания ответов бота
+        """
+        replies_queue = self.api.replies(self.chat_id)
+        while not replies_queue.empty():
+            replies_queue.get_nowait()
+
+        started = perf_counter()
+        self.api.put_update(update)
+        try:
+            replies = [await asyncio.wait_for(replies_queue.get(), self.settings.reply_timeout)]
+        except asyncio.TimeoutError:
+            self.samples.append(UserActionSample(kind, None))
+            return []
+        self.samples.append(UserActionSample(kind, replies[0].received_at - started))
+
+        while True:
+            try:
+                replies.append(await asyncio.wait_for(replies_queue.get(), self.settings.settle_time))
+            except asyncio.TimeoutError:
+                return replies
+
+    def _next_action(self, replies: list[BotReply]) -> tuple[str, dict]:
+        """
+        Внутренняя функция выбора следующего действия по ответам бота
+        """
+        reply = next((reply for reply in reversed(replies) if reply.reply_markup), replies[-1] if replies else None)
+        markup = reply.reply_markup if reply else None
+
+        if reply and reply.text in self.image_questions:
+            return 'photo', self._photo_update()
+
+        if markup and 'inline_keyboard' in markup and self.rng.random() < self.settings.inline_tap_ratio:
+            buttons = [button for row in markup['inline_keyboard'] for button in row if button.get('callback_data')]
+            if buttons:
+                return 'inline_key', self._callback_update(self.rng.choice(buttons)['callback_data'], reply)
+
+        if markup and 'keyboard' in markup and self.rng.random() < self.settings.key_tap_ratio:
+            keys = [key if isinstance(key, str) else key['text'] for row in markup['keyboard'] for key in row]
+            if keys:
+                return 'key', self._text_update(self.rng.choice(keys))
+
+        return 'text', self._text_update(f"Bench answer {self.rng.randrange(1 << 30)}")
+
+    async def run(self) -> None:
+        """
+        Пройти регистрацию и выполнить заданное число действий
+        """
+        replies = await self._send_and_wait('start', self._command_update('start'))
+        for _ in range(self.settings.steps):
+            if self.settings.think_time:
+                await asyncio.sleep(self.rng.uniform(0, 2 * self.settings.think_time))
+            kind, update = self._next_action(replies)
+            replies = await self._send_and_wait(kind, update)
+
+async def run_simulated_users(
+        api: FakeBotApi, users_count: int, concurrency: int,
+        image_questions: set[str], settings: SimulatedUsersSettings,
+        seed: int = 0
+    ) -> list[UserActionSample]:
+    """
+    Запустить симуляцию пользователей, не больше `concurrency` одновременно, и вернуть результаты их действий
+    """
+    semaphore = asyncio.Semaphore(concurrency)
+    users = [
+        SimulatedUser(idx, api, image_questions, settings, random.Random(seed + idx))
+        for idx in range(users_count)
+    ]
+
+    async def run_user(user: SimulatedUser) -> None:
+        async with semaphore:
+            await user.run()
+
+    await asyncio.gather(*(run_user(user) for user in users))
+    return [sample for user in users for sample in user.samples]
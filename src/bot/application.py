@@ -1,12 +1,17 @@
+import asyncio
+import httpx
+import functools
 from asyncio import Queue
 from typing import Any, Callable, Coroutine
-from telegram.ext import Application, CallbackContext
+from telegram.ext import Application, BaseHandler, CallbackContext
+from telegram.ext._application import DEFAULT_GROUP
 from telegram.ext._basepersistence import BasePersistence
 from telegram.ext._baseupdateprocessor import BaseUpdateProcessor
 from telegram.ext._contexttypes import ContextTypes
 from telegram.ext._updater import Updater
 
 from telegram import (
+    Update,
     Bot, BotName,
     BotShortDescription,
     BotDescription,
@@ -16,13 +21,32 @@ from telegram import (
 from datetime import datetime
 from loguru import logger
 
+from bot.broadcaster import BBBroadcaster
+from bot.log_writer  import BBLogWriter
+
 from utils.bb_provider  import BBProvider
+from utils.metrics      import metrics
+from utils.query_stats  import QueryStats, QueryStatsAggregator, track_queries
 from utils.custom_types import BotStatusEnum
 
 from sqlalchemy.ext.asyncio.session import AsyncSession
 from sqlalchemy import insert, update
 from utils.db_model import BotStatus, Log
 
+HANDLER_DURATION = metrics.histogram(
+    'bot_handler_duration_seconds', 'Длительность обработчиков обновлений', ('handler',)
+)
+HANDLER_ERRORS = metrics.counter(
+    'bot_handler_errors_total', 'Исключения в обработчиках обновлений', ('handler',)
+)
+HANDLER_DB_STATEMENTS = metrics.histogram(
+    'bot_handler_db_statements', 'Число запросов к БД за вызов обработчика', ('handler',),
+    buckets=(1, 2, 3, 5, 8, 13, 21, 34)
+)
+HANDLER_DB_DURATION = metrics.histogram(
+    'bot_handler_db_duration_seconds', 'Суммарное время запросов к БД за вызов обработчика', ('handler',)
+)
+
 class BBApplication(Application):
     """
     Класс приложения бота в коробке
@@ -32,10 +56,19 @@ class BBApplication(Application):
     UPDATE_GROUP_GROUP_REQUEST = 2
     UPDATE_GROUP_CHAT_MEMBER   = 3
 
+    ALLOWED_UPDATES = [Update.MESSAGE, Update.EDITED_MESSAGE, Update.CALLBACK_QUERY, Update.MY_CHAT_MEMBER]
+    """Типы обновлений, которые обрабатывает бот - остальные telegram не присылает"""
+
     START_COMMAND  = 'start'
     HELP_COMMAND   = 'help'
     REPORT_COMMAND = 'report'
 
+    BOT_STATUS_FALLBACK_POLL_INTERVAL = 60
+    """Интервал резервной проверки статуса бота на случай потери подписки на изменения"""
+
+    JOBS_LEADER_ELECTION_INTERVAL = 30
+    """Интервал попыток стать процессом, выполняющим периодические задачи"""
+
     def __init__(
             self, *,
             provider: BBProvider, 
@@ -64,16 +97,172 @@ class BBApplication(Application):
         )
         self.provider = provider
         self.status   = BotStatusEnum.OFF
+        self._is_switching_status = False
+
+        self.broadcaster = BBBroadcaster(bot, provider.config.broadcast)
+        self.log_writer  = BBLogWriter(provider, provider.config.log_writer)
+        self.notifications_in_progress: dict[int, asyncio.Task] = {}
+        """Задачи рассылки уведомлений этим процессом по ИД уведомлений"""
+
+        self.files_client = httpx.AsyncClient(timeout=httpx.Timeout(30.0, connect=10.0))
+        """HTTP клиент для потоковой загрузки файлов из telegram"""
+
+        self.fields_graph = None
+        """Скомпилированный граф вопросов `bot.helpers.fields.FieldsGraph`"""
+        self.fields_graph_lock = asyncio.Lock()
+
+        self.keyboard_keys_index = None
+        """Индекс кнопок клавиатуры `bot.helpers.keyboards.KeyboardKeysIndex`"""
+        self.keyboard_keys_index_lock = asyncio.Lock()
+
+        self.query_stats = QueryStatsAggregator()
+        """Накопленная статистика запросов к БД по обработчикам"""
     
-    async def update_bot_status(self) -> None:
+    async def update_bot_status(self, use_cache: bool = True) -> None:
         """
-        Обновить статус бота - используется при старте программы
+        Обновить статус бота - используется при старте программы и при изменении статуса
         """
-        bot_status  = await self.provider.bot_status
+        bot_status  = await self.provider.bot_status if use_cache else await self.provider.reload_bot_status()
         self.status = bot_status.bot_status
-    
+
+    def add_handler(self, handler: BaseHandler, group: int = DEFAULT_GROUP) -> None:
+        """
+        Добавить обработчик, учитывая длительность, ошибки и запросы к БД его выполнения, если это включено
+        """
+        if self.provider.config.metrics.enabled:
+            handler.callback = self._instrument_callback(handler.callback)
+        if self.provider.config.query_budget.enabled:
+            handler.callback = self._track_callback_queries(handler.callback)
+        super().add_handler(handler, group)
+
+    @staticmethod
+    def _instrument_callback(callback: Callable[..., Coroutine[Any, Any, Any]]) -> Callable[..., Coroutine[Any, Any, Any]]:
+        """
+        Внутренняя функция оборачивания обработчика для сбора метрик по его имени
+        """
+        handler_name = callback.__name__
+
+        @functools.wraps(callback)
+        async def instrumented(update: object, context: CallbackContext) -> Any:
+            with HANDLER_DURATION.time(handler=handler_name):
+                try:
+                    return await callback(update, context)
+                except Exception:
+                    HANDLER_ERRORS.inc(handler=handler_name)
+                    raise
+        return instrumented
+
+    def _track_callback_queries(self, callback: Callable[..., Coroutine[Any, Any, Any]]) -> Callable[..., Coroutine[Any, Any, Any]]:
+        """
+        Внутренняя функция оборачивания обработчика для подсчёта запросов к БД за каждое обновление
+        """
+        handler_name = callback.__name__
+
+        @functools.wraps(callback)
+        async def tracked(update: object, context: CallbackContext) -> Any:
+            with track_queries(handler_name) as query_stats:
+                try:
+                    return await callback(update, context)
+                finally:
+                    self._check_query_budget(query_stats)
+        return tracked
+
+    def _check_query_budget(self, query_stats: QueryStats) -> None:
+        """
+        Внутренняя функция учёта запросов к БД обновления и предупреждения о превышении бюджета
+        """
+        query_budget = self.provider.config.query_budget
+        over_budget = (
+            query_stats.statements > query_budget.max_statements or
+            query_stats.duration   > query_budget.max_db_time
+        )
+        self.query_stats.add(query_stats, over_budget)
+
+        if self.provider.config.metrics.enabled:
+            HANDLER_DB_STATEMENTS.observe(query_stats.statements, handler=query_stats.name)
+            HANDLER_DB_DURATION.observe(query_stats.duration, handler=query_stats.name)
+
+        if over_budget:
+            repeated = ', '.join(
+                f"{count}x `{statement}`"
+                for statement, count in query_stats.statements_texts.most_common(3)
+            )
+            logger.warning((
+                f"Handler {query_stats.name} exceeded DB budget with {query_stats.statements} statements "
+                f"in {query_stats.duration:.3f}s, most frequent: {repeated}"
+            ))
+
+    async def _query_stats_report_job(self, context: CallbackContext) -> None:
+        """
+        Периодический вывод обработчиков с наибольшим числом запросов к БД на обновление
+        """
+        top = self.query_stats.pop_top(self.provider.config.query_budget.report_top)
+        if not top:
+            return
+        logger.info("Top DB statements per update handlers: " + '; '.join(
+            (
+                f"{summary.name} {summary.statements_per_update:.1f} avg / {summary.max_statements} max statements, "
+                f"{summary.duration / summary.updates:.3f}s avg, {summary.over_budget}/{summary.updates} over budget"
+            )
+            for summary in top
+        ))
+
+    async def _jobs_leader_election_job(self, context: CallbackContext) -> None:
+        """
+        Попытка стать процессом, выполняющим периодические задачи, если их сейчас никто не выполняет
+        """
+        try:
+            await self.provider.try_acquire_jobs_leadership()
+        except Exception as err:
+            logger.warning(f"Was not able to elect jobs leader: {err}")
+
+    def _on_bot_status_changed(self) -> None:
+        """
+        Внутренняя функция, вызываемая при уведомлении об изменении статуса бота
+        """
+        self.create_task(self._bot_status_switch(use_cache=True))
+
+    def _on_jobs_leadership_lost(self) -> None:
+        """
+        Внутренняя функция, вызываемая при потере права выполнять периодические задачи
+
+        Останавливает рассылки уведомлений, чтобы новый выполняющий процесс не отправил их сообщения повторно
+        """
+        for notification_id, task in self.notifications_in_progress.items():
+            logger.warning(f"Cancelling deliveries of notification {notification_id=} after losing jobs leadership")
+            task.cancel()
+
     async def _bot_status_switch_job(self, context: CallbackContext) -> None:
-        await self.update_bot_status()
+        """
+        Резервная проверка статуса бота - восстанавливает подписку на изменения и читает статус в обход кеша
+        """
+        try:
+            await self.provider.listen_changes()
+        except Exception:
+            logger.warning("Was not able to resubscribe to table changes... continuing with fallback poll")
+        await self._bot_status_switch(use_cache=False)
+
+    async def _bot_status_switch(self, use_cache: bool) -> None:
+        """
+        Внутренняя функция переключения режима работы бота согласно статусу в БД
+
+        Не выполняется повторно, пока не завершено текущее переключение - в том числе вызванное
+        уведомлением об изменении статуса, которое отправило само переключение
+        """
+        if self._is_switching_status:
+            return logger.info("Bot status switch is already in progress... skipping")
+
+        self._is_switching_status = True
+        try:
+            await self._switch_bot_status(use_cache)
+        finally:
+            self._is_switching_status = False
+
+    async def _switch_bot_status(self, use_cache: bool) -> None:
+        """
+        Внутренняя функция чтения статуса бота и выхода из процесса, если бот не должен работать
+        """
+        await self.update_bot_status(use_cache)
 
         if self.status == BotStatusEnum.ON:
             return logger.info("Checked bot status... should be on, so continuing")
@@ -85,6 +274,7 @@ class BBApplication(Application):
                 await session.execute(
                     update(BotStatus).values(bot_status = BotStatusEnum.RESTARTING)
                 )
+                await self.provider.notify_changed(session, BotStatus)
                 await self._write_log(session, "Exiting into `restarting` mode")
             elif self.status == BotStatusEnum.SERVICE:
                 await self._write_log(session, "Exiting into `service` mode")
@@ -93,7 +283,10 @@ class BBApplication(Application):
             
             await session.commit()
 
-            exit(0)
+        # Выход не доходит до `post_stop` при работе через webhook и в процессах обработки,
+        # поэтому буферизованные логи сохраняются до него
+        await self.log_writer.stop()
+        exit(0)
         
     async def _post_init(self, _: Application) -> None:
         """
@@ -111,12 +304,21 @@ class BBApplication(Application):
         """
         bot: Bot = self.bot
 
+        await self.provider.listen_changes()
+        await self.provider.try_acquire_jobs_leadership()
+        self.log_writer.start()
+
+        if self.provider.config.metrics.enabled:
+            metrics.gauge('bot_update_queue_size', 'Число обновлений в очереди', self.update_queue.qsize)
+            await metrics.serve(self.provider.config.metrics.host, self.provider.config.metrics.port)
+
         logger.info("Performing DB writes...")
         async with self.provider.db_session() as session:
             if self.status in [BotStatusEnum.RESTART, BotStatusEnum.RESTARTING]:
                 await session.execute(
                     update(BotStatus).values(bot_status = BotStatusEnum.ON)
                 )
+                await self.provider.notify_changed(session, BotStatus)
                 await self._write_log(session, "Starting in `standard` mode after restart")
             elif self.status == BotStatusEnum.SERVICE:
                 await self._write_log(session, "Starting in `service` mode")
@@ -150,7 +352,12 @@ class BBApplication(Application):
             await bot.set_my_commands(my_commands)
             logger.info("Found difference in my commands - updated")
 
-        self.job_queue.run_repeating(self._bot_status_switch_job, interval=5)
+        self.provider.add_change_callback(BotStatus, self._on_bot_status_changed)
+        self.provider.add_jobs_leadership_lost_callback(self._on_jobs_leadership_lost)
+        self.job_queue.run_repeating(self._bot_status_switch_job, interval=self.BOT_STATUS_FALLBACK_POLL_INTERVAL)
+        self.job_queue.run_repeating(self._jobs_leader_election_job, interval=self.JOBS_LEADER_ELECTION_INTERVAL)
+        if self.provider.config.query_budget.enabled:
+            self.job_queue.run_repeating(self._query_stats_report_job, interval=self.provider.config.query_budget.report_interval)
         logger.info("Statrted sheldued jobs")
         
         logger.info("Post init complete... starting main update loop")
@@ -161,6 +368,12 @@ class BBApplication(Application):
         """
         logger.warning("Writing logs before stop")
         await self.write_log("Stopped an application")
+        await self.log_writer.stop()
+        await self.provider.stop_listening_changes()
+        await self.provider.release_jobs_leadership()
+        await metrics.stop()
+        self.provider.minio.shutdown()
+        await self.files_client.aclose()
     
     async def _write_log(self, session: AsyncSession, message: str) -> None:
         """
@@ -175,8 +388,6 @@ class BBApplication(Application):
     
     async def write_log(self, message: str) -> None:
         """
-        Запись лога в БД
+        Запись лога в БД через буфер - сохраняется пачками в фоне и при остановке бота
         """
-        async with self.provider.db_session() as session:
-            await self._write_log(session, message)
-            await session.commit()
\ No newline at end of file
+        await self.log_writer.write(message)
\ No newline at end of file
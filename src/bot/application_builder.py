@@ -1,6 +1,8 @@
 from telegram.ext import ApplicationBuilder
 
 from bot.application import BBApplication
+from bot.request import BBRequest
+from bot.update_processor import ChatOrderedUpdateProcessor
 from utils.bb_provider import BBProvider
 
 class BBApplicationBuilder(ApplicationBuilder):
@@ -8,6 +10,8 @@ class BBApplicationBuilder(ApplicationBuilder):
     Переопределённый класс `ApplicationBuilder` для нужд этого приложения
 
     Создаёт проводник ресурсов и устанавливает токен для бота из него
+
+    Обновления обрабатываются параллельно для разных чатов и по очереди в одном чате
     """
 
     def __init__(self):
@@ -17,4 +21,12 @@ class BBApplicationBuilder(ApplicationBuilder):
         self._token    = self._provider.config.tg_token
         
         self._application_class  = BBApplication
-        self._application_kwargs = {'provider': self._provider}
\ No newline at end of file
+        self._application_kwargs = {'provider': self._provider}
+
+        self.concurrent_updates(ChatOrderedUpdateProcessor(
+            max_concurrent_updates = self._provider.config.update_processing.max_concurrent,
+            max_pending_updates    = self._provider.config.update_processing.max_pending
+        ))
+
+        if self._provider.config.metrics.enabled:
+            self.request(BBRequest(connection_pool_size=256))
\ No newline at end of file
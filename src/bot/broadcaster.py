@@ -0,0 +1,205 @@
+import asyncio
+from time import monotonic
+from collections import Counter
+from typing import Any, Awaitable, Callable, Iterable, NamedTuple
+
+from telegram import (
+    Bot,
+    ReplyKeyboardMarkup,
+    ReplyKeyboardRemove,
+    InlineKeyboardMarkup
+)
+from telegram.constants import ParseMode
+from telegram.error import RetryAfter, Forbidden, BadRequest, TimedOut, NetworkError, TelegramError
+
+from loguru import logger
+
+from utils.config_model import Broadcast
+from utils.custom_types import DeliveryStatusEnum
+
+class BroadcastMessage(NamedTuple):
+    """
+    Сообщение массовой рассылки одному получателю
+    """
+    chat_id:      int
+    text:         str
+    parse_mode:   ParseMode | None = None
+    reply_markup: ReplyKeyboardMarkup | ReplyKeyboardRemove | InlineKeyboardMarkup | None = None
+    context:      Any = None
+    """Произвольные данные отправителя, возвращаемые в обработчик результата"""
+
+class BroadcastReport(NamedTuple):
+    """
+    Итог массовой рассылки
+    """
+    name:    str
+    sent:    int
+    failed:  int
+    blocked: int
+    elapsed: float
+    """Длительность рассылки в секундах"""
+
+    @property
+    def rate(self) -> float:
+        """Средняя скорость отправки, сообщений в секунду"""
+        return (self.sent + self.failed + self.blocked) / self.elapsed if self.elapsed > 0 else 0.0
+
+class TokenBucket:
+    """
+    Ведро токенов для ограничения частоты отправки
+
+    Ожидающие получают токены в порядке очереди, ведро можно приостановить по требованию Telegram
+    """
+
+    def __init__(self, rate: float, capacity: float | None = None) -> None:
+        self.rate     = rate
+        self.capacity = capacity or rate
+        self._tokens  = self.capacity
+        self._updated = monotonic()
+        self._paused_until = 0.0
+        self._lock = asyncio.Lock()
+
+    async def acquire(self) -> None:
+        """
+        Дождаться и забрать один токен
+        """
+        async with self._lock:
+            while True:
+                now = monotonic()
+                if now < self._paused_until:
+                    await asyncio.sleep(self._paused_until - now)
+                    continue
+
+                self._tokens  = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                await asyncio.sleep((1 - self._tokens) / self.rate)
+
+    def pause(self, seconds: float) -> None:
+        """
+        Приостановить выдачу токенов на заданное время
+        """
+        self._paused_until = max(self._paused_until, monotonic() + seconds)
+        self._tokens = 0
+
+class BBBroadcaster:
+    """
+    Отправка массовых рассылок с ограничением частоты
+
+    * Общий лимит сообщений в секунду во все чаты
+
+    * Лимит частоты сообщений в один чат, отдельный для приватных чатов и групп
+
+    * Ограничение числа одновременно отправляемых сообщений
+
+    * Ожидание и повтор при `RetryAfter` с приостановкой всех рассылок
+    """
+
+    _CHAT_READY_AT_MAX_SIZE = 10_000
+
+    def __init__(self, bot: Bot, config: Broadcast) -> None:
+        self.bot    = bot
+        self.config = config
+
+        self._global_bucket = TokenBucket(config.global_rate)
+        self._in_flight     = asyncio.Semaphore(config.max_in_flight)
+        self._chat_ready_at: dict[int, float] = {}
+
+    async def _wait_chat(self, chat_id: int) -> None:
+        """
+        Внутренняя функция ожидания очереди отправки в заданный чат
+        """
+        interval = self.config.group_chat_interval if chat_id < 0 else self.config.private_chat_interval
+        now = monotonic()
+
+        if len(self._chat_ready_at) > self._CHAT_READY_AT_MAX_SIZE:
+            self._chat_ready_at = {
+                ready_chat_id: ready_at
+                for ready_chat_id, ready_at in self._chat_ready_at.items()
+                if ready_at > now
+            }
+
+        ready_at = max(now, self._chat_ready_at.get(chat_id, 0.0))
+        self._chat_ready_at[chat_id] = ready_at + interval
+        if ready_at > now:
+            await asyncio.sleep(ready_at - now)
+
+    async def send(self, message: BroadcastMessage) -> DeliveryStatusEnum:
+        """
+        Отправить одно сообщение с соблюдением лимитов и повторами
+        """
+        await self._wait_chat(message.chat_id)
+
+        async with self._in_flight:
+            for attempt in range(self.config.max_retries + 1):
+                await self._global_bucket.acquire()
+                try:
+                    await self.bot.send_message(
+                        chat_id      = message.chat_id,
+                        text         = message.text,
+                        parse_mode   = message.parse_mode,
+                        reply_markup = message.reply_markup
+                    )
+                    return DeliveryStatusEnum.SENT
+                except RetryAfter as err:
+                    logger.warning(f"Got RetryAfter {err.retry_after} while broadcasting to {message.chat_id=}... pausing all broadcasts")
+                    self._global_bucket.pause(err.retry_after)
+                except Forbidden:
+                    logger.info(f"Could not broadcast to {message.chat_id=} because bot was blocked")
+                    return DeliveryStatusEnum.BLOCKED
+                except BadRequest as err:
+                    logger.warning(f"Could not broadcast to {message.chat_id=} because of bad request: {err}")
+                    return DeliveryStatusEnum.FAILED
+                except (TimedOut, NetworkError) as err:
+                    logger.warning(f"Got network error {err} while broadcasting to {message.chat_id=} on {attempt=}")
+                    await asyncio.sleep(2 ** attempt)
+                except TelegramError as err:
+                    logger.warning(f"Could not broadcast to {message.chat_id=}: {err}")
+                    return DeliveryStatusEnum.FAILED
+
+        logger.warning(f"Could not broadcast to {message.chat_id=} after {self.config.max_retries} retries")
+        return DeliveryStatusEnum.FAILED
+
+    async def broadcast(
+            self, name: str, messages: Iterable[BroadcastMessage],
+            on_result: Callable[[BroadcastMessage, DeliveryStatusEnum], Awaitable[None]] | None = None
+        ) -> BroadcastReport:
+        """
+        Разослать сообщения ограниченным числом исполнителей и вернуть итог со скоростью отправки
+
+        * name - название рассылки для логов
+        * on_result - функция, вызываемая с результатом отправки каждого сообщения
+        """
+        logger.info(f"Starting broadcast {name}")
+        messages_iter = iter(messages)
+        counts: Counter[DeliveryStatusEnum] = Counter()
+        started = monotonic()
+
+        async def worker() -> None:
+            for message in messages_iter:
+                status = await self.send(message)
+                counts[status] += 1
+                if on_result:
+                    await on_result(message, status)
+
+                processed = counts.total()
+                if processed % self.config.report_every == 0:
+                    elapsed = monotonic() - started
+                    logger.info(f"Broadcast {name} processed {processed} messages in {elapsed:.1f}s at {processed / elapsed:.1f} msg/s")
+
+        await asyncio.gather(*(worker() for _ in range(self.config.max_in_flight)))
+
+        report = BroadcastReport(
+            name    = name,
+            sent    = counts[DeliveryStatusEnum.SENT],
+            failed  = counts[DeliveryStatusEnum.FAILED],
+            blocked = counts[DeliveryStatusEnum.BLOCKED],
+            elapsed = monotonic() - started
+        )
+        logger.success((
+            f"Done broadcast {name}: {report.sent=} {report.failed=} {report.blocked=} "
+            f"in {report.elapsed:.1f}s at {report.rate:.1f} msg/s"
+        ))
+        return report
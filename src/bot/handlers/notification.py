@@ -1,4 +1,3 @@
-from telegram import Bot
 from telegram.ext import CallbackContext
 from telegram.constants import ParseMode
 
@@ -10,22 +9,29 @@ from datetime import datetime
 from bot.application import BBApplication
 
 from utils.db_model import (
-    User, Field,
-    UserFieldValue,
+    Field,
     Notification,
     ReplyableConditionMessage
 )
 from utils.custom_types import NotificationStatusEnum
 
 from bot.handlers.group import group_send_to_all_superadmin_tasked
-from bot.helpers.keyboards import get_awaliable_inline_keyboard_for_user, get_keyboard_of_user
+from bot.helpers.notification_deliveries import (
+    create_notification_deliveries,
+    get_notifications_ids_with_pending_deliveries,
+    perform_notification_deliveries
+)
 
 async def notify_job(context: CallbackContext) -> None:
     """
     Рассылка уведомлений
+
+    Выполняется только процессом, выбранным для выполнения периодических задач
     """
     app: BBApplication = context.application
-    bot: Bot = app.bot
+    if not app.provider.is_jobs_leader:
+        return
+
     settings = await app.provider.settings
 
     logger.info("Perfoming notify job")
@@ -100,50 +106,13 @@ async def notify_job(context: CallbackContext) -> None:
                 message = settings.notification_admin_groups_template.format(
                     text_markdown = reply_message.text_markdown
                 )
-                users_to_perform_notifications_selected = await session.execute(select(User))
             else:
                 message = settings.notification_admin_groups_condition_template.format(
                     condition = condition_bool_field.key,
                     text_markdown = reply_message.text_markdown
                 )
-                users_to_perform_notifications_selected = await session.execute(
-                    select(User)
-                    .where(
-                        (User.id == UserFieldValue.user_id) &
-                        (Field.id == condition_bool_field.id) &
-                        (Field.is_boolean == True) &
-                        (UserFieldValue.field_id == Field.id) &
-                        (UserFieldValue.value    == 'true')
-                    )
-                )
 
-            users_to_perform_notifications = users_to_perform_notifications_selected.scalars().all()
-            for user in users_to_perform_notifications:
-                if user.have_banned_bot:
-                    logger.info(f"Could not perform notification {planned_notification.id=} to user {user.id=} because user have banned bot")
-                    continue
-
-                logger.info(f"Performing notification {planned_notification.id=} and performing notification to user {user.id=}")
-                reply_markup = (
-                    await get_awaliable_inline_keyboard_for_user(reply_message, user, session)
-                ) or (
-                    await get_keyboard_of_user(session, user)
-                )
-
-                app.create_task(
-                    bot.send_message(
-                        chat_id = user.chat_id,
-                        text    = reply_message.text_markdown,
-                        parse_mode   = ParseMode.MARKDOWN,
-                        reply_markup = reply_markup
-                    ),
-                    update={
-                        'user_id': user.id,
-                        'chat_id': user.chat_id,
-                        'notification_id':  planned_notification.id,
-                        'reply_message_id': reply_message.id
-                    }
-                )
+            await create_notification_deliveries(session, planned_notification)
             
             await group_send_to_all_superadmin_tasked(
                 app=app, message=message,
@@ -153,4 +122,24 @@ async def notify_job(context: CallbackContext) -> None:
 
         await session.commit()
 
-    logger.info("Done notify job")
\ No newline at end of file
+        notifications_ids_to_deliver = await get_notifications_ids_with_pending_deliveries(session)
+
+    for notification_id in notifications_ids_to_deliver:
+        if notification_id in app.notifications_in_progress:
+            continue
+        logger.info(f"Starting deliveries of notification {notification_id=}")
+        app.notifications_in_progress[notification_id] = app.create_task(
+            _perform_notification_deliveries_task(app, notification_id),
+            update={'notification_id': notification_id}
+        )
+
+    logger.info("Done notify job")
+
+async def _perform_notification_deliveries_task(app: BBApplication, notification_id: int) -> None:
+    """
+    Внутренняя задача рассылки уведомления по журналу доставки
+    """
+    try:
+        await perform_notification_deliveries(app, notification_id)
+    finally:
+        app.notifications_in_progress.pop(notification_id, None)
@@ -3,32 +3,43 @@ from telegram.ext import ContextTypes
 from telegram.helpers import escape_markdown
 
 from sqlalchemy import select, update as sql_udate
+from sqlalchemy.ext.asyncio.session import AsyncSession
+
+from functools import partial
 
 from loguru import logger
 
 from utils.db_model import (
-    User, Field,
-    FieldBranch,
+    User,
+    Settings,
     ReplyableConditionMessage
 )
+from utils.custom_types import UserState
 
 from bot.application import BBApplication
 
 from bot.helpers.user import (
-    get_user_by_chat_id_or_none,
+    get_user_state_by_chat_id_or_none,
+    get_user_curr_field,
     parse_start_help_commands_and_answer,
     create_new_user_and_answer,
     update_user_over_next_question_answer_and_get_curr_field,
     answer_to_user_keyboard_key_hit,
     user_change_field_and_answer,
     upload_telegram_file_to_minio_and_return_filename,
-    get_field_question_by_branch,
-    insert_or_update_user_field_value
+    insert_or_update_user_field_value,
+    get_message_telegram_file_id
+)
+from bot.helpers.fields import (
+    get_field_by_id,
+    get_branch_by_id,
+    get_field_question_by_branch
 )
 from bot.helpers.keyboards import (
     construct_keyboard_reply,
     get_keyboard_of_user
 )
+from bot.helpers.outbox import Outbox
 
 from bot.callback_constants import (
     UserChangeFieldCallback,
@@ -42,71 +53,96 @@ async def user_start_help_handler(update: Update, context: ContextTypes.DEFAULT_
     Обработчик команд старта или помощи пользователя
     """
     app: BBApplication = context.application
+    outbox = Outbox()
+
+    async with app.provider.db_session() as session:
+        await _user_start_help(update, context, session, outbox)
+
+    await outbox.flush()
+
+async def _user_start_help(update: Update, context: ContextTypes.DEFAULT_TYPE, session: AsyncSession, outbox: Outbox) -> None:
+    """
+    Внутренняя функция работы с БД при командах старта или помощи пользователя
+    """
+    app: BBApplication = context.application
     chat_id  = update.effective_user.id
     username = update.effective_user.username
 
-    async with app.provider.db_session() as session:
-        user       = await get_user_by_chat_id_or_none(session, chat_id)
-        settings   = await app.provider.get_settings(session)
-        bot_status = await app.provider.get_bot_status(session)
+    user       = await get_user_state_by_chat_id_or_none(session, chat_id)
+    settings   = await app.provider.get_settings(session)
+    bot_status = await app.provider.get_bot_status(session)
 
-        if not user and bot_status.is_registration_open == False:
-            logger.warning(f"Got start/help command from new user {chat_id=} and {username=}, but registration is complete")
-            return await update.message.reply_markdown(settings.registration_is_over)
-        
-        if not user:
-            await create_new_user_and_answer(update, context, settings, session)
-            return await session.commit()
-        
-        return await parse_start_help_commands_and_answer(update, context, user, settings, session)
+    if not user and bot_status.is_registration_open == False:
+        logger.warning(f"Got start/help command from new user {chat_id=} and {username=}, but registration is complete")
+        return outbox.add(partial(update.message.reply_markdown, settings.registration_is_over))
+    
+    if not user:
+        await create_new_user_and_answer(update, context, settings, session, outbox)
+        return await session.commit()
+    
+    return await parse_start_help_commands_and_answer(update, context, user, settings, session, outbox)
 
 async def user_message_text_handler(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     """
     Обработчик текстовых сообщений пользователя
     """
     app: BBApplication = context.application
+    outbox = Outbox()
+
+    async with app.provider.db_session() as session:
+        await _user_message_text(update, context, session, outbox)
+
+    await outbox.flush()
+
+async def _user_message_text(update: Update, context: ContextTypes.DEFAULT_TYPE, session: AsyncSession, outbox: Outbox) -> None:
+    """
+    Внутренняя функция работы с БД при текстовом сообщении пользователя
+    """
+    app: BBApplication = context.application
     chat_id  = update.effective_user.id
     username = update.effective_user.username
     message_type = 'text'
 
-    async with app.provider.db_session() as session:
-        user     = await get_user_by_chat_id_or_none(session, chat_id)
-        settings = await app.provider.get_settings(session)
-
-        if not user:
-            logger.warning(f"Got {message_type} message from unknown user {chat_id=} and {username=}... strange error")
-            return await update.message.reply_markdown(settings.strange_user_error)
-        
-        if user.change_field_message_id:
-            user_change_err = await user_change_field_and_answer(update, context, user, settings, session, message_type)
-            if user_change_err:
-                return
-            return await session.commit()
-        
-        try:
-            field_value = update.message.text_markdown_urled
-        except Exception:
-            field_value = escape_markdown(update.message.text)
-
-        user_curr_field = await update_user_over_next_question_answer_and_get_curr_field(update, context, user, settings, session, message_type)
-        if user_curr_field:
-            await insert_or_update_user_field_value(
-                session    = session,
-                user_id    = user.id,
-                field_id   = user_curr_field.id,
-                value      = field_value,
-                message_id = update.message.id
-            )
-            return await session.commit()
+    user     = await get_user_state_by_chat_id_or_none(session, chat_id)
+    settings = await app.provider.get_settings(session)
 
-        if await answer_to_user_keyboard_key_hit(update, context, user, session):
+    if not user:
+        logger.warning(f"Got {message_type} message from unknown user {chat_id=} and {username=}... strange error")
+        return outbox.add(partial(update.message.reply_markdown, settings.strange_user_error))
+    
+    if user.change_field_message_id:
+        user_change_err = await user_change_field_and_answer(update, context, user, settings, session, outbox, message_type)
+        if user_change_err:
             return
+        return await session.commit()
+    
+    try:
+        field_value = update.message.text_markdown_urled
+    except Exception:
+        field_value = escape_markdown(update.message.text)
 
-        logger.warning(f"Got unknown text message from user {chat_id=} and {username=}")
+    user_curr_field = await update_user_over_next_question_answer_and_get_curr_field(update, context, user, settings, session, outbox, message_type)
+    if user_curr_field:
+        await insert_or_update_user_field_value(
+            session    = session,
+            user_id    = user.id,
+            field_id   = user_curr_field.id,
+            value      = field_value,
+            message_id = update.message.id
+        )
+        return await session.commit()
+
+    if await answer_to_user_keyboard_key_hit(update, context, user, session, outbox):
+        return await session.commit()
+
+    logger.warning(f"Got unknown text message from user {chat_id=} and {username=}")
 
 async def user_message_photo_document_handler(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     """
     Обработчик сообщений пользователя с фото или документом
+
+    Файл загружается в Minio между чтением состояния пользователя и транзакцией записи,
+    чтобы не держать соединение с БД на время загрузки
     """
     app: BBApplication = context.application
     chat_id  = update.effective_user.id
@@ -114,35 +150,55 @@ async def user_message_photo_document_handler(update: Update, context: ContextTy
     message_type = 'photo/document'
 
     async with app.provider.db_session() as session:
-        user     = await get_user_by_chat_id_or_none(session, chat_id)
+        user     = await get_user_state_by_chat_id_or_none(session, chat_id)
         settings = await app.provider.get_settings(session)
 
-        if not user:
-            logger.warning(f"Got {message_type} from unknown user {chat_id=} and {username=}... strange error")
-            return await update.message.reply_markdown(settings.strange_user_error)
-        
-        if user.change_field_message_id:
-            user_change_err = await user_change_field_and_answer(update, context, user, settings, session, message_type)
-            if user_change_err:
-                return
-            return await session.commit()
-        
-        user_curr_field = await update_user_over_next_question_answer_and_get_curr_field(update, context, user, settings, session, message_type)
-        if user_curr_field:
-            
-            full_filename = await upload_telegram_file_to_minio_and_return_filename(update, context, user, user_curr_field, settings, session)
-
-            await insert_or_update_user_field_value(
-                session    = session, 
-                user_id    = user.id,
-                field_id   = user_curr_field.id,
-                value      = full_filename,
-                message_id = update.message.id
-            )
-            
-            return await session.commit()
+    if not user:
+        logger.warning(f"Got {message_type} from unknown user {chat_id=} and {username=}... strange error")
+        return await update.message.reply_markdown(settings.strange_user_error)
+
+    curr_field = await get_user_curr_field(app, user)
+    full_filename = None
+    if curr_field and (curr_field.document_bucket or curr_field.image_bucket):
+        full_filename = await upload_telegram_file_to_minio_and_return_filename(update, context, curr_field)
+
+    outbox = Outbox()
+
+    async with app.provider.db_session() as session:
+        await _user_message_photo_document(update, context, user, settings, session, outbox, full_filename)
+
+    await outbox.flush()
+
+async def _user_message_photo_document(update: Update, context: ContextTypes.DEFAULT_TYPE,
+                                       user: UserState, settings: Settings, session: AsyncSession,
+                                       outbox: Outbox, full_filename: str|None) -> None:
+    """
+    Внутренняя функция работы с БД при сообщении пользователя с уже загруженным фото или документом
+    """
+    chat_id  = update.effective_user.id
+    username = update.effective_user.username
+    message_type = 'photo/document'
+
+    if user.change_field_message_id:
+        user_change_err = await user_change_field_and_answer(update, context, user, settings, session, outbox, message_type, full_filename)
+        if user_change_err:
+            return
+        return await session.commit()
+    
+    user_curr_field = await update_user_over_next_question_answer_and_get_curr_field(update, context, user, settings, session, outbox, message_type)
+    if user_curr_field:
+        await insert_or_update_user_field_value(
+            session    = session, 
+            user_id    = user.id,
+            field_id   = user_curr_field.id,
+            value      = full_filename,
+            message_id = update.message.id,
+            telegram_file_id = get_message_telegram_file_id(update.message)
+        )
         
-        logger.warning(f"Got unknown message from user {chat_id=} and {username=}")
+        return await session.commit()
+    
+    logger.warning(f"Got unknown message from user {chat_id=} and {username=}")
 
 async def user_change_state_callback(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     """
@@ -159,25 +215,16 @@ async def user_change_state_callback(update: Update, context: ContextTypes.DEFAU
     logger.info(f"Got change field callback from user {chat_id=} {username=} for field {changing_field_id=}")
 
     async with app.provider.db_session() as session:
-        user = await get_user_by_chat_id_or_none(session, chat_id)
+        user = await get_user_state_by_chat_id_or_none(session, chat_id)
 
         if not user:
             return logger.warning(f"Got change field callback from unknown user {chat_id=} {username=} for field {changing_field_id=}")
 
-        changing_field_selected = await session.execute(
-            select(Field)
-            .where(Field.id == changing_field_id)
-        )
-        changing_field = changing_field_selected.scalar_one_or_none()
+        changing_field = await get_field_by_id(app, changing_field_id)
 
         if not changing_field:
             return logger.warning(f"Got change field callback from user {chat_id=} {username=} for unknown field {changing_field_id=}")
         
-        await update.effective_message.reply_markdown(
-            text = changing_field.question_markdown,
-            reply_markup = construct_keyboard_reply(changing_field, app, deferable_key=False)
-        )
-
         await session.execute(
             sql_udate(User)
             .where(User.id == user.id)
@@ -189,6 +236,11 @@ async def user_change_state_callback(update: Update, context: ContextTypes.DEFAU
 
         await session.commit()
 
+    await update.effective_message.reply_markdown(
+        text = changing_field.question_markdown,
+        reply_markup = construct_keyboard_reply(changing_field, app, deferable_key=False)
+    )
+
 async def branch_start_callback_handler(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     """Обработка обратного вызова начала ветки вопроса"""
     app: BBApplication = context.application
@@ -206,30 +258,21 @@ async def branch_start_callback_handler(update: Update, context: ContextTypes.DE
     logger.info(f"Got change field callback from user {chat_id=} {username=} by reply {reply_message_id=} for branch {branch_id=}")
 
     async with app.provider.db_session() as session:
-        user = await get_user_by_chat_id_or_none(session, chat_id)
+        user = await get_user_state_by_chat_id_or_none(session, chat_id)
 
         if not user:
             return logger.warning(f"Got change field callback from unknown user {chat_id=} {username=} by reply {reply_message_id=} for branch {branch_id=}")
 
-        branch_selected = await session.execute(
-            select(FieldBranch)
-            .where(FieldBranch.id == branch_id)
-        )
-        branch = branch_selected.scalar_one_or_none()
+        branch = await get_branch_by_id(app, branch_id)
 
         if not branch:
             return logger.warning(f"Got change field callback from user {chat_id=} {username=} by reply {reply_message_id=} for unknown branch {branch_id=}")
     
-        field = await get_field_question_by_branch(session, branch.key)
+        field = await get_field_question_by_branch(app, branch.key)
 
         if not field:
             return logger.warning(f"Got change field callback from user {chat_id=} {username=} by reply {reply_message_id=} with unknown first field {branch_id=}")
         
-        await update.effective_message.reply_markdown(
-            text = field.question_markdown,
-            reply_markup = construct_keyboard_reply(field, app)
-        )
-
         await session.execute(
             sql_udate(User)
             .where(User.id == user.id)
@@ -241,6 +284,11 @@ async def branch_start_callback_handler(update: Update, context: ContextTypes.DE
 
         await session.commit()
 
+    await update.effective_message.reply_markdown(
+        text = field.question_markdown,
+        reply_markup = construct_keyboard_reply(field, app)
+    )
+
 async def full_text_callback_handler(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     """Обработка обратного вызова начала ветки вопроса"""
     app: BBApplication = context.application
@@ -258,25 +306,16 @@ async def full_text_callback_handler(update: Update, context: ContextTypes.DEFAU
     logger.info(f"Got change field callback from user {chat_id=} {username=} by reply {reply_message_id=} for field {field_id=}")
 
     async with app.provider.db_session() as session:
-        user = await get_user_by_chat_id_or_none(session, chat_id)
+        user = await get_user_state_by_chat_id_or_none(session, chat_id)
 
         if not user:
             return logger.warning(f"Got change field callback from unknown user {chat_id=} {username=} by reply {reply_message_id=} for field {field_id=}")
 
-        field_selected = await session.execute(
-            select(Field)
-            .where(Field.id == field_id)
-        )
-        field = field_selected.scalar_one_or_none()
+        field = await get_field_by_id(app, field_id)
 
         if not field:
             return logger.warning(f"Got change field callback from user {chat_id=} {username=} by reply {reply_message_id=} for unknown field {field_id=}")
     
-        await update.effective_message.reply_markdown(
-            text = field.question_markdown,
-            reply_markup = construct_keyboard_reply(field, app)
-        )
-
         await session.execute(
             sql_udate(User)
             .where(User.id == user.id)
@@ -288,6 +327,11 @@ async def full_text_callback_handler(update: Update, context: ContextTypes.DEFAU
 
         await session.commit()
 
+    await update.effective_message.reply_markdown(
+        text = field.question_markdown,
+        reply_markup = construct_keyboard_reply(field, app)
+    )
+
 async def fast_answer_callback_handler(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     """Обработка обратного вызова начала ветки вопроса"""
     app: BBApplication = context.application
@@ -305,7 +349,7 @@ async def fast_answer_callback_handler(update: Update, context: ContextTypes.DEF
     logger.info(f"Got change field callback from user {chat_id=} {username=} by reply {reply_message_id=} for field {field_id=} with idx {answer_idx=}")
 
     async with app.provider.db_session() as session:
-        user = await get_user_by_chat_id_or_none(session, chat_id)
+        user = await get_user_state_by_chat_id_or_none(session, chat_id)
 
         if not user:
             return logger.warning(f"Got change field callback from unknown user {chat_id=} {username=} by reply {reply_message_id=} for field {field_id=} with idx {answer_idx=}")
@@ -319,10 +363,8 @@ async def fast_answer_callback_handler(update: Update, context: ContextTypes.DEF
         if not reply_message:
             return logger.warning(f"Got change field callback from user {chat_id=} {username=} by unknown reply {reply_message_id=} for field {field_id=} with idx {answer_idx=}")
     
-        await update.effective_message.reply_markdown(
-            text = reply_message.reply_status_replies.split('\n')[answer_idx],
-            reply_markup = await get_keyboard_of_user(session, user)
-        )
+        reply_text   = reply_message.reply_status_replies.split('\n')[answer_idx]
+        reply_markup = await get_keyboard_of_user(app, session, user)
 
         await insert_or_update_user_field_value(
             session    = session, 
@@ -333,3 +375,8 @@ async def fast_answer_callback_handler(update: Update, context: ContextTypes.DEF
         )
 
         await session.commit()
+
+    await update.effective_message.reply_markdown(
+        text = reply_text,
+        reply_markup = reply_markup
+    )
@@ -1,6 +1,13 @@
+from types import MappingProxyType
+from typing import Mapping, NamedTuple
+
+from telegram import ReplyKeyboardMarkup, ReplyKeyboardRemove
+
 from sqlalchemy import select
 from sqlalchemy.ext.asyncio.session import AsyncSession
 
+from loguru import logger
+
 from utils.db_model import (
     User,
     FieldBranch,
@@ -8,50 +15,153 @@ from utils.db_model import (
     UserFieldValue
 )
 from utils.custom_types import FieldStatusEnum
+from utils.config_model import I18n
 
-async def get_field_question_by_branch(session: AsyncSession, field_branch_key: str) -> Field|None:
+from bot.application import BBApplication
+from bot.helpers.keyboards import build_keyboard_reply
+
+class FieldsGraph(NamedTuple):
     """
-    Получить первое пользовательское поле, который нужно задать пользователю при регистрации
+    Скомпилированный граф вопросов: ветки -> поля -> заранее построенные клавиатуры
+
+    Объекты полей и веток отсоединены от сессий и используются только для чтения
     """
-    selected = await session.execute(
-        select(Field)
-        .where(
-            (FieldBranch.key == field_branch_key) &
-            (Field.branch_id == FieldBranch.id)
-        )
-        .order_by(Field.order_place.asc())
-        .limit(1)
-    )
-    return selected.scalar_one_or_none()
+    version:  tuple[int, ...] | None
+    branches: Mapping[int, FieldBranch]
+    fields:   Mapping[int, Field]
 
-async def get_next_field_question(session: AsyncSession, curr_field: Field) -> Field|None:
+    branch_fields:             Mapping[int, tuple[Field, ...]]
+    first_field_by_branch_id:  Mapping[int, Field]
+    first_field_by_branch_key: Mapping[str, Field]
+    next_field_by_field_id:    Mapping[int, Field|None]
+
+    keyboards: Mapping[tuple[int, bool], ReplyKeyboardMarkup | ReplyKeyboardRemove]
+    """Клавиатуры ответов по ИД поля и признаку показа клавиши откладывания"""
+
+def _compile_fields_graph(
+        version: tuple[int, ...] | None, i18n: I18n,
+        branches_list: list[FieldBranch], fields_list: list[Field]
+    ) -> FieldsGraph:
     """
-    Получить следующий вопрос в той же ветке
+    Внутренняя функция построения графа вопросов по всем веткам и полям
     """
-    next_field_selected = await session.execute(
-        select(Field)
-        .where(
-            (Field.branch_id == curr_field.branch_id) &
-            (Field.order_place > curr_field.order_place) &
-            (Field.status != FieldStatusEnum.INACTIVE)
-        )
-        .order_by(Field.order_place.asc())
-        .limit(1)
-    )
-    next_field = next_field_selected.scalar_one_or_none()
-    if next_field:
-        return next_field
-    
-    curr_branch: FieldBranch = curr_field.branch
-    next_branch_selected = await session.execute(
-        select(FieldBranch)
-        .where(FieldBranch.id == curr_branch.next_branch_id)
+    branches = {branch.id: branch for branch in branches_list}
+    fields   = {field.id: field for field in fields_list}
+
+    branch_fields: dict[int, list[Field]] = {branch_id: [] for branch_id in branches}
+    for field in fields_list:
+        branch_fields.setdefault(field.branch_id, []).append(field)
+
+    first_field_by_branch_id = {
+        branch_id: branch_fields_list[0]
+        for branch_id, branch_fields_list in branch_fields.items()
+        if branch_fields_list
+    }
+    first_field_by_branch_key = {
+        branch.key: first_field_by_branch_id[branch.id]
+        for branch in branches_list
+        if branch.id in first_field_by_branch_id
+    }
+
+    next_field_by_field_id: dict[int, Field|None] = {}
+    for branch_id, branch_fields_list in branch_fields.items():
+        branch = branches.get(branch_id)
+        next_branch_first_field = first_field_by_branch_id.get(branch.next_branch_id) if branch else None
+        for field in branch_fields_list:
+            next_field_by_field_id[field.id] = next(
+                (
+                    next_field for next_field in branch_fields_list
+                    if next_field.order_place > field.order_place and next_field.status != FieldStatusEnum.INACTIVE
+                ),
+                next_branch_first_field
+            )
+
+    keyboards = {
+        (field.id, deferable_key): build_keyboard_reply(field, i18n, deferable_key)
+        for field in fields_list
+        for deferable_key in (True, False)
+    }
+
+    return FieldsGraph(
+        version  = version,
+        branches = MappingProxyType(branches),
+        fields   = MappingProxyType(fields),
+        branch_fields = MappingProxyType({
+            branch_id: tuple(branch_fields_list) for branch_id, branch_fields_list in branch_fields.items()
+        }),
+        first_field_by_branch_id  = MappingProxyType(first_field_by_branch_id),
+        first_field_by_branch_key = MappingProxyType(first_field_by_branch_key),
+        next_field_by_field_id    = MappingProxyType(next_field_by_field_id),
+        keyboards = MappingProxyType(keyboards)
     )
-    next_branch = next_branch_selected.scalar_one_or_none()
-    if not next_branch:
-        return None
-    
-    return await get_field_question_by_branch(session, next_branch.key)
+
+async def get_fields_graph(app: BBApplication) -> FieldsGraph:
+    """
+    Получить актуальный граф вопросов, перестраивая его после изменения полей или веток
+
+    Граф строится в отдельной сессии, чтобы фиксация сессий обработчиков не сбрасывала загруженные объекты
+    """
+    version = app.provider.tables_version(Field, FieldBranch)
+    if version is not None and app.fields_graph and app.fields_graph.version == version:
+        return app.fields_graph
+
+    async with app.fields_graph_lock:
+        version = app.provider.tables_version(Field, FieldBranch)
+        if version is not None and app.fields_graph and app.fields_graph.version == version:
+            return app.fields_graph
+
+        async with app.provider.db_session() as session:
+            branches_selected = await session.execute(
+                select(FieldBranch)
+            )
+            fields_selected = await session.execute(
+                select(Field)
+                .order_by(Field.branch_id.asc(), Field.order_place.asc(), Field.id.asc())
+            )
+            fields_graph = _compile_fields_graph(
+                version, app.provider.config.i18n,
+                list(branches_selected.scalars()), list(fields_selected.scalars())
+            )
+
+        if version is not None:
+            logger.info(f"Compiled fields graph with {len(fields_graph.fields)} fields of {len(fields_graph.branches)} branches")
+            app.fields_graph = fields_graph
+        return fields_graph
+
+async def get_field_by_id(app: BBApplication, field_id: int) -> Field|None:
+    """
+    Получить поле по ИД
+    """
+    fields_graph = await get_fields_graph(app)
+    return fields_graph.fields.get(field_id)
+
+async def get_branch_by_id(app: BBApplication, branch_id: int) -> FieldBranch|None:
+    """
+    Получить ветку вопросов по ИД
+    """
+    fields_graph = await get_fields_graph(app)
+    return fields_graph.branches.get(branch_id)
+
+async def get_branch_fields(app: BBApplication, branch_id: int) -> tuple[Field, ...]:
+    """
+    Получить все поля ветки в порядке их задания
+    """
+    fields_graph = await get_fields_graph(app)
+    return fields_graph.branch_fields.get(branch_id, ())
+
+async def get_field_question_by_branch(app: BBApplication, field_branch_key: str) -> Field|None:
+    """
+    Получить первое пользовательское поле, который нужно задать пользователю при регистрации
+    """
+    fields_graph = await get_fields_graph(app)
+    return fields_graph.first_field_by_branch_key.get(field_branch_key)
+
+async def get_next_field_question(app: BBApplication, curr_field: Field) -> Field|None:
+    """
+    Получить следующий вопрос в той же ветке или первый вопрос следующей ветки
+    """
+    fields_graph = await get_fields_graph(app)
+    return fields_graph.next_field_by_field_id.get(curr_field.id)
 
 async def get_user_field_value_by_key(session: AsyncSession, user: User, key: str) -> str|None:
     """
@@ -66,4 +176,4 @@ async def get_user_field_value_by_key(session: AsyncSession, user: User, key: st
         )
         .limit(1)
     )
-    return selected.scalar_one_or_none()
\ No newline at end of file
+    return selected.scalar_one_or_none()
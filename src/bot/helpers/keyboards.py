@@ -1,3 +1,6 @@
+from types import MappingProxyType
+from typing import Mapping, NamedTuple
+
 from telegram import (
     ReplyKeyboardMarkup,
     ReplyKeyboardRemove,
@@ -7,16 +10,19 @@ from telegram import (
 from sqlalchemy import select
 from sqlalchemy.ext.asyncio.session import AsyncSession
 
+from loguru import logger
+
 from utils.db_model import (
-    User, KeyboardKey,
+    KeyboardKey,
     Field, FieldBranch,
+    UserFieldValue,
     ReplyableConditionMessage
 )
-from utils.custom_types import KeyboardKeyStatusEnum, ReplyTypeEnum
+from utils.custom_types import KeyboardKeyStatusEnum, ReplyTypeEnum, UserState
+from utils.config_model import I18n
 
 from bot.application import BBApplication
 from bot.helpers.replyable_condition_messages import (
-    select_awaliable_replyable_condition_messages_by_condition_bool_field_id,
     check_if_reply_condition_message_is_awaliable_by_reply_condition_bool_field_id
 )
 from bot.callback_constants import (
@@ -25,52 +31,62 @@ from bot.callback_constants import (
     UserFastAnswerReplyCallback
 )
 
-def construct_keyboard_reply(field: Field, app: BBApplication, deferable_key: bool = True) -> ReplyKeyboardMarkup | ReplyKeyboardRemove:
+class KeyboardSignature(NamedTuple):
     """
-    Получить клавиатуру по строке вариантов ответов
+    Сигнатура пользователя, от которой зависит его клавиатура
+    """
+    true_condition_field_ids: frozenset[int]
+    show_deferred:            bool
+
+class KeyboardKeysIndex(NamedTuple):
+    """
+    Индекс кнопок клавиатуры по тексту клавиши с загруженными сообщениями с условиями и ответами
+
+    Объекты кнопок отсоединены от сессий и используются только для чтения
+    """
+    version:      tuple[int, ...] | None
+    keys:         tuple[KeyboardKey, ...]
+    keys_by_text: Mapping[str, KeyboardKey]
+
+    condition_field_ids: frozenset[int]
+    """ИД булевых полей, используемых как условия показа обычных кнопок"""
+    keyboards: dict[KeyboardSignature, ReplyKeyboardMarkup | ReplyKeyboardRemove]
+    """Построенные клавиатуры по сигнатурам условий, заполняются по мере обращения"""
+
+def build_keyboard_reply(field: Field, i18n: I18n, deferable_key: bool = True) -> ReplyKeyboardMarkup | ReplyKeyboardRemove:
+    """
+    Построить клавиатуру по строке вариантов ответов
     """
     branch: FieldBranch = field.branch
     if field.answer_options in [None, ''] and not branch.is_deferrable:
         return ReplyKeyboardRemove()
     if field.answer_options in [None, ''] and branch.is_deferrable:
         return ReplyKeyboardMarkup([
-            [app.provider.config.i18n.defer] if branch.is_deferrable and deferable_key else []
+            [i18n.defer] if branch.is_deferrable and deferable_key else []
         ])
     return ReplyKeyboardMarkup([
         [key] for key in field.answer_options.split('\n')
     ] + [
-        [app.provider.config.i18n.defer] if branch.is_deferrable and deferable_key else []
+        [i18n.defer] if branch.is_deferrable and deferable_key else []
     ])
 
-async def get_keyboard_of_user(
-        session: AsyncSession, user: User,
-        always_add_defered_keys: bool = False
-    ) -> ReplyKeyboardMarkup | ReplyKeyboardRemove:
+def construct_keyboard_reply(field: Field, app: BBApplication, deferable_key: bool = True) -> ReplyKeyboardMarkup | ReplyKeyboardRemove:
     """
-    Получить клавиатуру, доступную пользователю
+    Получить клавиатуру по строке вариантов ответов
+
+    Используется заранее построенная клавиатура из актуального графа вопросов, если он есть
+    """
+    fields_graph = app.fields_graph
+    if fields_graph and fields_graph.version is not None and fields_graph.version == app.provider.tables_version(Field, FieldBranch):
+        keyboard = fields_graph.keyboards.get((field.id, deferable_key))
+        if keyboard is not None:
+            return keyboard
+    return build_keyboard_reply(field, app.provider.config.i18n, deferable_key)
+
+def _layout_keyboard(keyboard_keys: list[KeyboardKey]) -> ReplyKeyboardMarkup | ReplyKeyboardRemove:
+    """
+    Внутренняя функция раскладки кнопок клавиатуры: по две в строке если кнопок больше двух
     """
-    awaliable_rcm = select_awaliable_replyable_condition_messages_by_condition_bool_field_id(user)
-    selected = await session.execute(
-        select(KeyboardKey)
-        .where(
-            (
-                (KeyboardKey.status == KeyboardKeyStatusEnum.NORMAL) &
-                (KeyboardKey.reply_condition_message_id.in_(awaliable_rcm))
-            ) |
-            (
-                (KeyboardKey.status == KeyboardKeyStatusEnum.ME) &
-                (KeyboardKey.branch_id != None)
-            ) |
-            (
-                (KeyboardKey.status == KeyboardKeyStatusEnum.DEFERRED) &
-                (KeyboardKey.branch_id == None) &
-                (KeyboardKey.reply_condition_message_id == None) &
-                (user.deferred_field_id is not None or always_add_defered_keys)
-            )
-        )
-        .order_by(KeyboardKey.id.asc())
-    )
-    keyboard_keys     = list(selected.scalars())
     keyboard_keys_len = len(keyboard_keys)
     if keyboard_keys_len == 0:
         return ReplyKeyboardRemove()
@@ -84,28 +100,136 @@ async def get_keyboard_of_user(
             ]
     )
 
-async def get_keyboard_key_by_key_text(session: AsyncSession, key: str) -> KeyboardKey | None:
+def _build_keyboard_of_signature(keyboard_keys_index: KeyboardKeysIndex, signature: KeyboardSignature) -> ReplyKeyboardMarkup | ReplyKeyboardRemove:
     """
-    Получить полный объект кнопки клавиатуры по названию клавиши
+    Внутренняя функция построения клавиатуры по сигнатуре условий пользователя
+    """
+    return _layout_keyboard([
+        key for key in keyboard_keys_index.keys
+        if (
+            key.status == KeyboardKeyStatusEnum.NORMAL and
+            key.reply_condition_message is not None and
+            (
+                key.reply_condition_message.condition_bool_field_id is None or
+                key.reply_condition_message.condition_bool_field_id in signature.true_condition_field_ids
+            )
+        ) or (
+            key.status == KeyboardKeyStatusEnum.ME and
+            key.branch_id is not None
+        ) or (
+            key.status == KeyboardKeyStatusEnum.DEFERRED and
+            key.branch_id is None and
+            key.reply_condition_message_id is None and
+            signature.show_deferred
+        )
+    ])
+
+def get_keyboard_signature(
+        keyboard_keys_index: KeyboardKeysIndex,
+        true_field_ids: set[int] | frozenset[int],
+        has_deferred_field: bool
+    ) -> KeyboardSignature:
     """
-    selected = await session.execute(
-        select(KeyboardKey)
-        .where(KeyboardKey.key == key)
+    Получить сигнатуру клавиатуры: заполненные значением `true` булевы поля условий и наличие отложенного вопроса
+    """
+    return KeyboardSignature(
+        true_condition_field_ids = frozenset(true_field_ids) & keyboard_keys_index.condition_field_ids,
+        show_deferred            = has_deferred_field
     )
-    return selected.scalar_one_or_none()
 
-async def get_awaliable_inline_keyboard_for_user(
-    reply_condition_message: ReplyableConditionMessage,
-    user: User,
-    session: AsyncSession
-    ) -> InlineKeyboardMarkup|None:
-    """Получить Inline клавиатуру с вариантами ответов для сообщения"""
-    
-    if not await check_if_reply_condition_message_is_awaliable_by_reply_condition_bool_field_id(
-        reply_condition_message, user, session
-    ):
-        return None
-    
+def get_keyboard_of_signature(keyboard_keys_index: KeyboardKeysIndex, signature: KeyboardSignature) -> ReplyKeyboardMarkup | ReplyKeyboardRemove:
+    """
+    Получить клавиатуру по сигнатуре условий, клавиатуры строятся один раз на каждую сигнатуру
+    """
+    keyboard = keyboard_keys_index.keyboards.get(signature)
+    if keyboard is None:
+        keyboard = _build_keyboard_of_signature(keyboard_keys_index, signature)
+        keyboard_keys_index.keyboards[signature] = keyboard
+    return keyboard
+
+async def get_keyboard_of_user(
+        app: BBApplication, session: AsyncSession, user: UserState,
+        always_add_defered_keys: bool = False
+    ) -> ReplyKeyboardMarkup | ReplyKeyboardRemove:
+    """
+    Получить клавиатуру, доступную пользователю
+
+    Загружаются только значения полей, от которых зависят кнопки, и только если такие поля есть
+    """
+    keyboard_keys_index = await get_keyboard_keys_index(app)
+
+    true_field_ids: set[int] = set()
+    if keyboard_keys_index.condition_field_ids:
+        selected = await session.execute(
+            select(UserFieldValue.field_id)
+            .where(
+                (UserFieldValue.user_id == user.id) &
+                (UserFieldValue.value   == 'true') &
+                (UserFieldValue.field_id.in_(keyboard_keys_index.condition_field_ids))
+            )
+        )
+        true_field_ids = set(selected.scalars())
+
+    signature = get_keyboard_signature(
+        keyboard_keys_index,
+        true_field_ids     = true_field_ids,
+        has_deferred_field = user.deferred_field_id is not None or always_add_defered_keys
+    )
+    return get_keyboard_of_signature(keyboard_keys_index, signature)
+
+async def get_keyboard_keys_index(app: BBApplication) -> KeyboardKeysIndex:
+    """
+    Получить актуальный индекс кнопок клавиатуры, перестраивая его после изменения кнопок или сообщений
+
+    Индекс строится в отдельной сессии, чтобы фиксация сессий обработчиков не сбрасывала загруженные объекты
+    """
+    version = app.provider.tables_version(KeyboardKey, ReplyableConditionMessage, Field)
+    if version is not None and app.keyboard_keys_index and app.keyboard_keys_index.version == version:
+        return app.keyboard_keys_index
+
+    async with app.keyboard_keys_index_lock:
+        version = app.provider.tables_version(KeyboardKey, ReplyableConditionMessage, Field)
+        if version is not None and app.keyboard_keys_index and app.keyboard_keys_index.version == version:
+            return app.keyboard_keys_index
+
+        async with app.provider.db_session() as session:
+            selected = await session.execute(
+                select(KeyboardKey)
+                .order_by(KeyboardKey.id.asc())
+            )
+            keys = tuple(selected.scalars())
+
+        keyboard_keys_index = KeyboardKeysIndex(
+            version      = version,
+            keys         = keys,
+            keys_by_text = MappingProxyType({key.key: key for key in keys}),
+            condition_field_ids = frozenset(
+                key.reply_condition_message.condition_bool_field_id
+                for key in keys
+                if key.status == KeyboardKeyStatusEnum.NORMAL
+                and key.reply_condition_message is not None
+                and key.reply_condition_message.condition_bool_field is not None
+                and key.reply_condition_message.condition_bool_field.is_boolean
+            ),
+            keyboards = {}
+        )
+
+        if version is not None:
+            logger.info(f"Indexed {len(keys)} keyboard keys")
+            app.keyboard_keys_index = keyboard_keys_index
+        return keyboard_keys_index
+
+async def get_keyboard_key_by_key_text(app: BBApplication, key: str) -> KeyboardKey | None:
+    """
+    Получить полный объект кнопки клавиатуры по названию клавиши
+    """
+    keyboard_keys_index = await get_keyboard_keys_index(app)
+    return keyboard_keys_index.keys_by_text.get(key)
+
+def build_inline_keyboard(reply_condition_message: ReplyableConditionMessage) -> InlineKeyboardMarkup|None:
+    """
+    Построить Inline клавиатуру с вариантами ответов для сообщения без проверки условий
+    """
     if reply_condition_message.reply_type == ReplyTypeEnum.BRANCH_START:
         return InlineKeyboardMarkup([[
             InlineKeyboardButton(
@@ -143,4 +267,18 @@ async def get_awaliable_inline_keyboard_for_user(
             for answer_idx,answer in enumerate(reply_condition_message.reply_keyboard_keys.split('\n'))
         ])
 
-    return None
\ No newline at end of file
+    return None
+
+async def get_awaliable_inline_keyboard_for_user(
+    reply_condition_message: ReplyableConditionMessage,
+    user: UserState,
+    session: AsyncSession
+    ) -> InlineKeyboardMarkup|None:
+    """Получить Inline клавиатуру с вариантами ответов для сообщения"""
+    
+    if not await check_if_reply_condition_message_is_awaliable_by_reply_condition_bool_field_id(
+        reply_condition_message, user, session
+    ):
+        return None
+    
+    return build_inline_keyboard(reply_condition_message)
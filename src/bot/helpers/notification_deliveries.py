@@ -0,0 +1,214 @@
+import asyncio
+
+from telegram.constants import ParseMode
+
+from sqlalchemy import select, update, distinct, literal
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.ext.asyncio.session import AsyncSession
+
+from datetime import datetime
+from loguru import logger
+
+from utils.db_model import (
+    User, Field,
+    UserFieldValue,
+    Notification,
+    NotificationDelivery,
+    ReplyableConditionMessage
+)
+from utils.custom_types import DeliveryStatusEnum
+
+from bot.application import BBApplication
+from bot.broadcaster import BroadcastMessage, BroadcastReport
+from bot.helpers.keyboards import (
+    build_inline_keyboard,
+    get_keyboard_keys_index,
+    get_keyboard_signature,
+    get_keyboard_of_signature
+)
+
+async def create_notification_deliveries(session: AsyncSession, notification: Notification) -> None:
+    """
+    Записать в журнал доставки всех получателей уведомления одним запросом
+
+    Повторный вызов не создаёт дублей получателей
+    """
+    reply_message: ReplyableConditionMessage = notification.reply_condition_message
+    condition_bool_field: Field = reply_message.condition_bool_field
+
+    recipients = select(User.id, User.chat_id).where(User.have_banned_bot == False)
+    if condition_bool_field:
+        recipients = recipients.where(
+            (User.id == UserFieldValue.user_id) &
+            (Field.id == condition_bool_field.id) &
+            (Field.is_boolean == True) &
+            (UserFieldValue.field_id == Field.id) &
+            (UserFieldValue.value    == 'true')
+        )
+
+    recipients_subquery = recipients.distinct().subquery()
+    await session.execute(
+        insert(NotificationDelivery)
+        .from_select(
+            ['notification_id', 'user_id', 'chat_id', 'status'],
+            select(
+                literal(notification.id),
+                recipients_subquery.c.id,
+                recipients_subquery.c.chat_id,
+                literal(DeliveryStatusEnum.PENDING, type_=NotificationDelivery.__table__.c.status.type)
+            )
+        )
+        .on_conflict_do_nothing()
+    )
+
+async def get_notifications_ids_with_pending_deliveries(session: AsyncSession) -> list[int]:
+    """
+    Получить ИД уведомлений, доставка которых не завершена
+    """
+    selected = await session.execute(
+        select(distinct(NotificationDelivery.notification_id))
+        .where(NotificationDelivery.status == DeliveryStatusEnum.PENDING)
+    )
+    return list(selected.scalars())
+
+async def _save_deliveries_statuses(app: BBApplication, statuses: dict[int, DeliveryStatusEnum]) -> None:
+    """
+    Внутренняя функция сохранения статусов доставки - один запрос на каждый статус
+    """
+    if not statuses:
+        return
+
+    by_status: dict[DeliveryStatusEnum, list[int]] = {}
+    for delivery_id, status in statuses.items():
+        by_status.setdefault(status, []).append(delivery_id)
+
+    async with app.provider.db_session() as session:
+        for status, deliveries_ids in by_status.items():
+            await session.execute(
+                update(NotificationDelivery)
+                .where(NotificationDelivery.id.in_(deliveries_ids))
+                .values(status = status, timestamp = datetime.now())
+            )
+        await session.commit()
+
+async def _get_true_fields_ids_by_user_id(
+        session: AsyncSession, notification_id: int, fields_ids: set[int]
+    ) -> dict[int, set[int]]:
+    """
+    Внутренняя функция получения заполненных значением `true` булевых полей всех ожидающих получателей одним запросом
+    """
+    if not fields_ids:
+        return {}
+
+    selected = await session.execute(
+        select(UserFieldValue.user_id, UserFieldValue.field_id)
+        .where(
+            (Field.id == UserFieldValue.field_id) &
+            (Field.is_boolean == True) &
+            (UserFieldValue.value == 'true') &
+            (UserFieldValue.field_id.in_(fields_ids)) &
+            (UserFieldValue.user_id.in_(
+                select(NotificationDelivery.user_id)
+                .where(
+                    (NotificationDelivery.notification_id == notification_id) &
+                    (NotificationDelivery.status == DeliveryStatusEnum.PENDING)
+                )
+            ))
+        )
+    )
+
+    true_fields_ids_by_user_id: dict[int, set[int]] = {}
+    for user_id, field_id in selected.tuples():
+        true_fields_ids_by_user_id.setdefault(user_id, set()).add(field_id)
+    return true_fields_ids_by_user_id
+
+async def perform_notification_deliveries(app: BBApplication, notification_id: int) -> BroadcastReport|None:
+    """
+    Разослать уведомление всем получателям из журнала, которым оно ещё не доставлено
+
+    Условия клавиатур всех получателей вычисляются одним запросом, каждая различная клавиатура строится один раз.
+    Статусы сохраняются пачками, поэтому после перезапуска повторно отправляется не больше одной пачки.
+    При отмене рассылки, например при потере права выполнять периодические задачи, сохраняются статусы всех
+    уже отправленных сообщений, чтобы новый выполняющий процесс не отправил их повторно
+    """
+    keyboard_keys_index = await get_keyboard_keys_index(app)
+
+    async with app.provider.db_session() as session:
+        notification_selected = await session.execute(
+            select(Notification)
+            .where(Notification.id == notification_id)
+        )
+        notification: Notification|None = notification_selected.scalar_one_or_none()
+        if not notification:
+            logger.warning(f"Could not find notification {notification_id=} with pending deliveries")
+            return None
+
+        reply_message: ReplyableConditionMessage = notification.reply_condition_message
+        inline_keyboard = build_inline_keyboard(reply_message)
+        inline_condition_field_id = reply_message.reply_condition_bool_field_id
+
+        pending_selected = await session.execute(
+            select(
+                NotificationDelivery.id,
+                NotificationDelivery.chat_id,
+                NotificationDelivery.user_id,
+                User.deferred_field_id
+            )
+            .where(
+                (NotificationDelivery.notification_id == notification_id) &
+                (NotificationDelivery.status == DeliveryStatusEnum.PENDING) &
+                (User.id == NotificationDelivery.user_id)
+            )
+            .order_by(NotificationDelivery.id.asc())
+        )
+        pending = pending_selected.tuples().all()
+
+        conditions_fields_ids = set(keyboard_keys_index.condition_field_ids)
+        if inline_keyboard and inline_condition_field_id is not None:
+            conditions_fields_ids.add(inline_condition_field_id)
+        true_fields_ids_by_user_id = await _get_true_fields_ids_by_user_id(session, notification_id, conditions_fields_ids)
+
+    broadcast_messages: list[BroadcastMessage] = []
+    for delivery_id, chat_id, user_id, deferred_field_id in pending:
+        true_fields_ids = true_fields_ids_by_user_id.get(user_id, set())
+        if inline_keyboard and (inline_condition_field_id is None or inline_condition_field_id in true_fields_ids):
+            reply_markup = inline_keyboard
+        else:
+            reply_markup = get_keyboard_of_signature(
+                keyboard_keys_index,
+                get_keyboard_signature(
+                    keyboard_keys_index,
+                    true_field_ids     = true_fields_ids,
+                    has_deferred_field = deferred_field_id is not None
+                )
+            )
+        broadcast_messages.append(BroadcastMessage(
+            chat_id      = chat_id,
+            text         = reply_message.text_markdown,
+            parse_mode   = ParseMode.MARKDOWN,
+            reply_markup = reply_markup,
+            context      = delivery_id
+        ))
+
+    logger.info((
+        f"Performing notification {notification_id=} to {len(broadcast_messages)} pending recipients "
+        f"with {len({id(message.reply_markup) for message in broadcast_messages})} distinct keyboards"
+    ))
+
+    statuses: dict[int, DeliveryStatusEnum] = {}
+
+    async def on_result(message: BroadcastMessage, status: DeliveryStatusEnum) -> None:
+        nonlocal statuses
+        statuses[message.context] = status
+        if len(statuses) >= app.provider.config.broadcast.ledger_flush_size:
+            flushing, statuses = statuses, {}
+            try:
+                await asyncio.shield(_save_deliveries_statuses(app, flushing))
+            except Exception:
+                logger.exception(f"Was not able to save {len(flushing)} delivery statuses of notification {notification_id=}... retrying with the next batch")
+                statuses = {**flushing, **statuses}
+
+    try:
+        return await app.broadcaster.broadcast(f"notification_{notification_id}", broadcast_messages, on_result)
+    finally:
+        await asyncio.shield(_save_deliveries_statuses(app, statuses))
@@ -0,0 +1,30 @@
+from typing import Any, Awaitable, Callable
+
+class Outbox:
+    """
+    Исходящие действия обработчика: ответы в telegram, обращения к Minio и прочий сетевой ввод-вывод
+
+    Обработчик копит действия, пока работает с БД, и выполняет их по порядку после завершения транзакции,
+    чтобы соединение из пула не простаивало в ожидании ответов telegram
+    """
+
+    def __init__(self) -> None:
+        self._actions: list[tuple[Callable[[], Awaitable[Any]], Callable[[Any], None]|None]] = []
+
+    def add(self, action: Callable[[], Awaitable[Any]], on_done: Callable[[Any], None]|None = None) -> None:
+        """
+        Добавить действие, например `functools.partial(update.message.reply_markdown, text)`
+
+        * on_done - функция, получающая результат действия после его выполнения
+        """
+        self._actions.append((action, on_done))
+
+    async def flush(self) -> None:
+        """
+        Выполнить накопленные действия по порядку добавления
+        """
+        actions, self._actions = self._actions, []
+        for action, on_done in actions:
+            result = await action()
+            if on_done:
+                on_done(result)
@@ -1,6 +1,4 @@
-from typing import Coroutine, Any
 from telegram import (
-    Bot,
     ReplyKeyboardMarkup,
     ReplyKeyboardRemove,
     InlineKeyboardMarkup
@@ -10,42 +8,42 @@ from sqlalchemy import ColumnElement, select
 from sqlalchemy.ext.asyncio.session import AsyncSession
 
 from bot.application import BBApplication
+from bot.broadcaster import BroadcastMessage, BroadcastReport
 from utils.db_model import Group, User
 
-async def _get_set_to_all_corutines_sessioned(
-        app: BBApplication, table: type[Group|User], selector: ColumnElement[bool],
+async def _get_send_to_all_messages_sessioned(
+        table: type[Group|User], selector: ColumnElement[bool],
         session: AsyncSession,
         message: str, parse_mode: ParseMode,
         reply_markup: ReplyKeyboardMarkup | ReplyKeyboardRemove | InlineKeyboardMarkup | None = None
-    ) -> list[Coroutine[Any, Any, Any]]:
-    bot: Bot = app.bot
+    ) -> list[BroadcastMessage]:
     selection = await session.execute(
-        select(table).where(selector)
+        select(table.chat_id).where(selector)
     )
     return [
-        bot.send_message(chat_id=obj.chat_id, text=message, parse_mode=parse_mode, reply_markup=reply_markup)
-        for obj in selection.scalars()
+        BroadcastMessage(chat_id=chat_id, text=message, parse_mode=parse_mode, reply_markup=reply_markup)
+        for chat_id in selection.scalars()
     ]
 
-async def _get_send_to_all_coroutines(
+async def _get_send_to_all_messages(
         app: BBApplication, table: type[Group|User], selector: ColumnElement[bool],
         message: str, parse_mode: ParseMode,
         reply_markup: ReplyKeyboardMarkup | ReplyKeyboardRemove | InlineKeyboardMarkup | None = None,
         session: AsyncSession | None = None
-    ) -> list[Coroutine[Any, Any, Any]]:
+    ) -> list[BroadcastMessage]:
     """
-    Получить корутины для отправки всем пользователям или группам по заданному селектору
+    Получить сообщения для отправки всем пользователям или группам по заданному селектору
     """
     if session:
-        return await _get_set_to_all_corutines_sessioned(
-            app=app, table=table, selector=selector,
+        return await _get_send_to_all_messages_sessioned(
+            table=table, selector=selector,
             session=session,
             message=message, parse_mode=parse_mode,
             reply_markup=reply_markup
         )
     async with app.provider.db_session() as session:
-        return await _get_set_to_all_corutines_sessioned(
-            app=app, table=table, selector=selector,
+        return await _get_send_to_all_messages_sessioned(
+            table=table, selector=selector,
             session=session,
             message=message, parse_mode=parse_mode,
             reply_markup=reply_markup
@@ -56,17 +54,19 @@ async def send_to_all_coroutines_awaited(
         message: str, parse_mode: ParseMode,
         reply_markup: ReplyKeyboardMarkup | ReplyKeyboardRemove | InlineKeyboardMarkup | None = None,
         session: AsyncSession | None = None
-    ):
+    ) -> BroadcastReport:
     """
     Отправить всем пользователям или группам по заданному селектору с ожиданием
     """
-    for coroutine in await _get_send_to_all_coroutines(
-        app=app, table=table, selector=selector,
-        message=message, parse_mode=parse_mode,
-        reply_markup=reply_markup,
-        session=session
-    ):
-        await coroutine
+    return await app.broadcaster.broadcast(
+        name=f"send_to_all_{table.__tablename__}",
+        messages=await _get_send_to_all_messages(
+            app=app, table=table, selector=selector,
+            message=message, parse_mode=parse_mode,
+            reply_markup=reply_markup,
+            session=session
+        )
+    )
 
 async def send_to_all_coroutines_tasked(
         app: BBApplication, table: type[Group|User], selector: ColumnElement[bool],
@@ -74,14 +74,19 @@ async def send_to_all_coroutines_tasked(
         reply_markup: ReplyKeyboardMarkup | ReplyKeyboardRemove | InlineKeyboardMarkup | None = None,
         session: AsyncSession | None = None,
         update: dict|None = None
-    ):
+    ) -> None:
     """
     Отправить всем пользователям или группам по заданному селектору в виде параллельной задачи
     """
-    for coroutine in await _get_send_to_all_coroutines(
-        app=app, table=table, selector=selector,
-        message=message, parse_mode=parse_mode,
-        reply_markup=reply_markup,
-        session=session
-    ):
-        app.create_task(coroutine=coroutine, update=update)
\ No newline at end of file
+    app.create_task(
+        coroutine=app.broadcaster.broadcast(
+            name=f"send_to_all_{table.__tablename__}",
+            messages=await _get_send_to_all_messages(
+                app=app, table=table, selector=selector,
+                message=message, parse_mode=parse_mode,
+                reply_markup=reply_markup,
+                session=session
+            )
+        ),
+        update=update
+    )
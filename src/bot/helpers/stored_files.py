@@ -0,0 +1,85 @@
+from telegram import File
+
+from io import BytesIO
+from typing import AsyncIterator
+
+from sqlalchemy import select
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.ext.asyncio.session import AsyncSession
+
+from loguru import logger
+
+from utils.db_model import StoredFile
+
+from bot.application import BBApplication
+
+async def iter_telegram_file_chunks(app: BBApplication, file: File) -> AsyncIterator[bytes]:
+    """
+    Потоково загрузить файл из telegram частями
+    """
+    if not file.file_path.startswith(('http://', 'https://')):
+        in_memory = BytesIO()
+        await file.download_to_memory(in_memory)
+        yield in_memory.getvalue()
+        return
+
+    async with app.files_client.stream('GET', file.file_path) as response:
+        response.raise_for_status()
+        async for chunk in response.aiter_bytes(app.provider.minio.STREAM_CHUNK_SIZE):
+            yield chunk
+
+async def _get_stored_filename(session: AsyncSession, bucket: str, *where) -> str|None:
+    """
+    Внутренняя функция поиска уже помещённого в бакет файла
+    """
+    selected = await session.execute(
+        select(StoredFile.filename)
+        .where(StoredFile.bucket == bucket, *where)
+        .limit(1)
+    )
+    return selected.scalar_one_or_none()
+
+async def upload_telegram_file_deduplicated(app: BBApplication, file: File, bucket: str) -> str:
+    """
+    Поместить файл из telegram в бакет, если такого содержимого там ещё нет, и вернуть имя файла для сохранения в БД
+
+    * Повторно отправленный файл узнаётся по уникальному ИД telegram без загрузки
+    * Файл с уже сохранённым содержимым узнаётся по хешу и не помещается в бакет повторно
+
+    Соединение с БД берётся только на время отдельных запросов, а не на время загрузки файла
+    """
+    async with app.provider.db_session() as session:
+        stored_filename = await _get_stored_filename(
+            session, bucket, StoredFile.telegram_file_unique_id == file.file_unique_id
+        )
+    if stored_filename:
+        logger.info(f"File {file.file_unique_id=} is already stored in {bucket=} as {stored_filename}")
+        return stored_filename
+
+    staged = await app.provider.minio.stage_stream(iter_telegram_file_chunks(app, file))
+    with staged.file:
+        async with app.provider.db_session() as session:
+            stored_filename = await _get_stored_filename(
+                session, bucket, StoredFile.content_hash == staged.content_hash
+            )
+        if stored_filename:
+            logger.info(f"Content {staged.content_hash} is already stored in {bucket=} as {stored_filename}")
+            return stored_filename
+
+        stored_filename = await app.provider.minio.upload_staged_with_thumbnail_and_return_filename(bucket, staged)
+
+    async with app.provider.db_session() as session:
+        await session.execute(
+            insert(StoredFile)
+            .values(
+                bucket       = bucket,
+                content_hash = staged.content_hash,
+                filename     = stored_filename,
+                content_type = staged.content_type,
+                size         = staged.size,
+                telegram_file_unique_id = file.file_unique_id
+            )
+            .on_conflict_do_nothing()
+        )
+        await session.commit()
+    return stored_filename
@@ -1,13 +1,15 @@
-from telegram import Bot, Update, InlineKeyboardMarkup, InlineKeyboardButton
+from telegram import Bot, Message, Update, InlineKeyboardMarkup, InlineKeyboardButton
+from telegram.error import TelegramError
 from telegram.ext import ContextTypes
 from telegram.constants import ParseMode
 from telegram.helpers import escape_markdown
 
 from sqlalchemy.ext.asyncio.session import AsyncSession
-from sqlalchemy import select, insert, update as sql_update, func
+from sqlalchemy import select, insert, update as sql_update, func, Row
+from sqlalchemy.dialects.postgresql import insert as pg_insert
 
-from io import BytesIO
 from datetime import datetime
+from functools import partial
 from loguru import logger
 
 from bot.application import BBApplication
@@ -19,6 +21,7 @@ from utils.db_model import (
     ReplyableConditionMessage
 )
 from utils.custom_types import (
+    UserState,
     UserStatusEnum,
     KeyboardKeyStatusEnum,
     UserFieldDataPrepared,
@@ -34,42 +37,55 @@ from bot.helpers.keyboards import (
     get_awaliable_inline_keyboard_for_user
 )
 from bot.helpers.fields import (
+    get_field_by_id,
     get_field_question_by_branch,
     get_next_field_question,
-    get_user_field_value_by_key,
+    get_branch_fields,
 )
 
+from bot.helpers.stored_files import upload_telegram_file_deduplicated
+from bot.helpers.outbox import Outbox
+
 from bot.callback_constants import UserChangeFieldCallback
 
 async def insert_or_update_user_field_value(
         session: AsyncSession,
         user_id: int, field_id: int,
-        value: str, message_id: int
+        value: str, message_id: int,
+        telegram_file_id: str|None = None
     ) -> None:
-    updated = await session.execute(
-        sql_update(UserFieldValue)
-        .where(
-            (UserFieldValue.user_id  == user_id) &
-            (UserFieldValue.field_id == field_id)
-        )
-        .values(
-            user_id    = user_id,
-            field_id   = field_id,
-            value      = value,
-            message_id = message_id
+    """
+    Записать значение поля пользователя одним запросом `INSERT ... ON CONFLICT DO UPDATE`
+
+    * telegram_file_id - ИД файла в telegram, если значение является файлом
+    """
+    inserted = pg_insert(UserFieldValue).values(
+        user_id    = user_id,
+        field_id   = field_id,
+        value      = value,
+        message_id = message_id,
+        telegram_file_id = telegram_file_id
+    )
+    await session.execute(
+        inserted.on_conflict_do_update(
+            index_elements = [UserFieldValue.user_id, UserFieldValue.field_id],
+            set_ = {
+                'value':      inserted.excluded.value,
+                'message_id': inserted.excluded.message_id,
+                'telegram_file_id': inserted.excluded.telegram_file_id
+            }
         )
     )
 
-    if updated.rowcount == 0:
-        await session.execute(
-            insert(UserFieldValue)
-            .values(
-                user_id    = user_id,
-                field_id   = field_id,
-                value      = value,
-                message_id = message_id
-            )
-        )
+def get_message_telegram_file_id(message: Message) -> str|None:
+    """
+    Получить ИД файла в telegram из сообщения с документом или фото
+    """
+    if message.document:
+        return message.document.file_id
+    if message.photo:
+        return message.photo[-1].file_id
+    return None
 
 async def user_set_have_banned_bot(app: BBApplication, chat_id: int, have_banned_bot: bool) -> None:
     """
@@ -83,16 +99,58 @@ async def user_set_have_banned_bot(app: BBApplication, chat_id: int, have_banned
         )
         await session.commit()
 
-async def get_user_by_chat_id_or_none(session: AsyncSession, chat_id: int) -> User|None:
+async def get_user_state_by_chat_id_or_none(session: AsyncSession, chat_id: int) -> UserState|None:
     """
-    Получить пользователя или ничего если пользователя не существует
+    Получить состояние пользователя одним запросом или ничего если пользователя не существует
+
+    Значения полей и связанные объекты не загружаются - их получают только обработчики, которым они нужны
     """
     selection = await session.execute(
-        select(User).where(User.chat_id == chat_id)
+        select(
+            User.id, User.chat_id, User.username, User.status,
+            User.curr_field_id, User.deferred_field_id,
+            User.change_field_message_id, User.curr_reply_message_id
+        )
+        .where(User.chat_id == chat_id)
+    )
+    row = selection.one_or_none()
+    return UserState(*row) if row else None
+
+async def get_user_fields_prepared(session: AsyncSession, user_id: int, fields: tuple[Field, ...]) -> dict[int, UserFieldDataPrepared]:
+    """
+    Получить значения заданных полей пользователя одним запросом
+    """
+    fields_by_id = {field.id: field for field in fields}
+    if not fields_by_id:
+        return {}
+
+    selected = await session.execute(
+        select(UserFieldValue.field_id, UserFieldValue.value, UserFieldValue.telegram_file_id)
+        .where(
+            (UserFieldValue.user_id == user_id) &
+            (UserFieldValue.field_id.in_(fields_by_id.keys()))
+        )
     )
-    return selection.scalar_one_or_none()
+    return {
+        field_id: UserFieldDataPrepared(
+            value = value,
+            document_bucket  = fields_by_id[field_id].document_bucket,
+            image_bucket     = fields_by_id[field_id].image_bucket,
+            telegram_file_id = telegram_file_id
+        )
+        for field_id, value, telegram_file_id in selected.tuples()
+    }
 
-async def create_new_user_and_answer(update: Update, context: ContextTypes.DEFAULT_TYPE, settings: Settings, session: AsyncSession) -> None:
+async def get_user_curr_field(app: BBApplication, user: UserState) -> Field|None:
+    """
+    Получить текущий вопрос пользователя из графа вопросов
+    """
+    if user.curr_field_id is None:
+        return None
+    return await get_field_by_id(app, user.curr_field_id)
+
+async def create_new_user_and_answer(update: Update, context: ContextTypes.DEFAULT_TYPE,
+                                     settings: Settings, session: AsyncSession, outbox: Outbox) -> None:
     """
     Создаёт нового пользователя и оповещает его
     """
@@ -101,13 +159,14 @@ async def create_new_user_and_answer(update: Update, context: ContextTypes.DEFAU
     username = update.effective_user.username
 
     logger.info(f"Got start/help command from new user {chat_id=} and {username=}")
-    first_question = await get_field_question_by_branch(session, settings.first_field_branch)
-    await update.message.reply_markdown(
+    first_question = await get_field_question_by_branch(app, settings.first_field_branch)
+    outbox.add(partial(
+        update.message.reply_markdown,
         settings.start_template.format(
             template = first_question.question_markdown,
         ),
         reply_markup = construct_keyboard_reply(first_question, app)
-    )
+    ))
     await session.execute(
         insert(User).values(
             timestamp     = datetime.now(),
@@ -119,7 +178,8 @@ async def create_new_user_and_answer(update: Update, context: ContextTypes.DEFAU
     logger.info(f"Creating new user {chat_id=} and {username=}")
 
 async def parse_start_help_commands_and_answer(update: Update, context: ContextTypes.DEFAULT_TYPE,
-                                               user: User, settings: Settings, session: AsyncSession) -> None:
+                                               user: UserState, settings: Settings, session: AsyncSession,
+                                               outbox: Outbox) -> None:
     """
     Парсит различные варианты команд старта и помощи для уже зарегистрированных пользователей
     """
@@ -127,53 +187,59 @@ async def parse_start_help_commands_and_answer(update: Update, context: ContextT
     chat_id  = update.effective_user.id
     username = update.effective_user.username
 
+    curr_field = await get_user_curr_field(app, user)
+
     for _,entity in update.message.parse_entities().items():
-        curr_field: Field|None = user.curr_field
 
         if curr_field and entity.endswith(app.HELP_COMMAND):
             logger.info(f"Got help command from user {chat_id=} and {username=} with {curr_field.key=}")
-            await update.message.reply_markdown(
+            outbox.add(partial(
+                update.message.reply_markdown,
                 settings.help_user_template.format(
                     template = curr_field.question_markdown
                 ),
                 reply_markup = construct_keyboard_reply(curr_field, app)
-            )
+            ))
             return
 
         if curr_field and entity.endswith(app.START_COMMAND):
             logger.info(f"Got start command from user {chat_id=} and {username=} with {curr_field.key=}")
-            await update.message.reply_markdown(
+            outbox.add(partial(
+                update.message.reply_markdown,
                 settings.restart_user_template.format(
                     template = curr_field.question_markdown
                 ),
                 reply_markup = construct_keyboard_reply(curr_field, app)
-            )
+            ))
             return
 
         if not curr_field and entity.endswith(app.HELP_COMMAND):
             logger.info(f"Got help command from user {chat_id=} and {username=} without current field")
-            await update.message.reply_markdown(
+            outbox.add(partial(
+                update.message.reply_markdown,
                 settings.help_user_template.format(
                     template = settings.help_restart_on_registration_complete
                 ),
-                reply_markup = await get_keyboard_of_user(session, user)
-            )
+                reply_markup = await get_keyboard_of_user(app, session, user)
+            ))
             return
 
         if not curr_field and entity.endswith(app.START_COMMAND):
             logger.info(f"Got start command from user {chat_id=} and {username=} without current field")
-            await update.message.reply_markdown(
+            outbox.add(partial(
+                update.message.reply_markdown,
                 settings.restart_user_template.format(
                     template = settings.help_restart_on_registration_complete
                 ),
-                reply_markup = await get_keyboard_of_user(session, user)
-            )
+                reply_markup = await get_keyboard_of_user(app, session, user)
+            ))
             return
 
-async def upload_telegram_file_to_minio_and_return_filename(update: Update, context: ContextTypes.DEFAULT_TYPE,
-                                                            user: User, field: Field, settings: Settings, session: AsyncSession) -> str:
+async def upload_telegram_file_to_minio_and_return_filename(update: Update, context: ContextTypes.DEFAULT_TYPE, field: Field) -> str:
     """
     Загружает файл из telegram в Minio и возвращает итоговое название файла для сохранения в БД
+
+    Вызывается вне сессии обработчика: загрузка может быть долгой
     """
     app: BBApplication = context.application
     chat_id  = update.effective_user.id
@@ -185,23 +251,30 @@ async def upload_telegram_file_to_minio_and_return_filename(update: Update, cont
         file = await update.message.document.get_file()
     elif update.message.photo:
         file = await update.message.photo[-1].get_file()
-
-    in_memory = BytesIO()
-    await file.download_to_memory(in_memory)
     
-    saved_filename = await get_user_field_value_by_key(session, user, settings.user_document_name_field)
-
     bucket = field.document_bucket or field.image_bucket
 
-    return await app.provider.minio.upload_with_thumbnail_and_return_filename(
-        bucket                = bucket,
-        filename_wo_extension = saved_filename,
-        bio                   = in_memory
+    return await upload_telegram_file_deduplicated(app, file, bucket)
+
+async def _get_curr_reply_message_or_none(session: AsyncSession, user: UserState) -> Row|None:
+    """
+    Внутренняя функция получения типа и ответов сообщения, на которое отвечает пользователь, без связанных полей
+    """
+    if user.curr_reply_message_id is None:
+        return None
+    selected = await session.execute(
+        select(
+            ReplyableConditionMessage.id,
+            ReplyableConditionMessage.reply_type,
+            ReplyableConditionMessage.reply_status_replies
+        )
+        .where(ReplyableConditionMessage.id == user.curr_reply_message_id)
     )
+    return selected.one_or_none()
 
 async def update_user_over_next_question_answer_and_get_curr_field(update: Update, context: ContextTypes.DEFAULT_TYPE,
-                                                    user: User, settings: Settings, session: AsyncSession,
-                                                    message_type: str) -> Field|None:
+                                                    user: UserState, settings: Settings, session: AsyncSession,
+                                                    outbox: Outbox, message_type: str) -> Field|None:
     """
     Обновляет запись пользователя по логике получения следующего вопрос в ветке
     """
@@ -209,30 +282,33 @@ async def update_user_over_next_question_answer_and_get_curr_field(update: Updat
     chat_id  = update.effective_user.id
     username = update.effective_user.username
 
-    curr_field: Field|None = user.curr_field
+    curr_field = await get_user_curr_field(app, user)
 
     if not curr_field:
         return None
     
     if message_type == 'text' and (curr_field.document_bucket or curr_field.image_bucket):
-        await update.message.reply_markdown(
+        outbox.add(partial(
+            update.message.reply_markdown,
             curr_field.question_markdown,
             reply_markup = construct_keyboard_reply(curr_field, app)
-        )
+        ))
         return None
     
     if message_type == 'photo/document' and not (curr_field.document_bucket or curr_field.image_bucket):
-        await update.message.reply_markdown(
+        outbox.add(partial(
+            update.message.reply_markdown,
             curr_field.question_markdown,
             reply_markup = construct_keyboard_reply(curr_field, app)
-        )
+        ))
         return None
 
     if update.message.text == app.provider.config.i18n.defer:
-        await update.message.reply_markdown(
+        outbox.add(partial(
+            update.message.reply_markdown,
             app.provider.config.i18n.defered,
-            reply_markup = await get_keyboard_of_user(session, user, always_add_defered_keys=True)
-        )
+            reply_markup = await get_keyboard_of_user(app, session, user, always_add_defered_keys=True)
+        ))
         await session.execute(
             sql_update(User)
             .where(User.id == user.id)
@@ -244,8 +320,8 @@ async def update_user_over_next_question_answer_and_get_curr_field(update: Updat
         await session.commit()
         return
     
-    curr_reply_message: ReplyableConditionMessage = user.curr_reply_message
-    next_field = await get_next_field_question(session, curr_field)
+    curr_reply_message = await _get_curr_reply_message_or_none(session, user)
+    next_field = await get_next_field_question(app, curr_field)
 
     if curr_reply_message and curr_reply_message.reply_type == ReplyTypeEnum.FULL_TEXT_ANSWER:
         logger.info((
@@ -253,10 +329,11 @@ async def update_user_over_next_question_answer_and_get_curr_field(update: Updat
             f"to question {curr_field.key=} with {curr_field.status=}, "
             f"for full text answer {curr_reply_message.id=}"
         ))
-        await update.message.reply_markdown(
+        outbox.add(partial(
+            update.message.reply_markdown,
             curr_reply_message.reply_status_replies,
-            reply_markup = await get_keyboard_of_user(session, user)
-        )
+            reply_markup = await get_keyboard_of_user(app, session, user)
+        ))
         user_update = {
             'curr_field_id': None,
             'curr_reply_message_id': None
@@ -268,10 +345,11 @@ async def update_user_over_next_question_answer_and_get_curr_field(update: Updat
             f"to question {curr_field.key=} with {curr_field.status=}, "
             f"for last question of branch id {curr_reply_message.id=}"
         ))
-        await update.message.reply_markdown(
+        outbox.add(partial(
+            update.message.reply_markdown,
             curr_reply_message.reply_status_replies,
-            reply_markup = await get_keyboard_of_user(session, user)
-        )
+            reply_markup = await get_keyboard_of_user(app, session, user)
+        ))
         user_update = {
             'curr_field_id': None,
             'curr_reply_message_id': None
@@ -283,10 +361,11 @@ async def update_user_over_next_question_answer_and_get_curr_field(update: Updat
             f"to question {curr_field.key=} with {curr_field.status=}, "
             f"next question is {next_field.key=} with {next_field.status=}"
         ))
-        await update.message.reply_markdown(
+        outbox.add(partial(
+            update.message.reply_markdown,
             next_field.question_markdown,
             reply_markup = construct_keyboard_reply(next_field, app)
-        )
+        ))
         user_update = {'curr_field_id': next_field.id}
     
     elif not next_field:
@@ -294,10 +373,11 @@ async def update_user_over_next_question_answer_and_get_curr_field(update: Updat
             f"Got {message_type} answer from user {chat_id=} and {username=} "
             f"to last question {curr_field.key=} with {curr_field.status=}"
         ))
-        await update.message.reply_markdown(
+        outbox.add(partial(
+            update.message.reply_markdown,
             settings.registration_complete,
-            reply_markup = await get_keyboard_of_user(session, user)
-        )
+            reply_markup = await get_keyboard_of_user(app, session, user)
+        ))
         
         user_update = {
             'curr_field_id': None,
@@ -312,13 +392,14 @@ async def update_user_over_next_question_answer_and_get_curr_field(update: Updat
             user_count = user_count_selected.scalar_one() + 1 # One new user was just activated
             if user_count % int(settings.report_send_every_x_active_users) == 0:
                 logger.warning(f"Performing admin notification about number of active users {settings.report_send_every_x_active_users=} {user_count=}")
-                await group_send_to_all_admin_tasked(
+                outbox.add(partial(
+                    group_send_to_all_admin_tasked,
                     app     = app,
                     message = settings.report_currently_active_users_template.format(
                         count = user_count
                     ),
                     parse_mode = ParseMode.MARKDOWN
-                )
+                ))
         except Exception:
             logger.warning(f"Was not able to perform admin notification about number of active users {settings.report_send_every_x_active_users=}")
 
@@ -330,40 +411,145 @@ async def update_user_over_next_question_answer_and_get_curr_field(update: Updat
 
     return curr_field
 
+def _remember_sent_telegram_file_id(
+        sent_telegram_files_ids: dict[int, str], field_id: int,
+        stored_telegram_file_id: str|None, sent_telegram_file_id: str|None
+    ) -> None:
+    """
+    Внутренняя функция запоминания ИД отправленного файла, если он отличается от сохранённого в БД
+    """
+    if sent_telegram_file_id and sent_telegram_file_id != stored_telegram_file_id:
+        sent_telegram_files_ids[field_id] = sent_telegram_file_id
+
+async def _update_sent_telegram_files_ids(app: BBApplication, user_id: int, sent_telegram_files_ids: dict[int, str]) -> None:
+    """
+    Внутренняя функция сохранения ИД отправленных файлов в отдельной короткой транзакции
+    """
+    if not sent_telegram_files_ids:
+        return
+    async with app.provider.db_session() as session:
+        for field_id, telegram_file_id in sent_telegram_files_ids.items():
+            await session.execute(
+                sql_update(UserFieldValue)
+                .where(
+                    (UserFieldValue.user_id  == user_id) &
+                    (UserFieldValue.field_id == field_id)
+                )
+                .values(telegram_file_id = telegram_file_id)
+            )
+        await session.commit()
+
+def _reply_user_fields_files(
+        app: BBApplication, update: Update, outbox: Outbox,
+        user_id: int, fields: tuple[Field, ...], user_fields: dict[int, UserFieldDataPrepared]
+    ) -> None:
+    """
+    Внутренняя функция добавления в исходящие действия отправки файлов из значений полей пользователя
+
+    ИД отправленных файлов сохраняются в БД после их отправки
+    """
+    sent_telegram_files_ids: dict[int, str] = {}
+
+    for field in fields:
+        if field.id not in user_fields:
+            continue
+        if user_fields[field.id].document_bucket or user_fields[field.id].image_bucket:
+            outbox.add(
+                partial(_reply_user_field_file, app, update, field, user_fields[field.id]),
+                on_done = partial(
+                    _remember_sent_telegram_file_id,
+                    sent_telegram_files_ids, field.id, user_fields[field.id].telegram_file_id
+                )
+            )
+
+    outbox.add(partial(_update_sent_telegram_files_ids, app, user_id, sent_telegram_files_ids))
+
+def _prepare_user_fields(app: BBApplication, fields: tuple[Field, ...], user_fields: dict[int, UserFieldDataPrepared]) -> None:
+    """
+    Внутренняя функция подготовки значений полей пользователя к выводу
+
+    Отсутствующие значения заполняются заглушкой, значения файловых полей заменяются подписями
+    """
+    for field in fields:
+        if field.id not in user_fields:
+            user_fields[field.id] = UserFieldDataPrepared(
+                value = app.provider.config.i18n.data_empty,
+                document_bucket = field.document_bucket,
+                image_bucket    = field.image_bucket
+            )
+
+        if user_fields[field.id].document_bucket:
+            user_fields[field.id] = UserFieldDataPrepared(
+                value = app.provider.config.i18n.document,
+                document_bucket = user_fields[field.id].document_bucket,
+                image_bucket    = user_fields[field.id].image_bucket
+            )
+
+        if user_fields[field.id].image_bucket:
+            user_fields[field.id] = UserFieldDataPrepared(
+                value = app.provider.config.i18n.image,
+                document_bucket = user_fields[field.id].document_bucket,
+                image_bucket    = user_fields[field.id].image_bucket
+            )
+
+async def _edit_change_field_message(update: Update, context: ContextTypes.DEFAULT_TYPE, user: UserState,
+                                     text: str, reply_markup: InlineKeyboardMarkup) -> None:
+    """
+    Внутренняя функция обновления сообщения со значениями полей, из которого пользователь начал изменение поля
+    """
+    app: BBApplication = context.application
+    bot: Bot = app.bot
+    chat_id  = update.effective_user.id
+    username = update.effective_user.username
+
+    try:
+        await bot.edit_message_text(
+            chat_id      = user.chat_id,
+            message_id   = user.change_field_message_id,
+            text         = text,
+            parse_mode   = ParseMode.MARKDOWN,
+            reply_markup = reply_markup,
+        )
+    except Exception:
+        logger.warning(f"Was not able to modify message after updating user {chat_id=} {username=} {user.curr_field_id=}")
+
 async def user_change_field_and_answer(update: Update, context: ContextTypes.DEFAULT_TYPE,
-                                        user: User, settings: Settings, session: AsyncSession,
-                                        message_type: str) -> bool:
+                                        user: UserState, settings: Settings, session: AsyncSession,
+                                        outbox: Outbox, message_type: str,
+                                        uploaded_filename: str|None = None) -> bool:
     """
     Обновляет запись пользователя по логике изменения значения поля
 
     Если записи нет - создаёт, если есть - обновляет
+
+    * uploaded_filename - имя уже загруженного в Minio файла, если пользователь отправил фото или документ
     """
     app: BBApplication = context.application
-    bot: Bot = app.bot
     chat_id  = update.effective_user.id
     username = update.effective_user.username
 
     logger.info(f"Updating field of user {chat_id=} {username=} {user.curr_field_id=} in message {message_type=}")
 
-    curr_field: Field|None = user.curr_field
+    curr_field = await get_user_curr_field(app, user)
 
     if not curr_field:
         logger.error(f"Could not found field to update user {chat_id=} {username=} {user.curr_field_id=}")
-        await update.message.reply_markdown(settings.error_reply)
+        outbox.add(partial(update.message.reply_markdown, settings.error_reply))
         return True
     
     if message_type == 'text' and (curr_field.document_bucket or curr_field.image_bucket):
-        await update.message.reply_markdown(curr_field.question_markdown)
+        outbox.add(partial(update.message.reply_markdown, curr_field.question_markdown))
         return True
     
     if message_type == 'photo/document' and not (curr_field.document_bucket or curr_field.image_bucket):
-        await update.message.reply_markdown(curr_field.question_markdown)
+        outbox.add(partial(update.message.reply_markdown, curr_field.question_markdown))
         return True
     
-    await update.message.reply_markdown(
+    outbox.add(partial(
+        update.message.reply_markdown,
         settings.user_change_message_reply_template.format(state = curr_field.key),
-        reply_markup = await get_keyboard_of_user(session, user)
-    )
+        reply_markup = await get_keyboard_of_user(app, session, user)
+    ))
 
     try:
         user_field_value_data = update.message.text_markdown_urled
@@ -371,68 +557,39 @@ async def user_change_field_and_answer(update: Update, context: ContextTypes.DEF
         user_field_value_data = escape_markdown(update.message.text)
 
     if message_type == 'photo/document':
-        user_field_value_data = await upload_telegram_file_to_minio_and_return_filename(update, context, user, curr_field, settings, session)
+        user_field_value_data = uploaded_filename
 
     await insert_or_update_user_field_value(
         session    = session, 
         user_id    = user.id,
         field_id   = curr_field.id,
         value      = user_field_value_data,
-        message_id = update.message.id
+        message_id = update.message.id,
+        telegram_file_id = get_message_telegram_file_id(update.message) if message_type == 'photo/document' else None
     )
 
-    fields_selected = await session.execute(
-        select(Field)
-        .where(Field.branch_id == curr_field.branch_id)
-        .order_by(Field.order_place.asc())
-    )
-    fields = list(fields_selected.scalars())
-
-    user_fields = user.prepare_fields()
+    fields = await get_branch_fields(app, curr_field.branch_id)
 
-    for field in fields:
-        if field.id not in user_fields:
-            user_fields[field.id] = UserFieldDataPrepared(
-                value = app.provider.config.i18n.data_empty,
-                document_bucket = field.document_bucket,
-                image_bucket    = field.image_bucket
-            )
-        
-        if user_fields[field.id].document_bucket:
-            user_fields[field.id] = UserFieldDataPrepared(
-                value = app.provider.config.i18n.document,
-                document_bucket = user_fields[field.id].document_bucket,
-                image_bucket    = user_fields[field.id].image_bucket
-            )
+    user_fields = await get_user_fields_prepared(session, user.id, fields)
 
-        if user_fields[field.id].image_bucket:
-            user_fields[field.id] = UserFieldDataPrepared(
-                value = app.provider.config.i18n.image,
-                document_bucket = user_fields[field.id].document_bucket,
-                image_bucket    = user_fields[field.id].image_bucket
-            )
+    _prepare_user_fields(app, fields, user_fields)
 
     fields_text = "\n".join([
         f"*{field.key}*: `{user_fields[field.id].value}`"
         for field in fields
     ])
 
-    try:
-        await bot.edit_message_text(
-            chat_id      = user.chat_id,
-            message_id   = user.change_field_message_id,
-            text         = fields_text,
-            parse_mode   = ParseMode.MARKDOWN,
-            reply_markup = InlineKeyboardMarkup([
-                [InlineKeyboardButton(
-                    text=user_fields[field.id].value,
-                    callback_data=UserChangeFieldCallback.TEMPLATE.format(field_id = field.id)
-                )]
-                for field in fields
-            ]),
-        )
-    except Exception:
-        logger.warning(f"Was not able to modify message after updating user {chat_id=} {username=} {user.curr_field_id=}")
+    outbox.add(partial(
+        _edit_change_field_message, update, context, user,
+        text = fields_text,
+        reply_markup = InlineKeyboardMarkup([
+            [InlineKeyboardButton(
+                text=user_fields[field.id].value,
+                callback_data=UserChangeFieldCallback.TEMPLATE.format(field_id = field.id)
+            )]
+            for field in fields
+        ])
+    ))
     
     await session.execute(
         sql_update(User)
@@ -446,15 +603,18 @@ async def user_change_field_and_answer(update: Update, context: ContextTypes.DEF
     return False
 
 
-async def answer_to_user_keyboard_key_hit(update: Update, context: ContextTypes.DEFAULT_TYPE, user: User, session: AsyncSession) -> bool:
+async def answer_to_user_keyboard_key_hit(update: Update, context: ContextTypes.DEFAULT_TYPE,
+                                          user: UserState, session: AsyncSession, outbox: Outbox) -> bool:
     """
     Отвечает на пользовательский запрос на кнопку клавиатуры
+
+    Изменения пользователя выполняются в переданной сессии, фиксирует их вызывающий обработчик
     """
     app: BBApplication = context.application
     chat_id  = update.effective_user.id
     username = update.effective_user.username
 
-    keyboard_key = await get_keyboard_key_by_key_text(session, update.message.text)
+    keyboard_key = await get_keyboard_key_by_key_text(app, update.message.text)
     
     if not keyboard_key:
         return False
@@ -462,25 +622,27 @@ async def answer_to_user_keyboard_key_hit(update: Update, context: ContextTypes.
     logger.info(f"Got keyboard key heat from user {chat_id=} and {username=} {keyboard_key.key=}")
 
     if keyboard_key.status == KeyboardKeyStatusEnum.ME:
-        await post_user_me_information(update, context, user, keyboard_key, session)
+        await post_user_me_information(update, context, user, keyboard_key, session, outbox)
         return True
 
     if keyboard_key.status == KeyboardKeyStatusEnum.DEFERRED:
-        deferred_field: Field = user.deferred_field
-        await update.message.reply_markdown(
+        deferred_field = await get_field_by_id(app, user.deferred_field_id) if user.deferred_field_id is not None else None
+        if not deferred_field:
+            logger.warning(f"Got deferred key hit from user {chat_id=} and {username=} without deferred field")
+            return False
+        outbox.add(partial(
+            update.message.reply_markdown,
             deferred_field.question_markdown,
             reply_markup = construct_keyboard_reply(deferred_field, app)
-        )
-        async with app.provider.db_session() as session:
-            await session.execute(
-                sql_update(User)
-                .where(User.id == user.id)
-                .values(
-                    deferred_field_id = None,
-                    curr_field_id     = deferred_field.id
-                )
+        ))
+        await session.execute(
+            sql_update(User)
+            .where(User.id == user.id)
+            .values(
+                deferred_field_id = None,
+                curr_field_id     = deferred_field.id
             )
-            await session.commit()
+        )
         return True
 
     reply_condition_message: ReplyableConditionMessage = keyboard_key.reply_condition_message
@@ -488,37 +650,78 @@ async def answer_to_user_keyboard_key_hit(update: Update, context: ContextTypes.
     reply_markup = (
         await get_awaliable_inline_keyboard_for_user(reply_condition_message, user, session)
     ) or (
-        await get_keyboard_of_user(session, user)
+        await get_keyboard_of_user(app, session, user)
     )
 
     if reply_condition_message.photo_link in [None, '']:
-        await update.message.reply_markdown(
+        outbox.add(partial(
+            update.message.reply_markdown,
             reply_condition_message.text_markdown,
             reply_markup = reply_markup
-        )
+        ))
         return True
 
     if reply_condition_message.photo_link not in [None, ''] and len(reply_condition_message.text_markdown) <= 1024:
-        await update.message.reply_photo(
+        outbox.add(partial(
+            update.message.reply_photo,
             reply_condition_message.photo_link,
             caption = reply_condition_message.text_markdown,
             reply_markup = reply_markup,
             parse_mode = ParseMode.MARKDOWN
-        )
+        ))
         return True
 
     if reply_condition_message.photo_link not in [None, ''] and len(reply_condition_message.text_markdown) > 1024:
-        await update.message.reply_photo(reply_condition_message.photo_link)
-        await update.message.reply_markdown(
+        outbox.add(partial(update.message.reply_photo, reply_condition_message.photo_link))
+        outbox.add(partial(
+            update.message.reply_markdown,
             reply_condition_message.text_markdown,
             reply_markup = reply_markup
-        )
+        ))
         return True
 
     return False
 
+async def _reply_user_field_file(
+        app: BBApplication, update: Update,
+        field: Field, field_data: UserFieldDataPrepared
+    ) -> str|None:
+    """
+    Внутренняя функция отправки файла из значения поля пользователя
+
+    Файл отправляется по ИД в telegram, а при его отсутствии или ошибке - загружается из бакета.
+    Возвращает ИД отправленного файла в telegram
+    """
+    chat_id  = update.effective_user.id
+    username = update.effective_user.username
+    is_document = bool(field_data.document_bucket)
+
+    if field_data.telegram_file_id:
+        try:
+            if is_document:
+                message = await update.message.reply_document(field_data.telegram_file_id)
+            else:
+                message = await update.message.reply_photo(field_data.telegram_file_id)
+            return get_message_telegram_file_id(message)
+        except TelegramError as err:
+            logger.info(f"Could not resend file by id on ME key hit to user {chat_id=} {username=} for field {field.id=}: {err}")
+
+    logger.info(f"Trying to send {'document' if is_document else 'image'} from MinIO on ME key hit to user {chat_id=} {username=} for field {field.id=}")
+    try:
+        if is_document:
+            with await app.provider.minio.download_to_temporary_file(field_data.document_bucket, field_data.value) as file:
+                message = await update.message.reply_document(file)
+        else:
+            with await app.provider.minio.download_to_temporary_file(field_data.image_bucket, field_data.value.replace('_thumbnail', '')) as file:
+                message = await update.message.reply_photo(file)
+        return get_message_telegram_file_id(message)
+    except Exception:
+        logger.warning(f"Was not able to send file on ME key hit to user {chat_id=} {username=} for field {field.id=}")
+        return None
+
 async def post_user_me_information(update: Update, context: ContextTypes.DEFAULT_TYPE,
-                                   user: User, keyboard_key: KeyboardKey, session: AsyncSession) -> None:
+                                   user: UserState, keyboard_key: KeyboardKey, session: AsyncSession,
+                                   outbox: Outbox) -> None:
     """
     Отправляет информацию о пользователе по нажатию кноки "Обо мне" по заданной в клавише ветке вопросов
     """
@@ -528,65 +731,20 @@ async def post_user_me_information(update: Update, context: ContextTypes.DEFAULT
 
     logger.info(f"Sending ME info to user {chat_id=} {username=} by branch {keyboard_key.branch_id=}")
 
-    fields_selected = await session.execute(
-        select(Field)
-        .where(Field.branch_id == keyboard_key.branch_id)
-        .order_by(Field.order_place.asc())
-    )
-    fields = list(fields_selected.scalars())
-
-    user_fields = user.prepare_fields()
+    fields = await get_branch_fields(app, keyboard_key.branch_id)
 
-    for field in fields:
-        if field.id not in user_fields:
-            user_fields[field.id] = UserFieldDataPrepared(
-                value = app.provider.config.i18n.data_empty,
-                document_bucket = field.document_bucket,
-                image_bucket    = field.image_bucket
-            )
-        
-        if user_fields[field.id].document_bucket:
-            logger.info(f"Trying to send document on ME key hit to user {chat_id=} {username=} for field {field.id=}")
-            
-            try:
-                bio, _ = await app.provider.minio.download(
-                    user_fields[field.id].document_bucket,
-                    user_fields[field.id].value
-                )
-                await update.message.reply_document(bio)
-            except Exception:
-                logger.warning('Was not able to send document on ME key hit to user {chat_id=} {username=} for field {field.id=}')
+    user_fields = await get_user_fields_prepared(session, user.id, fields)
 
-            user_fields[field.id] = UserFieldDataPrepared(
-                value = app.provider.config.i18n.document,
-                document_bucket = user_fields[field.id].document_bucket,
-                image_bucket    = user_fields[field.id].image_bucket
-            )
-
-        if user_fields[field.id].image_bucket:
-            logger.info(f"Trying to send image on ME key hit to user {chat_id=} {username=} for field {field.id=}")
-            
-            try:
-                bio, _ = await app.provider.minio.download(
-                    user_fields[field.id].image_bucket,
-                    user_fields[field.id].value.replace('_thumbnail', '')
-                )
-                await update.message.reply_photo(bio)
-            except Exception:
-                logger.warning('Was not able to send image on ME key hit to user {chat_id=} {username=} for field {field.id=}')
-
-            user_fields[field.id] = UserFieldDataPrepared(
-                value = app.provider.config.i18n.image,
-                document_bucket = user_fields[field.id].document_bucket,
-                image_bucket    = user_fields[field.id].image_bucket
-            )
+    _reply_user_fields_files(app, update, outbox, user.id, fields, user_fields)
+    _prepare_user_fields(app, fields, user_fields)
 
     fields_text = "\n".join([
         f"*{field.key}*: `{user_fields[field.id].value}`"
         for field in fields
     ])
 
-    await update.message.reply_markdown(
+    outbox.add(partial(
+        update.message.reply_markdown,
         fields_text,
         reply_markup = InlineKeyboardMarkup([
             [InlineKeyboardButton(
@@ -595,4 +753,4 @@ async def post_user_me_information(update: Update, context: ContextTypes.DEFAULT
             )]
             for field in fields
         ])
-    )
\ No newline at end of file
+    ))
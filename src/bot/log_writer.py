@@ -0,0 +1,107 @@
+import asyncio
+from time import monotonic
+from datetime import datetime
+from typing import NamedTuple
+
+from sqlalchemy import insert
+
+from loguru import logger
+
+from utils.bb_provider  import BBProvider
+from utils.config_model import LogWriter
+from utils.db_model     import Log
+
+class LogEntry(NamedTuple):
+    """
+    Запись лога, ожидающая сохранения в БД
+    """
+    timestamp: datetime
+    message:   str
+
+class BBLogWriter:
+    """
+    Буферизованная запись логов бота в БД
+
+    Записи копятся в очереди и сохраняются фоновой задачей одним многострочным `INSERT` на пачку:
+    при наборе `batch_size` записей, через `flush_interval` после первой записи пачки и при остановке
+    """
+
+    def __init__(self, provider: BBProvider, config: LogWriter) -> None:
+        self.provider = provider
+        self.config   = config
+        self._queue: asyncio.Queue[LogEntry|None] = asyncio.Queue(config.queue_size)
+        self._task: asyncio.Task | None = None
+
+    def start(self) -> None:
+        """
+        Запустить фоновое сохранение записей
+        """
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        """
+        Сохранить все поставленные в очередь записи и остановить фоновое сохранение
+        """
+        if self._task is None:
+            return
+        await self._queue.put(None)
+        await self._task
+        self._task = None
+
+    async def write(self, message: str) -> None:
+        """
+        Поставить запись в очередь сохранения
+
+        Если фоновое сохранение не запущено, запись сохраняется сразу
+        """
+        entry = LogEntry(datetime.now(), message)
+        if self._task is None:
+            return await self._flush([entry])
+        await self._queue.put(entry)
+
+    async def _run(self) -> None:
+        """
+        Внутренняя задача сбора записей в пачки и их сохранения до получения признака остановки
+        """
+        stopping = False
+        while not stopping:
+            entry = await self._queue.get()
+            if entry is None:
+                break
+
+            entries  = [entry]
+            deadline = monotonic() + self.config.flush_interval
+            while len(entries) < self.config.batch_size:
+                try:
+                    entry = self._queue.get_nowait()
+                except asyncio.QueueEmpty:
+                    timeout = deadline - monotonic()
+                    if timeout <= 0:
+                        break
+                    try:
+                        entry = await asyncio.wait_for(self._queue.get(), timeout)
+                    except asyncio.TimeoutError:
+                        break
+                if entry is None:
+                    stopping = True
+                    break
+                entries.append(entry)
+
+            await self._flush(entries)
+
+    async def _flush(self, entries: list[LogEntry]) -> None:
+        """
+        Внутренняя функция сохранения пачки записей в одной транзакции
+        """
+        try:
+            async with self.provider.db_session() as session:
+                await session.execute(
+                    insert(Log).values([
+                        {'timestamp': entry.timestamp, 'message': entry.message}
+                        for entry in entries
+                    ])
+                )
+                await session.commit()
+        except Exception:
+            logger.exception(f"Was not able to write {len(entries)} logs to DB: {[entry.message for entry in entries]}")
@@ -1,24 +1,29 @@
 import asyncio
 from loguru import logger
 
-from utils.custom_types import BotStatusEnum
-
 from bot.application_builder import BBApplicationBuilder
 from bot.application import BBApplication
 
-from bot.map_handlers import (
-    map_service_mode_handlers,
-    map_default_handlers
-)
+from bot.map_handlers import map_handlers_by_bot_status
 
 from bot.handlers.default import error_handler
+from bot.webhook import run_webhook
+from bot.sharding import run_sharded
 
 if __name__ == '__main__':
     logger.info("Starting...")
     
-    app: BBApplication = BBApplicationBuilder() \
-        .concurrent_updates(True) \
-        .build()
+    app: BBApplication = BBApplicationBuilder().build()
+
+    if app.provider.config.webhook.enabled and not app.provider.config.webhook.url:
+        logger.error("Webhook is enabled but its url is not set... exiting!")
+        exit(1)
+
+    if app.provider.config.sharding.workers > 1:
+        logger.info(f"Running with {app.provider.config.sharding.workers} workers sharded by chat...")
+        run_sharded(app.provider.config)
+        logger.info("Done! Have a greate day!")
+        exit(0)
     
     app.add_error_handler(error_handler)
 
@@ -26,23 +31,13 @@ if __name__ == '__main__':
     loop = asyncio.new_event_loop()
     loop.run_until_complete(app.update_bot_status())
 
-    if app.status == BotStatusEnum.OFF:
-        logger.warning("Bot should be OFF... so exiting... Bye!")
-        exit(0)
-    elif app.status == BotStatusEnum.SERVICE:
-        logger.warning("Bot should be run in service mode... so settings only service mode handlers")
-        map_service_mode_handlers(app)
-    elif app.status in [BotStatusEnum.RESTART, BotStatusEnum.RESTARTING]:
-        logger.success("Bot is starting afer restart... continuing to init with default handlers")
-        map_default_handlers(app)
-    elif app.status == BotStatusEnum.ON:
-        logger.success("Bot is on! So continuing with default handlers...")
-        map_default_handlers(app)
-    else:
-        logger.error("Unknown state... exiting!")
-        exit(1)
+    map_handlers_by_bot_status(app)
     
     asyncio.set_event_loop(loop)
-    app.run_polling()
+    if app.provider.config.webhook.enabled:
+        logger.info("Receiving updates over webhook...")
+        loop.run_until_complete(run_webhook(app))
+    else:
+        app.run_polling(allowed_updates=app.ALLOWED_UPDATES)
 
     logger.info("Done! Have a greate day!")
\ No newline at end of file
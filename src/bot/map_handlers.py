@@ -12,6 +12,8 @@ from telegram.ext.filters import (
 
 from loguru import logger
 
+from utils.custom_types import BotStatusEnum
+
 from bot.application import BBApplication
 
 from bot.handlers.default import (
@@ -48,7 +50,7 @@ def map_service_mode_handlers(app: BBApplication) -> None:
     """
     Добавить обработчик сообщений в сервисном режиме бота
     """
-    app.add_handler(MessageHandler(ChatType.PRIVATE | ChatType.GROUPS, service_mode_handler, block=False))
+    app.add_handler(MessageHandler(ChatType.PRIVATE | ChatType.GROUPS, service_mode_handler))
 
 def map_default_handlers(app: BBApplication) -> None:
     """
@@ -58,7 +60,7 @@ def map_default_handlers(app: BBApplication) -> None:
     # Chat member handlers
     ##
     app.add_handler(
-        ChatMemberHandler(chat_member_handler, chat_member_types=ChatMemberHandler.MY_CHAT_MEMBER, block=False),
+        ChatMemberHandler(chat_member_handler, chat_member_types=ChatMemberHandler.MY_CHAT_MEMBER),
         group=app.UPDATE_GROUP_CHAT_MEMBER
     )
 
@@ -66,7 +68,7 @@ def map_default_handlers(app: BBApplication) -> None:
     # Default user handlers
     ##
     app.add_handler(
-        MessageHandler(UpdateType.EDITED, eddited_handler, block=False),
+        MessageHandler(UpdateType.EDITED, eddited_handler),
         group=app.UPDATE_GROUP_USER_REQUEST
     )
 
@@ -74,30 +76,52 @@ def map_default_handlers(app: BBApplication) -> None:
     # Group handlers
     ##
     app.add_handlers([
-        CommandHandler(app.HELP_COMMAND,   group_help_handler, filters=ChatType.GROUPS, block=False),
-        CommandHandler(app.REPORT_COMMAND, group_report_handler, filters=ChatType.GROUPS, block=False),
+        CommandHandler(app.HELP_COMMAND,   group_help_handler, filters=ChatType.GROUPS),
+        CommandHandler(app.REPORT_COMMAND, group_report_handler, filters=ChatType.GROUPS),
     ], group=app.UPDATE_GROUP_GROUP_REQUEST)
 
     ##
     # User handlers
     ##
     app.add_handlers([
-        CommandHandler(app.START_COMMAND, user_start_help_handler, filters=ChatType.PRIVATE, block=False),
-        CommandHandler(app.HELP_COMMAND,  user_start_help_handler, filters=ChatType.PRIVATE, block=False),
+        CommandHandler(app.START_COMMAND, user_start_help_handler, filters=ChatType.PRIVATE),
+        CommandHandler(app.HELP_COMMAND,  user_start_help_handler, filters=ChatType.PRIVATE),
     ], group=app.UPDATE_GROUP_USER_REQUEST)
 
     app.add_handlers([
-        MessageHandler(ChatType.PRIVATE & TEXT,                                user_message_text_handler,           block=False),
-        MessageHandler(ChatType.PRIVATE & (PHOTO|Document.IMAGE|Document.ZIP), user_message_photo_document_handler, block=False),
+        MessageHandler(ChatType.PRIVATE & TEXT,                                user_message_text_handler),
+        MessageHandler(ChatType.PRIVATE & (PHOTO|Document.IMAGE|Document.ZIP), user_message_photo_document_handler),
     ], group=app.UPDATE_GROUP_USER_REQUEST)
 
     app.add_handlers([
-        CallbackQueryHandler(user_change_state_callback,    pattern=UserChangeFieldCallback.PATTERN,         block=False),
-        CallbackQueryHandler(branch_start_callback_handler, pattern=UserStartBranchReplyCallback.PATTERN,    block=False),
-        CallbackQueryHandler(full_text_callback_handler,    pattern=UserFullTextAnswerReplyCallback.PATTERN, block=False),
-        CallbackQueryHandler(fast_answer_callback_handler,  pattern=UserFastAnswerReplyCallback.PATTERN,     block=False),
+        CallbackQueryHandler(user_change_state_callback,    pattern=UserChangeFieldCallback.PATTERN),
+        CallbackQueryHandler(branch_start_callback_handler, pattern=UserStartBranchReplyCallback.PATTERN),
+        CallbackQueryHandler(full_text_callback_handler,    pattern=UserFullTextAnswerReplyCallback.PATTERN),
+        CallbackQueryHandler(fast_answer_callback_handler,  pattern=UserFastAnswerReplyCallback.PATTERN),
     ], group=app.UPDATE_GROUP_USER_REQUEST)
 
     app.job_queue.run_once(notify_job, when=1)
     app.job_queue.run_repeating(notify_job, interval=10)
     logger.info("Starting notify job")
+
+def map_handlers_by_bot_status(app: BBApplication) -> None:
+    """
+    Добавить обработчики согласно уже полученному статусу бота
+
+    Завершает процесс, если бот не должен запускаться
+    """
+    if app.status == BotStatusEnum.OFF:
+        logger.warning("Bot should be OFF... so exiting... Bye!")
+        exit(0)
+    elif app.status == BotStatusEnum.SERVICE:
+        logger.warning("Bot should be run in service mode... so settings only service mode handlers")
+        map_service_mode_handlers(app)
+    elif app.status in [BotStatusEnum.RESTART, BotStatusEnum.RESTARTING]:
+        logger.success("Bot is starting afer restart... continuing to init with default handlers")
+        map_default_handlers(app)
+    elif app.status == BotStatusEnum.ON:
+        logger.success("Bot is on! So continuing with default handlers...")
+        map_default_handlers(app)
+    else:
+        logger.error("Unknown state... exiting!")
+        exit(1)
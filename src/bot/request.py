@@ -0,0 +1,40 @@
+from time import perf_counter
+from typing import Optional, Tuple
+
+from telegram.error import TimedOut, NetworkError
+from telegram.request import HTTPXRequest, RequestData
+
+from utils.metrics import metrics
+
+BOT_API_REQUEST_DURATION = metrics.histogram(
+    'bot_api_request_duration_seconds', 'Длительность запросов к Telegram Bot API', ('method',)
+)
+BOT_API_RESPONSES = metrics.counter(
+    'bot_api_responses_total', 'Ответы Telegram Bot API по кодам HTTP и ошибкам сети', ('method', 'code')
+)
+
+class BBRequest(HTTPXRequest):
+    """
+    Запросы к Telegram Bot API с учётом длительности и кодов ответов в метриках
+    """
+
+    async def do_request(
+            self, url: str, method: str,
+            request_data: Optional[RequestData] = None,
+            *args, **kwargs
+        ) -> Tuple[int, bytes]:
+        api_method = url.rsplit('/', 1)[-1]
+        started = perf_counter()
+        try:
+            code, payload = await super().do_request(url, method, request_data, *args, **kwargs)
+        except TimedOut:
+            BOT_API_RESPONSES.inc(method=api_method, code='timeout')
+            raise
+        except NetworkError:
+            BOT_API_RESPONSES.inc(method=api_method, code='network_error')
+            raise
+        finally:
+            BOT_API_REQUEST_DURATION.observe(perf_counter() - started, method=api_method)
+
+        BOT_API_RESPONSES.inc(method=api_method, code=str(code))
+        return code, payload
@@ -0,0 +1,282 @@
+import hmac
+import json
+import asyncio
+import signal
+import secrets
+import multiprocessing
+from multiprocessing.process import BaseProcess
+
+import httpx
+import uvicorn
+from fastapi import FastAPI, Request, Response
+
+from loguru import logger
+
+from utils.config_model import ConfigYaml
+
+from bot.application import BBApplication
+from bot.application_builder import BBApplicationBuilder
+from bot.map_handlers import map_handlers_by_bot_status
+from bot.handlers.default import error_handler
+from bot.webhook import SECRET_TOKEN_HEADER, serve_updates
+
+TELEGRAM_API_URL = 'https://api.telegram.org/bot'
+"""Адрес Telegram Bot API, к которому обращается входной процесс"""
+
+WORKER_UPDATES_PATH = '/updates'
+"""Путь, на котором процессы обработки принимают обновления от входного процесса"""
+
+POLLING_TIMEOUT = 50
+"""Время длинного опроса обновлений входным процессом в секундах"""
+
+FORWARD_RETRY_INTERVAL = 0.5
+"""Пауза перед повторной передачей обновления в недоступный процесс обработки в секундах"""
+
+WORKERS_CHECK_INTERVAL = 1.0
+"""Интервал проверки работы процессов обработки в секундах"""
+
+def get_update_chat_id(update_json: dict) -> int|None:
+    """
+    Получить ИД чата из необработанного обновления, не разбирая его полностью
+    """
+    for update_type in BBApplication.ALLOWED_UPDATES:
+        update_object = update_json.get(update_type)
+        if not isinstance(update_object, dict):
+            continue
+        if isinstance(update_object.get('chat'), dict):
+            return update_object['chat'].get('id')
+        if isinstance(update_object.get('message'), dict) and isinstance(update_object['message'].get('chat'), dict):
+            return update_object['message']['chat'].get('id')
+        if isinstance(update_object.get('from'), dict):
+            return update_object['from'].get('id')
+    return None
+
+class ShardRouter:
+    """
+    Передача обновлений в процессы обработки по остатку от деления ИД чата
+
+    Обновления одного чата всегда попадают в один процесс и передаются в нём по порядку получения
+    """
+
+    def __init__(self, workers_urls: list[str], secret_token: str, queue_size: int) -> None:
+        self._workers_urls = workers_urls
+        self._secret_token = secret_token
+        self._queues: list[asyncio.Queue[dict]] = [asyncio.Queue(queue_size) for _ in workers_urls]
+        self._client: httpx.AsyncClient | None = None
+        self._forward_tasks: list[asyncio.Task] = []
+
+    def get_shard(self, update_json: dict) -> int:
+        chat_id = get_update_chat_id(update_json)
+        return chat_id % len(self._workers_urls) if isinstance(chat_id, int) else 0
+
+    async def route(self, update_json: dict) -> None:
+        """
+        Поставить обновление в очередь передачи процессу обработки его чата
+        """
+        await self._queues[self.get_shard(update_json)].put(update_json)
+
+    async def _forward(self, shard: int) -> None:
+        """
+        Внутренняя задача последовательной передачи обновлений одному процессу обработки
+        """
+        queue = self._queues[shard]
+        url   = self._workers_urls[shard]
+        while True:
+            update_json = await queue.get()
+            while True:
+                try:
+                    response = await self._client.post(url, json=update_json, headers={SECRET_TOKEN_HEADER: self._secret_token})
+                except httpx.HTTPError as err:
+                    logger.warning(f"Could not forward update to worker {shard=}: {err}... retrying")
+                    await asyncio.sleep(FORWARD_RETRY_INTERVAL)
+                    continue
+                if response.status_code >= 500:
+                    logger.warning(f"Worker {shard=} answered {response.status_code=}... retrying")
+                    await asyncio.sleep(FORWARD_RETRY_INTERVAL)
+                    continue
+                if response.status_code != 200:
+                    logger.error(f"Worker {shard=} rejected update {update_json.get('update_id')} with {response.status_code=}")
+                break
+
+    async def start(self) -> None:
+        self._client = httpx.AsyncClient(timeout=httpx.Timeout(30.0, connect=5.0))
+        self._forward_tasks = [asyncio.create_task(self._forward(shard)) for shard in range(len(self._workers_urls))]
+
+    async def stop(self) -> None:
+        for task in self._forward_tasks:
+            task.cancel()
+        await asyncio.gather(*self._forward_tasks, return_exceptions=True)
+        if self._client:
+            await self._client.aclose()
+
+async def _call_bot_api(client: httpx.AsyncClient, config: ConfigYaml, method: str, **params) -> object:
+    """
+    Внутренняя функция вызова метода Telegram Bot API с возвратом необработанного результата
+    """
+    response = await client.post(f"{TELEGRAM_API_URL}{config.tg_token}/{method}", json=params)
+    payload = response.json()
+    if not payload.get('ok'):
+        raise RuntimeError(f"Bot API method {method} failed: {payload.get('description')}")
+    return payload['result']
+
+async def _run_ingress_polling(config: ConfigYaml, router: ShardRouter, client: httpx.AsyncClient) -> None:
+    """
+    Внутренняя функция получения обновлений длинным опросом и передачи их процессам обработки
+    """
+    await _call_bot_api(client, config, 'deleteWebhook')
+    logger.info("Polling updates for workers...")
+
+    offset = None
+    while True:
+        try:
+            updates = await _call_bot_api(
+                client, config, 'getUpdates',
+                offset = offset, timeout = POLLING_TIMEOUT,
+                allowed_updates = BBApplication.ALLOWED_UPDATES
+            )
+        except (httpx.HTTPError, ValueError, RuntimeError) as err:
+            logger.warning(f"Could not get updates: {err}... retrying")
+            await asyncio.sleep(1)
+            continue
+
+        for update_json in updates:
+            await router.route(update_json)
+            offset = update_json['update_id'] + 1
+
+async def _run_ingress_webhook(config: ConfigYaml, router: ShardRouter, client: httpx.AsyncClient) -> None:
+    """
+    Внутренняя функция приёма обновлений через webhook и передачи их процессам обработки
+    """
+    webhook = config.webhook
+    secret_token = webhook.secret_token.get_secret_value() if webhook.secret_token else None
+    allowed_updates = set(BBApplication.ALLOWED_UPDATES)
+
+    ingress_app = FastAPI(openapi_url=None, docs_url=None, redoc_url=None)
+
+    @ingress_app.post(webhook.path)
+    async def ingress(request: Request) -> Response:
+        if secret_token and not hmac.compare_digest(request.headers.get(SECRET_TOKEN_HEADER, ''), secret_token):
+            return Response(status_code=403)
+        try:
+            update_json = json.loads(await request.body())
+        except ValueError:
+            return Response(status_code=400)
+        if isinstance(update_json, dict) and not allowed_updates.isdisjoint(update_json.keys()):
+            await router.route(update_json)
+        return Response(status_code=200)
+
+    await _call_bot_api(
+        client, config, 'setWebhook',
+        url = webhook.url,
+        allowed_updates = BBApplication.ALLOWED_UPDATES,
+        max_connections = webhook.max_connections,
+        **({'secret_token': secret_token} if secret_token else {})
+    )
+    logger.info(f"Set webhook to {webhook.url}, routing updates to workers")
+
+    server = uvicorn.Server(uvicorn.Config(ingress_app, host=webhook.listen, port=webhook.port, log_level='warning'))
+    await server.serve()
+
+async def _watch_workers(processes: list[BaseProcess]) -> None:
+    """
+    Внутренняя функция ожидания завершения любого из процессов обработки
+    """
+    while all(process.is_alive() for process in processes):
+        await asyncio.sleep(WORKERS_CHECK_INTERVAL)
+    for process in processes:
+        if not process.is_alive():
+            logger.warning(f"Worker {process.name} exited with {process.exitcode=}... stopping all workers")
+
+async def _run_ingress(config: ConfigYaml, processes: list[BaseProcess], secret_token: str) -> None:
+    """
+    Внутренняя функция работы входного процесса до завершения любого процесса обработки
+    """
+    sharding = config.sharding
+    router = ShardRouter(
+        [f"http://{sharding.workers_host}:{sharding.workers_port + idx}{WORKER_UPDATES_PATH}" for idx in range(sharding.workers)],
+        secret_token, sharding.queue_size
+    )
+    await router.start()
+
+    async with httpx.AsyncClient(timeout=httpx.Timeout(POLLING_TIMEOUT + 10, connect=10.0)) as client:
+        ingress = asyncio.create_task(
+            _run_ingress_webhook(config, router, client) if config.webhook.enabled
+            else _run_ingress_polling(config, router, client)
+        )
+        watch = asyncio.create_task(_watch_workers(processes))
+        try:
+            done, _ = await asyncio.wait([ingress, watch], return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                task.result()
+        finally:
+            for task in (ingress, watch):
+                task.cancel()
+            await asyncio.gather(ingress, watch, return_exceptions=True)
+            await router.stop()
+
+def _run_worker(idx: int, secret_token: str) -> None:
+    """
+    Внутренняя функция процесса обработки: отдельное приложение бота со своим пулом соединений,
+    принимающее обновления от входного процесса
+    """
+    logger.info(f"Starting worker {idx}...")
+
+    app: BBApplication = BBApplicationBuilder().build()
+    app.add_error_handler(error_handler)
+
+    # Каждый процесс обработки выдаёт свои метрики на своём порту
+    metrics_config = app.provider.config.metrics
+    metrics_config.port = metrics_config.port + idx
+
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+    loop.run_until_complete(app.update_bot_status())
+    map_handlers_by_bot_status(app)
+
+    sharding = app.provider.config.sharding
+    loop.run_until_complete(serve_updates(
+        app,
+        listen       = sharding.workers_host,
+        port         = sharding.workers_port + idx,
+        path         = WORKER_UPDATES_PATH,
+        secret_token = secret_token
+    ))
+
+def _exit_on_signal(signum: int, _frame) -> None:
+    """
+    Внутренняя функция завершения входного процесса по сигналу с остановкой процессов обработки
+    """
+    logger.warning(f"Got signal {signum=}... stopping workers")
+    raise SystemExit(0)
+
+def run_sharded(config: ConfigYaml) -> None:
+    """
+    Запустить бота несколькими процессами обработки с входным процессом, распределяющим обновления по ИД чата
+
+    Периодические задачи выполняет один из процессов, удерживающий блокировку в БД.
+    При завершении любого процесса обработки останавливаются все процессы
+    """
+    signal.signal(signal.SIGTERM, _exit_on_signal)
+
+    # Секрет передачи обновлений процессам обработки, новый при каждом запуске
+    secret_token = secrets.token_urlsafe(32)
+
+    context = multiprocessing.get_context('spawn')
+    processes = [
+        context.Process(target=_run_worker, args=(idx, secret_token), name=f"box-bot-worker-{idx}")
+        for idx in range(config.sharding.workers)
+    ]
+    for process in processes:
+        process.start()
+    logger.info(f"Started {len(processes)} workers")
+
+    try:
+        asyncio.run(_run_ingress(config, processes, secret_token))
+    except (KeyboardInterrupt, SystemExit):
+        pass
+    finally:
+        for process in processes:
+            if process.is_alive():
+                process.terminate()
+        for process in processes:
+            process.join()
@@ -0,0 +1,58 @@
+import asyncio
+from typing import Any, Awaitable
+
+from telegram import Update
+from telegram.ext import BaseUpdateProcessor
+
+class ChatOrderedUpdateProcessor(BaseUpdateProcessor):
+    """
+    Обработка обновлений разных чатов параллельно, а обновлений одного чата - строго по очереди их получения
+
+    * max_concurrent_updates - максимум одновременно обрабатываемых обновлений
+    * max_pending_updates - максимум принятых обновлений, включая ожидающие своей очереди в чате,
+    сверх которого новые обновления не забираются из очереди приложения
+    """
+
+    def __init__(self, max_concurrent_updates: int, max_pending_updates: int) -> None:
+        super().__init__(max(max_pending_updates, max_concurrent_updates))
+        self._running_semaphore = asyncio.Semaphore(max_concurrent_updates)
+        self._chats_locks: dict[int, asyncio.Lock] = {}
+        self._chats_pending: dict[int, int] = {}
+
+    @staticmethod
+    def _get_chat_id(update: object) -> int|None:
+        """
+        Внутренняя функция получения ИД чата, в порядке которого обрабатывается обновление
+        """
+        if not isinstance(update, Update):
+            return None
+        if update.effective_chat:
+            return update.effective_chat.id
+        if update.effective_user:
+            return update.effective_user.id
+        return None
+
+    async def do_process_update(self, update: object, coroutine: Awaitable[Any]) -> None:
+        chat_id = self._get_chat_id(update)
+        if chat_id is None:
+            async with self._running_semaphore:
+                await coroutine
+            return
+
+        chat_lock = self._chats_locks.setdefault(chat_id, asyncio.Lock())
+        self._chats_pending[chat_id] = self._chats_pending.get(chat_id, 0) + 1
+        try:
+            async with chat_lock:
+                async with self._running_semaphore:
+                    await coroutine
+        finally:
+            self._chats_pending[chat_id] -= 1
+            if not self._chats_pending[chat_id]:
+                del self._chats_pending[chat_id]
+                del self._chats_locks[chat_id]
+
+    async def initialize(self) -> None:
+        pass
+
+    async def shutdown(self) -> None:
+        pass
@@ -0,0 +1,95 @@
+import hmac
+
+import uvicorn
+from fastapi import FastAPI, Request, Response
+from telegram import Update
+
+from loguru import logger
+
+from bot.application import BBApplication
+
+SECRET_TOKEN_HEADER = 'X-Telegram-Bot-Api-Secret-Token'
+"""Заголовок, в котором telegram передаёт секрет webhook"""
+
+def create_webhook_app(app: BBApplication, path: str, secret_token: str|None) -> FastAPI:
+    """
+    Создать HTTP приложение, передающее обновления из webhook в очередь обновлений бота
+
+    Обновления без обрабатываемых ботом типов отбрасываются до разбора
+    """
+    allowed_updates = set(BBApplication.ALLOWED_UPDATES)
+
+    webhook_app = FastAPI(openapi_url=None, docs_url=None, redoc_url=None)
+
+    @webhook_app.post(path)
+    async def webhook(request: Request) -> Response:
+        if secret_token and not hmac.compare_digest(request.headers.get(SECRET_TOKEN_HEADER, ''), secret_token):
+            logger.warning(f"Got webhook request from {request.client.host if request.client else None} with wrong secret token")
+            return Response(status_code=403)
+
+        try:
+            update_json = await request.json()
+        except ValueError:
+            return Response(status_code=400)
+
+        if not isinstance(update_json, dict) or allowed_updates.isdisjoint(update_json.keys()):
+            return Response(status_code=200)
+
+        await app.update_queue.put(Update.de_json(update_json, app.bot))
+        return Response(status_code=200)
+
+    return webhook_app
+
+async def serve_updates(
+        app: BBApplication,
+        listen: str, port: int, path: str,
+        secret_token: str|None,
+        webhook_url: str|None = None
+    ) -> None:
+    """
+    Запустить бота с получением обновлений по HTTP
+
+    Повторяет жизненный цикл `run_polling`: инициализация, `post_init`, обработка до остановки сервера и `post_stop`.
+    Если передан `webhook_url`, он устанавливается как webhook бота в telegram
+    """
+    async with app:
+        if app.post_init:
+            await app.post_init(app)
+
+        if webhook_url:
+            await app.bot.set_webhook(
+                url             = webhook_url,
+                allowed_updates = BBApplication.ALLOWED_UPDATES,
+                secret_token    = secret_token,
+                max_connections = app.provider.config.webhook.max_connections
+            )
+            logger.info(f"Set webhook to {webhook_url} with {BBApplication.ALLOWED_UPDATES=}")
+
+        await app.start()
+        try:
+            server = uvicorn.Server(uvicorn.Config(
+                create_webhook_app(app, path, secret_token),
+                host      = listen,
+                port      = port,
+                log_level = 'warning'
+            ))
+            logger.info(f"Listening for updates on {listen}:{port}{path}")
+            await server.serve()
+        finally:
+            await app.stop()
+            if app.post_stop:
+                await app.post_stop(app)
+
+async def run_webhook(app: BBApplication) -> None:
+    """
+    Запустить бота с получением обновлений через webhook согласно конфигурации
+    """
+    config = app.provider.config.webhook
+    await serve_updates(
+        app,
+        listen       = config.listen,
+        port         = config.port,
+        path         = config.path,
+        secret_token = config.secret_token.get_secret_value() if config.secret_token else None,
+        webhook_url  = config.url
+    )
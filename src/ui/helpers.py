@@ -108,6 +108,7 @@ async def try_to_save_attrs(db_type: type[Base], db_attrs: dict[str|int, dict[st
                     .where(db_type.id == idx)
                     .values(**db_attr)
                 )
+        await provider.notify_changed(session, db_type)
         try:
             await session.commit()
             logger.success(f"Updated {db_type.__name__} table...")
@@ -116,4 +117,4 @@ async def try_to_save_attrs(db_type: type[Base], db_attrs: dict[str|int, dict[st
             logger.error(err)
             await session.rollback()
             logger.error(f"Did not updated {db_type.__name__} table...")
-            return JSONResponse({'error': True}, status_code=500)
\ No newline at end of file
+            return JSONResponse({'error': True}, status_code=500)
@@ -4,18 +4,25 @@ from fastapi.responses import (
     HTMLResponse,
     RedirectResponse,
     JSONResponse,
-    StreamingResponse
+    StreamingResponse,
+    FileResponse
+)
+from starlette.background import BackgroundTask
+from starlette.status import (
+    HTTP_206_PARTIAL_CONTENT,
+    HTTP_302_FOUND,
+    HTTP_304_NOT_MODIFIED,
+    HTTP_404_NOT_FOUND,
+    HTTP_416_REQUESTED_RANGE_NOT_SATISFIABLE
 )
-from starlette.status import HTTP_302_FOUND, HTTP_404_NOT_FOUND
 from typing import Annotated
 
-import io
+import os
 import base64
-import pandas as pd
 from datetime import datetime
-from xlsxwriter.worksheet import Worksheet
 
 from sqlalchemy import select, update, insert
+from sqlalchemy.dialects.postgresql import insert as pg_insert
 from sqlalchemy.exc import IntegrityError
 
 from loguru import logger
@@ -52,6 +59,8 @@ from ui.helpers import (
     prepare_attrs_object_from_request,
     try_to_save_attrs
 )
+from ui.users_report import write_users_report_xlsx
+from ui.users_page import USERS_PAGE_SIZE, get_users_page
 
 prefix_router = APIRouter(prefix = provider.config.path_prefix, dependencies = [Depends(verify_token)])
 
@@ -104,6 +113,8 @@ async def status(action: str) -> JSONResponse:
             logger.error("Found unknown bot status...")
             return JSONResponse({'error': True}, status_code=500)
 
+        await provider.notify_changed(session, BotStatus)
+
         try:
             await session.commit()
             logger.success("Set BotStatus table...")
@@ -134,9 +145,14 @@ async def users() -> RedirectResponse:
     return RedirectResponse(url=f"{provider.config.path_prefix}/users/branch/{first_field_branch_id}", status_code=HTTP_302_FOUND)
 
 @prefix_router.get("/users/branch/{branch_id}", tags=["users"])
-async def users(branch_id: int, request: Request, user: Annotated[UIUser, Depends(verify_token)]) -> HTMLResponse:
+async def users(
+        branch_id: int, request: Request, user: Annotated[UIUser, Depends(verify_token)],
+        sort: str = 'id', desc: bool = False, cursor: str|None = None,
+        filter_field_id: int|None = None, filter_value: str|None = None,
+        page_size: int = USERS_PAGE_SIZE
+    ) -> HTMLResponse:
     """
-    Показывает пользователей
+    Показывает страницу пользователей с данными полей выбранной ветки
     """
     async with provider.db_session() as session:
         curr_field_branch_selected = await session.execute(
@@ -149,10 +165,6 @@ async def users(branch_id: int, request: Request, user: Annotated[UIUser, Depend
             select(Field).where(Field.branch_id == branch_id)
             .order_by(Field.order_place.asc())
         )
-        users_selected = await session.execute(
-            select(User)
-            .order_by(User.id.asc())
-        )
 
         curr_field_branch = curr_field_branch_selected.scalar_one_or_none()
         if not curr_field_branch:
@@ -160,7 +172,14 @@ async def users(branch_id: int, request: Request, user: Annotated[UIUser, Depend
         
         field_branches    = list(field_branches_selected.scalars().all())
         fields            = list(fields_selected.scalars().all())
-        users = [ user.prepare() for user in users_selected.scalars() ]
+        filter_field      = next((field for field in fields if field.id == filter_field_id), None)
+
+        users_page = await get_users_page(
+            session, fields,
+            sort=sort, descending=desc, cursor=cursor,
+            filter_field=filter_field, filter_value=filter_value,
+            page_size=page_size
+        )
 
         return template(
             request=request, user=user, template_name="users.j2.html",
@@ -169,7 +188,13 @@ async def users(branch_id: int, request: Request, user: Annotated[UIUser, Depend
                 'curr_field_branch': curr_field_branch,
                 'field_branches':    field_branches,
                 'fields':            fields,
-                'users':             users
+                'users':             users_page.users,
+                'next_cursor':       users_page.next_cursor,
+                'sort':              sort,
+                'desc':              desc,
+                'filter_field':      filter_field,
+                'filter_value':      filter_value if filter_field else None,
+                'page_size':         page_size
             }
         )
 
@@ -184,59 +209,53 @@ async def users(branch_id: int, request: Request) -> HTMLResponse:
 
     logger.info(f"Got fields update request on branch {branch_id=} with {request_data=}")
 
-    async with provider.db_session() as session:
-        for user_id, fields_dict in request_data.items():
-            if not user_id.isnumeric():
-                message = f"User id {user_id=} is not numeric"
+    values: dict[tuple[int, int], str] = {}
+    for user_id, fields_dict in request_data.items():
+        if not user_id.isnumeric():
+            message = f"User id {user_id=} is not numeric"
+            logger.warning(message)
+            return JSONResponse({'error': True, 'message': message}, status_code=500)
+        user_id = int(user_id)
+
+        fields_request: dict[str, dict[str, str]] = fields_dict['fields']
+        if not isinstance(fields_request, dict):
+            message = f"Fields request {fields_request=} is not dict"
+            logger.warning(message)
+            return JSONResponse({'error': True, 'message': message}, status_code=500)
+
+        for field_id, field_value in fields_request.items():
+            if not field_id.isnumeric():
+                message = f"Field id {field_id=} is not numeric"
                 logger.warning(message)
                 return JSONResponse({'error': True, 'message': message}, status_code=500)
-            user_id = int(user_id)
+            field_id = int(field_id)
 
-            fields_request: dict[str, dict[str, str]] = fields_dict['fields']
-            if not isinstance(fields_request, dict):
-                message = f"Fields request {fields_request=} is not dict"
+            if not isinstance(field_value, dict):
+                message = f"Field value {field_value=} is not dict"
                 logger.warning(message)
                 return JSONResponse({'error': True, 'message': message}, status_code=500)
 
-            for field_id, field_value in fields_request.items():
-                if not field_id.isnumeric():
-                    message = f"Field id {field_id=} is not numeric"
-                    logger.warning(message)
-                    return JSONResponse({'error': True, 'message': message}, status_code=500)
-                field_id = int(field_id)
-
-                if not isinstance(field_value, dict):
-                    message = f"Field value {field_value=} is not dict"
-                    logger.warning(message)
-                    return JSONResponse({'error': True, 'message': message}, status_code=500)
-
-                if 'value' not in field_value:
-                    message = f"Value not in field value {field_value=}"
-                    logger.warning(message)
-                    return JSONResponse({'error': True, 'message': message}, status_code=500)
-                value = field_value['value']
-
-                updated = await session.execute(
-                    update(UserFieldValue)
-                    .where(
-                        (UserFieldValue.user_id  == user_id) &
-                        (UserFieldValue.field_id == field_id)
-                    )
-                    .values(value = value)
+            if 'value' not in field_value:
+                message = f"Value not in field value {field_value=}"
+                logger.warning(message)
+                return JSONResponse({'error': True, 'message': message}, status_code=500)
+            values[(user_id, field_id)] = field_value['value']
+
+    if values:
+        async with provider.db_session() as session:
+            inserted = pg_insert(UserFieldValue).values([
+                {'user_id': user_id, 'field_id': field_id, 'value': value}
+                for (user_id, field_id), value in values.items()
+            ])
+            await session.execute(
+                inserted.on_conflict_do_update(
+                    index_elements = [UserFieldValue.user_id, UserFieldValue.field_id],
+                    set_ = {'value': inserted.excluded.value, 'telegram_file_id': None}
                 )
+            )
+            await session.commit()
 
-                if updated.rowcount == 0:
-                    await session.execute(
-                        insert(UserFieldValue)
-                        .values(
-                            user_id  = user_id,
-                            field_id = field_id,
-                            value    = value
-                        )
-                    )
-        
-        await session.commit()
-        return JSONResponse({'error': False}, status_code=200)
+    return JSONResponse({'error': False}, status_code=200)
 
 @prefix_router.get("/users/report/xslx", tags=["users"])
 async def users(request: Request) -> Response:
@@ -246,45 +265,17 @@ async def users(request: Request) -> Response:
     logger.info("Starting prepare of users full report")
 
     async with provider.db_session() as session:
-        users_selected = await session.execute(
-            select(User)
-            .order_by(User.id.asc())
+        report_path = await write_users_report_xlsx(
+            session, provider.config.i18n.download_users_report, provider.config.i18n
         )
-        users_df = pd.DataFrame([
-            user.to_plain_dict(i18n=provider.config.i18n)
-            for user in users_selected.scalars()
-        ])
-
-        logger.debug(f"Users df:\n{users_df}")
-        
-        filename = f"{datetime.now().strftime('%Y_%m_%d__%H_%M_%S')}__{provider.config.path_prefix.replace('/', '')}_report.xlsx"
-        headers = {
-            'Content-Type': 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
-            'Content-Disposition': f'attachment; filename="{filename}"'
-        }
 
-        sheet_name = provider.config.i18n.download_users_report
-        
-        report_bio = io.BytesIO()
-        with pd.ExcelWriter(report_bio) as writer:
-            users_df.to_excel(writer, startrow=0, merge_cells=False, sheet_name=sheet_name, index=False)
-
-            worksheet: Worksheet = writer.sheets[sheet_name]
-            row_count    = len(users_df.index)
-            column_count = len(users_df.columns)
-            
-            worksheet.autofilter(0, 0, row_count-1, column_count-1)  
-            
-            for idx, col in enumerate(users_df):
-                series = users_df[col]
-                max_len = max((
-                    series.astype(str).map(len).max(),
-                    len(str(series.name))
-                    )) + 5
-                worksheet.set_column(idx, idx, max_len)
-
-        report_bio.seek(0)
-        return StreamingResponse(report_bio, headers=headers, media_type=headers['Content-Type'])
+    filename = f"{datetime.now().strftime('%Y_%m_%d__%H_%M_%S')}__{provider.config.path_prefix.replace('/', '')}_report.xlsx"
+    return FileResponse(
+        report_path,
+        media_type='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
+        filename=filename,
+        background=BackgroundTask(os.remove, report_path)
+    )
 
 
 ####################################################################################################
@@ -305,16 +296,79 @@ async def minio(bucket: str, filename: str) -> Response:
         'mime':  content_type
     })
 
+def _parse_range_header(range_header: str|None, size: int) -> tuple[tuple[int, int]|None, bool]:
+    """
+    Внутренняя функция разбора заголовка `Range` для файла заданного размера
+
+    Возвращает включительный диапазон байт или `None` чтобы отдать файл целиком,
+    и признак выполнимости диапазона. Поддерживается только один диапазон `bytes=`,
+    остальные запросы обслуживаются целиком
+    """
+    if not range_header or not range_header.startswith('bytes=') or ',' in range_header:
+        return None, True
+
+    start_str, _, end_str = range_header.removeprefix('bytes=').strip().partition('-')
+    if not (start_str or end_str) or not all(part.isdigit() for part in (start_str, end_str) if part):
+        return None, True
+
+    if not start_str:
+        suffix = int(end_str)
+        if suffix == 0 or size == 0:
+            return None, False
+        return (max(size - suffix, 0), size - 1), True
+
+    start = int(start_str)
+    if end_str and int(end_str) < start:
+        return None, True
+    if start >= size:
+        return None, False
+    end = min(int(end_str), size - 1) if end_str else size - 1
+    return (start, end), True
+
 @prefix_router.get("/minio/{bucket}/{filename}", tags=["minio"])
-async def minio(bucket: str, filename: str) -> Response:
+async def minio(bucket: str, filename: str, request: Request) -> Response:
     """
-    Прокси к minio, который возвращает файл
+    Прокси к minio, который потоково возвращает файл с поддержкой `Range`, `Content-Length` и `ETag`
     """
-    bio, _ = await provider.minio.download(bucket, filename)
-    if not bio:
+    stat = await provider.minio.stat(bucket, filename)
+    if not stat:
         return JSONResponse({'error': True}, status_code=500)
-    bio.seek(0)
-    return StreamingResponse(bio)
+
+    headers = {
+        'Accept-Ranges': 'bytes',
+        'ETag':          f'"{stat.etag}"'
+    }
+    if request.headers.get('if-none-match') == headers['ETag']:
+        return Response(status_code=HTTP_304_NOT_MODIFIED, headers=headers)
+
+    byte_range, satisfiable = _parse_range_header(request.headers.get('range'), stat.size)
+    if not satisfiable:
+        return Response(
+            status_code=HTTP_416_REQUESTED_RANGE_NOT_SATISFIABLE,
+            headers=headers | {'Content-Range': f"bytes */{stat.size}"}
+        )
+
+    if_range = request.headers.get('if-range')
+    if byte_range and if_range and if_range != headers['ETag']:
+        byte_range = None
+
+    if not byte_range:
+        return StreamingResponse(
+            provider.minio.stream(bucket, filename),
+            media_type=stat.content_type,
+            headers=headers | {'Content-Length': str(stat.size)}
+        )
+
+    start, end = byte_range
+    return StreamingResponse(
+        provider.minio.stream(bucket, filename, offset=start, length=end - start + 1),
+        status_code=HTTP_206_PARTIAL_CONTENT,
+        media_type=stat.content_type,
+        headers=headers | {
+            'Content-Length': str(end - start + 1),
+            'Content-Range':  f"bytes {start}-{end}/{stat.size}"
+        }
+    )
 
 
 ####################################################################################################
@@ -708,6 +762,7 @@ async def settings(request: Request) -> JSONResponse:
         await session.execute(
             update(Settings).values(**settings_attrs)
         )
+        await provider.notify_changed(session, Settings)
 
         try:
             await session.commit()
@@ -66,10 +66,11 @@ provider = UIProvider()
 @asynccontextmanager
 async def lifespan(_: FastAPI):
     """
-    Асинхронная инциализация провайдера при старте приложения
+    Асинхронная инциализация провайдера при старте приложения и отписка от изменений при остановке
     """
     await provider.async_init()
     yield
+    await provider.stop_listening_changes()
 
 app = FastAPI(
     title        = "Box Bot Admin UI",
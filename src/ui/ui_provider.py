@@ -1,4 +1,4 @@
-from sqlalchemy import select, insert
+from sqlalchemy import select, insert, text
 from sqlalchemy.exc import IntegrityError
 
 from fastapi import Request
@@ -13,6 +13,7 @@ from utils.db_model import (
     BotStatus,
     FieldBranch,
     Field,
+    UserFieldValue
 )
 from utils.custom_types import (
     FieldBranchStatusEnum,
@@ -71,6 +72,10 @@ class UIProvider(BBProvider):
         async with self.db_engine.begin() as conn:
             await conn.run_sync(Base.metadata.create_all)
 
+        logger.info("Initializing UserFieldValues unique index and columns...")
+        await self._async_init_user_field_values_unique_index()
+        await self._async_init_user_field_values_columns()
+
         logger.info("Initializing BotStatus table...")
         await self._async_init_bot_status()
 
@@ -80,8 +85,41 @@ class UIProvider(BBProvider):
         logger.info("Initializing FieldBranches and Fields tables...")
         await self._async_init_fields()
 
+        logger.info("Subscribing to table changes...")
+        await self.listen_changes()
+
         logger.info("Done async initialize...")
     
+    async def _async_init_user_field_values_unique_index(self):
+        """
+        Внутренняя функция для создания уникального индекса значений полей в уже существующей таблице
+
+        Дубли значений, созданные до появления индекса, удаляются с сохранением последнего записанного
+        """
+        async with self.db_engine.begin() as conn:
+            deleted = await conn.execute(text(
+                f"DELETE FROM {UserFieldValue.__tablename__} older "
+                f"USING {UserFieldValue.__tablename__} newer "
+                "WHERE older.user_id = newer.user_id AND older.field_id = newer.field_id AND older.id < newer.id"
+            ))
+            if deleted.rowcount:
+                logger.warning(f"Deleted {deleted.rowcount} duplicated user field values")
+
+            await conn.execute(text(
+                "CREATE UNIQUE INDEX IF NOT EXISTS ix_user_field_values_user_id_field_id "
+                f"ON {UserFieldValue.__tablename__} (user_id, field_id)"
+            ))
+    
+    async def _async_init_user_field_values_columns(self):
+        """
+        Внутренняя функция для добавления новых столбцов значений полей в уже существующую таблицу
+        """
+        async with self.db_engine.begin() as conn:
+            await conn.execute(text(
+                f"ALTER TABLE {UserFieldValue.__tablename__} "
+                "ADD COLUMN IF NOT EXISTS telegram_file_id VARCHAR"
+            ))
+    
     async def _async_init_bot_status(self):
         """
         Внутренняя функция для инициализации статуса бота
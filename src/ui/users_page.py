@@ -0,0 +1,172 @@
+import json
+import base64
+from typing import Any, NamedTuple
+
+from sqlalchemy import select, func, tuple_, ColumnElement
+from sqlalchemy.orm import aliased
+from sqlalchemy.ext.asyncio.session import AsyncSession
+
+from utils.db_model import User, Field, UserFieldValue
+from utils.custom_types import UserDataPrepared, UserFieldDataPrepared
+
+USERS_PAGE_SIZE = 50
+"""Число пользователей на странице по умолчанию"""
+
+USERS_PAGE_MAX_SIZE = 500
+"""Максимальное число пользователей на странице"""
+
+USERS_SORTS = ('id', 'chat_id', 'username')
+"""Сортировки по данным пользователя, сортировка по полю задаётся как `fields-{id}`"""
+
+class UsersPage(NamedTuple):
+    """
+    Страница пользователей с данными полей одной ветки
+    """
+    users: list[UserDataPrepared]
+    next_cursor: str|None
+    """Курсор следующей страницы, `None` если страница последняя"""
+
+def encode_users_cursor(sort_value: Any, user_id: int) -> str:
+    """
+    Закодировать позицию последнего пользователя страницы в курсор
+    """
+    return base64.urlsafe_b64encode(json.dumps([sort_value, user_id]).encode()).decode()
+
+def _is_of_type(value: Any, value_type: type) -> bool:
+    """
+    Внутренняя функция проверки типа значения из JSON, булевы значения не считаются числами
+    """
+    return isinstance(value, value_type) and not isinstance(value, bool)
+
+def decode_users_cursor(cursor: str, sort_value_type: type = int) -> tuple[Any, int]|None:
+    """
+    Раскодировать курсор страницы, `None` при некорректном курсоре
+
+    * sort_value_type - тип значения текущей сортировки: курсор другой сортировки или подделанный курсор
+    считаются некорректными, а не доходят до сравнения в запросе
+    """
+    try:
+        sort_value, user_id = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+    except (ValueError, TypeError):
+        return None
+    if not _is_of_type(user_id, int) or not _is_of_type(sort_value, sort_value_type):
+        return None
+    return sort_value, user_id
+
+def _get_sort_column(sort: str, fields: list[Field]) -> ColumnElement|None:
+    """
+    Внутренняя функция получения выражения сортировки, `None` при неизвестной сортировке
+    """
+    if sort == 'id':
+        return User.id
+    if sort == 'chat_id':
+        return User.chat_id
+    if sort == 'username':
+        return func.coalesce(User.username, '')
+
+    fields_ids = {f"fields-{field.id}": field.id for field in fields}
+    if sort not in fields_ids:
+        return None
+    return func.coalesce(
+        select(UserFieldValue.value)
+        .where(
+            (UserFieldValue.user_id  == User.id) &
+            (UserFieldValue.field_id == fields_ids[sort])
+        )
+        .limit(1)
+        .scalar_subquery(),
+        ''
+    )
+
+async def get_users_page(
+        session: AsyncSession, fields: list[Field],
+        sort: str = 'id', descending: bool = False,
+        cursor: str|None = None,
+        filter_field: Field|None = None, filter_value: str|None = None,
+        page_size: int = USERS_PAGE_SIZE
+    ) -> UsersPage:
+    """
+    Получить страницу пользователей с постраничной навигацией по ключу сортировки
+
+    * fields - поля текущей ветки, только их значения загружаются для пользователей страницы
+    * sort - `id`, `chat_id`, `username` или `fields-{id}` для сортировки по значению поля ветки
+    * cursor - курсор, полученный с предыдущей страницы
+    * filter_field, filter_value - отбор пользователей по значению поля:
+    точное совпадение для булевых полей и поиск подстроки для остальных
+    """
+    sort_column = _get_sort_column(sort, fields)
+    if sort_column is None:
+        sort, sort_column = 'id', User.id
+    sort_value_type = int if sort in ('id', 'chat_id') else str
+    page_size = max(1, min(page_size, USERS_PAGE_MAX_SIZE))
+
+    users_query = select(User.id, User.chat_id, User.username, sort_column)
+
+    if filter_field and filter_value:
+        filter_value_alias = aliased(UserFieldValue)
+        users_query = users_query.where(
+            select(filter_value_alias.id)
+            .where(
+                (filter_value_alias.user_id  == User.id) &
+                (filter_value_alias.field_id == filter_field.id) &
+                (
+                    (filter_value_alias.value == filter_value) if filter_field.is_boolean
+                    else filter_value_alias.value.icontains(filter_value, autoescape=True)
+                )
+            )
+            .exists()
+        )
+
+    decoded_cursor = decode_users_cursor(cursor, sort_value_type) if cursor else None
+    if decoded_cursor:
+        position = tuple_(sort_column, User.id)
+        users_query = users_query.where(
+            position < tuple_(*decoded_cursor) if descending else position > tuple_(*decoded_cursor)
+        )
+
+    users_selected = await session.execute(
+        users_query
+        .order_by(*(
+            (sort_column.desc(), User.id.desc()) if descending
+            else (sort_column.asc(), User.id.asc())
+        ))
+        .limit(page_size + 1)
+    )
+    users_rows = users_selected.tuples().all()
+
+    next_cursor = None
+    if len(users_rows) > page_size:
+        users_rows = users_rows[:page_size]
+        last_id, _, _, last_sort_value = users_rows[-1]
+        next_cursor = encode_users_cursor(last_sort_value, last_id)
+
+    fields_by_id = {field.id: field for field in fields}
+    users_fields: dict[int, dict[int, UserFieldDataPrepared]] = {user_id: {} for user_id, *_ in users_rows}
+    if users_fields and fields_by_id:
+        values_selected = await session.execute(
+            select(UserFieldValue.user_id, UserFieldValue.field_id, UserFieldValue.value)
+            .where(
+                (UserFieldValue.user_id.in_(users_fields.keys())) &
+                (UserFieldValue.field_id.in_(fields_by_id.keys()))
+            )
+        )
+        for user_id, field_id, value in values_selected.tuples():
+            field = fields_by_id[field_id]
+            users_fields[user_id][field_id] = UserFieldDataPrepared(
+                value = value,
+                document_bucket = field.document_bucket,
+                image_bucket    = field.image_bucket
+            )
+
+    return UsersPage(
+        users = [
+            UserDataPrepared(
+                id       = user_id,
+                chat_id  = chat_id,
+                username = username,
+                fields   = users_fields[user_id]
+            )
+            for user_id, chat_id, username, _ in users_rows
+        ],
+        next_cursor = next_cursor
+    )
@@ -0,0 +1,100 @@
+import os
+import asyncio
+import tempfile
+from itertools import groupby
+
+from xlsxwriter import Workbook
+
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio.session import AsyncSession
+
+from loguru import logger
+
+from utils.db_model import User, Field, UserFieldValue
+from utils.config_model import I18n
+
+REPORT_YIELD_PER = 1000
+"""Число строк, получаемых из серверного курсора за один раз"""
+
+REPORT_COLUMN_PADDING = 5
+"""Запас ширины столбца отчёта в символах"""
+
+def _report_fields_order(fields: list[Field]) -> list[Field]:
+    """
+    Внутренняя функция порядка столбцов полей в отчёте - тот же, что и в `User.to_plain_dict`
+    """
+    return sorted(fields, key=lambda field: f"{field.branch_id}_{field.order_place}")
+
+def _report_value(field: Field, value: str, i18n: I18n) -> str:
+    """
+    Внутренняя функция перевода значения поля для отчёта
+    """
+    if field.is_boolean:
+        if value == 'true':
+            return i18n.yes
+        if value == 'false':
+            return i18n.no
+    return value
+
+async def write_users_report_xlsx(session: AsyncSession, sheet_name: str, i18n: I18n) -> str:
+    """
+    Записать отчёт по всем пользователям во временный xlsx файл и вернуть путь к нему
+
+    Строки пишутся напрямую из серверного курсора в книгу в режиме `constant_memory`,
+    поэтому потребление памяти не зависит от числа пользователей. Файл удаляет вызывающий
+    """
+    fields_selected = await session.execute(
+        select(Field)
+    )
+    fields = _report_fields_order(list(fields_selected.scalars()))
+    field_column_by_id = {field.id: 3 + idx for idx, field in enumerate(fields)}
+    field_by_id = {field.id: field for field in fields}
+
+    header = ['id', 'chat_id', 'username'] + [field.key for field in fields]
+    widths = [len(title) for title in header]
+
+    report_fd, report_path = tempfile.mkstemp(suffix='.xlsx')
+    os.close(report_fd)
+
+    workbook  = Workbook(report_path, {'constant_memory': True})
+    try:
+        worksheet = workbook.add_worksheet(sheet_name)
+        worksheet.write_row(0, 0, header)
+
+        rows_stream = await session.stream(
+            select(User.id, User.chat_id, User.username, UserFieldValue.field_id, UserFieldValue.value)
+            .outerjoin(UserFieldValue, UserFieldValue.user_id == User.id)
+            .order_by(User.id.asc())
+            .execution_options(yield_per=REPORT_YIELD_PER)
+        )
+
+        row_idx = 0
+        async for partition in rows_stream.partitions():
+            for (user_id, chat_id, username), user_rows in groupby(partition, key=lambda row: row[:3]):
+                # Строки одного пользователя могут оказаться на границе пачек курсора
+                if row_idx and user_id == last_user_id:
+                    row = last_row
+                else:
+                    row_idx += 1
+                    row = {0: user_id, 1: chat_id, 2: username}
+
+                for _, _, _, field_id, value in user_rows:
+                    if field_id in field_column_by_id:
+                        row[field_column_by_id[field_id]] = _report_value(field_by_id[field_id], value, i18n)
+
+                for column, value in row.items():
+                    worksheet.write(row_idx, column, value)
+                    widths[column] = max(widths[column], len(str(value)))
+                last_user_id, last_row = user_id, row
+
+        worksheet.autofilter(0, 0, max(row_idx, 1), len(header) - 1)
+        for column, width in enumerate(widths):
+            worksheet.set_column(column, column, width + REPORT_COLUMN_PADDING)
+
+        await asyncio.to_thread(workbook.close)
+    except BaseException:
+        os.remove(report_path)
+        raise
+
+    logger.info(f"Written users report with {row_idx} users to {report_path}")
+    return report_path
@@ -21,6 +21,72 @@ class Keycloak(BaseModel, extra="forbid"):
     client: str
     secret: SecretStr
 
+class Broadcast(BaseModel, extra="forbid"):
+    """
+    Настройки массовой рассылки сообщений
+    """
+    global_rate:           float = 25.0 # Сообщений в секунду во все чаты, лимит Telegram около 30
+    private_chat_interval: float = 1.0  # Секунд между сообщениями в один приватный чат
+    group_chat_interval:   float = 3.0  # Секунд между сообщениями в одну группу, лимит Telegram 20 в минуту
+    max_in_flight:         int   = 20   # Максимум одновременно отправляемых сообщений
+    max_retries:           int   = 3    # Повторы отправки после RetryAfter или сетевой ошибки
+    report_every:          int   = 1000 # Каждые сколько сообщений писать промежуточную скорость отправки
+    ledger_flush_size:     int   = 50   # Каждые сколько отправленных уведомлений сохранять статусы доставки в БД
+
+class Metrics(BaseModel, extra="forbid"):
+    """
+    Настройки выдачи метрик процесса бота в формате Prometheus
+    """
+    enabled: bool = False       # Включить сбор и выдачу метрик
+    host:    str  = '127.0.0.1' # Адрес, на котором выдаются метрики
+    port:    int  = 9100        # Порт, на котором выдаются метрики
+
+class Webhook(BaseModel, extra="forbid"):
+    """
+    Настройки получения обновлений бота через webhook вместо long polling
+    """
+    enabled: bool = False      # Получать обновления через webhook
+    url:     str|None = None   # Внешний адрес webhook, на который telegram отправляет обновления, например `https://example.com/box-bot/webhook`
+    listen:  str = '0.0.0.0'   # Адрес, на котором принимаются обновления
+    port:    int = 8443        # Порт, на котором принимаются обновления
+    path:    str = '/webhook'  # Путь, на котором принимаются обновления
+    secret_token:    SecretStr|None = None # Секрет, передаваемый telegram в заголовке `X-Telegram-Bot-Api-Secret-Token`
+    max_connections: int = 40  # Максимум одновременных соединений telegram к webhook
+
+class UpdateProcessing(BaseModel, extra="forbid"):
+    """
+    Настройки параллельной обработки обновлений бота
+    """
+    max_concurrent: int = 64   # Максимум одновременно обрабатываемых обновлений разных чатов
+    max_pending:    int = 4096 # Максимум принятых обновлений, включая ожидающие очереди своего чата
+
+class Sharding(BaseModel, extra="forbid"):
+    """
+    Настройки распределения обновлений бота по нескольким процессам по ИД чата
+    """
+    workers:      int = 1           # Число процессов обработки обновлений, при 1 бот работает одним процессом
+    workers_host: str = '127.0.0.1' # Адрес, на котором процессы обработки принимают обновления от входного процесса
+    workers_port: int = 8600        # Порт первого процесса обработки, остальные занимают следующие порты
+    queue_size:   int = 10000       # Максимум обновлений, ожидающих передачи в один процесс обработки
+
+class QueryBudget(BaseModel, extra="forbid"):
+    """
+    Настройки подсчёта запросов к БД на одно обновление
+    """
+    enabled:         bool  = False # Включить подсчёт запросов к БД в обработчиках
+    max_statements:  int   = 5     # Число запросов на обновление, сверх которого пишется предупреждение
+    max_db_time:     float = 0.1   # Суммарное время запросов на обновление в секундах, сверх которого пишется предупреждение
+    report_interval: int   = 600   # Интервал вывода самых затратных обработчиков в секундах
+    report_top:      int   = 5     # Число выводимых самых затратных обработчиков
+
+class LogWriter(BaseModel, extra="forbid"):
+    """
+    Настройки буферизованной записи логов бота в БД
+    """
+    batch_size:     int   = 200   # Максимум записей, сохраняемых одним запросом
+    flush_interval: float = 1.0   # Максимальное время ожидания записи в очереди перед сохранением в секундах
+    queue_size:     int   = 10000 # Максимум записей в очереди, сверх которого запись ожидает сохранения предыдущих
+
 class DefaultValue(BaseModel, extra="forbid"):
     """
     Значения по-умолчанию
@@ -194,6 +260,11 @@ class I18n(BaseModel, extra="forbid"):
 
     download_users_report: str
 
+    users_filter:       str
+    users_filter_reset: str
+    users_first_page:   str
+    users_next_page:    str
+
     replyable_condition_messages: str
     reply_condition_message_name: str
 
@@ -251,10 +322,19 @@ class ConfigYaml(BaseSettings):
     minio_root_password: SecretStr
     minio_secure: bool
     minio_host:   str
-
-    keycloak: Keycloak
-    defaults: Defaults
-    i18n:     I18n
+    minio_thumbnail_workers: int = 2
+    """Число процессов построения уменьшенных изображений"""
+
+    keycloak:  Keycloak
+    broadcast: Broadcast = Broadcast()
+    metrics:   Metrics   = Metrics()
+    webhook:   Webhook   = Webhook()
+    sharding:  Sharding  = Sharding()
+    update_processing: UpdateProcessing = UpdateProcessing()
+    query_budget: QueryBudget = QueryBudget()
+    log_writer:   LogWriter   = LogWriter()
+    defaults:  Defaults
+    i18n:      I18n
     
 def create_config() -> ConfigYaml:
     """
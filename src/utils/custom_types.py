@@ -76,6 +76,15 @@ class NotificationStatusEnum(Enum):
     PLANNED    = 'planned'
     DELIVERED  = 'delivered'
 
+class DeliveryStatusEnum(Enum):
+    """
+    Статус доставки сообщения рассылки получателю
+    """
+    PENDING = 'pending' # Ожидает отправки
+    SENT    = 'sent'    # Отправлено
+    FAILED  = 'failed'  # Не удалось отправить
+    BLOCKED = 'blocked' # Получатель заблокировал бота
+
 class UserFieldDataPlain(NamedTuple):
     key:   str
     value: str
@@ -84,9 +93,23 @@ class UserFieldDataPrepared(NamedTuple):
     value: str
     document_bucket: str
     image_bucket:    str
+    telegram_file_id: str|None = None
 
 class UserDataPrepared(NamedTuple):
     id:       int
     chat_id:  int
     username: str
-    fields:   dict[int, UserFieldDataPrepared]
\ No newline at end of file
+    fields:   dict[int, UserFieldDataPrepared]
+
+class UserState(NamedTuple):
+    """
+    Состояние пользователя без значений полей и связанных объектов - всё, что нужно обработчикам сообщений
+    """
+    id:       int
+    chat_id:  int
+    username: str|None
+    status:   UserStatusEnum
+    curr_field_id:           int|None
+    deferred_field_id:       int|None
+    change_field_message_id: int|None
+    curr_reply_message_id:   int|None
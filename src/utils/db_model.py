@@ -2,7 +2,9 @@ from sqlalchemy import (
     Column,
     ForeignKey,
     Integer,
-    BigInteger
+    BigInteger,
+    UniqueConstraint,
+    Index
 )
 from sqlalchemy.orm import (
     MappedAsDataclass, 
@@ -21,6 +23,7 @@ from utils.custom_types import (
     ReplyTypeEnum,
     KeyboardKeyStatusEnum,
     NotificationStatusEnum,
+    DeliveryStatusEnum,
     UserFieldDataPlain,
     UserFieldDataPrepared,
     UserDataPrepared
@@ -245,8 +248,9 @@ class User(Base):
             fields |= {
                 field_value.field_id: UserFieldDataPrepared(
                     value = field_value.value,
-                    document_bucket = field.document_bucket,
-                    image_bucket    = field.image_bucket
+                    document_bucket  = field.document_bucket,
+                    image_bucket     = field.image_bucket,
+                    telegram_file_id = field_value.telegram_file_id
                 )
             }
         return fields
@@ -257,6 +261,9 @@ class UserFieldValue(Base):
     """
 
     __tablename__ = "user_field_values"
+    __table_args__ = (
+        Index('ix_user_field_values_user_id_field_id', 'user_id', 'field_id', unique=True),
+    )
 
     id: Mapped[int] = mapped_column(primary_key=True, nullable=False)
     
@@ -267,6 +274,9 @@ class UserFieldValue(Base):
     
     message_id: Mapped[int] = mapped_column(nullable=True, default=None, type_=BigInteger)
 
+    telegram_file_id: Mapped[str|None] = mapped_column(nullable=True, default=None)
+    """ИД файла в telegram для повторной отправки файла без загрузки из бакета"""
+
     field = relationship('Field', lazy='selectin')
 
 class KeyboardKey(Base):
@@ -304,6 +314,49 @@ class Notification(Base):
     reply_condition_message = relationship('ReplyableConditionMessage', lazy='selectin')
     """Сообщение с настройками условий и ответов"""
 
+class NotificationDelivery(Base):
+    """
+    Доставка уведомления одному получателю - журнал рассылки, по которому она продолжается после перезапуска
+    """
+
+    __tablename__ = "notification_deliveries"
+    __table_args__ = (
+        UniqueConstraint('notification_id', 'user_id'),
+    )
+
+    id: Mapped[int] = mapped_column(primary_key=True, nullable=False)
+
+    notification_id = Column(Integer, ForeignKey(Notification.id), nullable=False)
+    user_id         = Column(Integer, ForeignKey(User.id), nullable=False)
+
+    chat_id:   Mapped[int]                = mapped_column(nullable=False, type_=BigInteger)
+    status:    Mapped[DeliveryStatusEnum] = mapped_column(nullable=False, index=True, default=DeliveryStatusEnum.PENDING)
+    timestamp: Mapped[datetime|None]      = mapped_column(default=None)
+    """Время получения итогового статуса доставки"""
+
+class StoredFile(Base):
+    """
+    Файл, помещённый в бакет под именем по хешу содержимого - одинаковые файлы хранятся один раз
+    """
+
+    __tablename__ = "stored_files"
+    __table_args__ = (
+        UniqueConstraint('bucket', 'content_hash'),
+    )
+
+    id:           Mapped[int] = mapped_column(primary_key=True, nullable=False)
+    bucket:       Mapped[str] = mapped_column(nullable=False)
+    content_hash: Mapped[str] = mapped_column(nullable=False)
+    """SHA-256 содержимого файла"""
+
+    filename: Mapped[str] = mapped_column(nullable=False)
+    """Имя файла или уменьшенной версии, сохраняемое в значениях полей"""
+    content_type: Mapped[str] = mapped_column(nullable=False)
+    size:         Mapped[int] = mapped_column(nullable=False, type_=BigInteger)
+
+    telegram_file_unique_id: Mapped[str|None] = mapped_column(default=None, index=True)
+    """Уникальный ИД файла в telegram, по которому повторная отправка распознаётся без загрузки"""
+
 class Log(Base):
     """
     Лог - дополнительный способ сохранить информацию из бота
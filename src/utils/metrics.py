@@ -0,0 +1,224 @@
+import asyncio
+from time import perf_counter
+from bisect import bisect_left
+from typing import Callable
+
+from loguru import logger
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+"""Границы корзин гистограмм длительности по умолчанию, в секундах"""
+
+def _escape_label_value(value: str) -> str:
+    """
+    Внутренняя функция экранирования значения метки в текстовом формате Prometheus
+    """
+    return value.replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+def _format_labels(labels_names: tuple[str, ...], labels_values: tuple[str, ...], extra: str = '') -> str:
+    """
+    Внутренняя функция форматирования меток метрики
+    """
+    labels = [
+        f'{name}="{_escape_label_value(str(value))}"'
+        for name, value in zip(labels_names, labels_values)
+    ]
+    if extra:
+        labels.append(extra)
+    return '{' + ','.join(labels) + '}' if labels else ''
+
+class _Metric:
+    """
+    Внутренний базовый класс метрики с метками
+    """
+    TYPE = ''
+
+    def __init__(self, name: str, description: str, labels_names: tuple[str, ...] = ()) -> None:
+        self.name         = name
+        self.description  = description
+        self.labels_names = labels_names
+
+    def _key(self, labels: dict[str, str]) -> tuple[str, ...]:
+        return tuple(str(labels.get(name, '')) for name in self.labels_names)
+
+    def samples(self) -> list[str]:
+        raise NotImplementedError()
+
+    def render(self) -> str:
+        return '\n'.join([
+            f"# HELP {self.name} {self.description}",
+            f"# TYPE {self.name} {self.TYPE}",
+            *self.samples()
+        ])
+
+class Counter(_Metric):
+    """
+    Монотонно растущий счётчик
+    """
+    TYPE = 'counter'
+
+    def __init__(self, name: str, description: str, labels_names: tuple[str, ...] = ()) -> None:
+        super().__init__(name, description, labels_names)
+        self._values: dict[tuple[str, ...], float] = {}
+
+    def inc(self, amount: float = 1.0, **labels: str) -> None:
+        key = self._key(labels)
+        self._values[key] = self._values.get(key, 0.0) + amount
+
+    def samples(self) -> list[str]:
+        return [
+            f"{self.name}{_format_labels(self.labels_names, key)} {value}"
+            for key, value in self._values.items()
+        ]
+
+class Gauge(_Metric):
+    """
+    Текущее значение, вычисляемое функцией в момент сбора метрик
+    """
+    TYPE = 'gauge'
+
+    def __init__(self, name: str, description: str, collect: Callable[[], float]) -> None:
+        super().__init__(name, description)
+        self._collect = collect
+
+    def samples(self) -> list[str]:
+        try:
+            return [f"{self.name} {float(self._collect())}"]
+        except Exception as err:
+            logger.warning(f"Could not collect gauge {self.name}: {err}")
+            return []
+
+class Histogram(_Metric):
+    """
+    Гистограмма распределения значений, обычно длительностей в секундах
+    """
+    TYPE = 'histogram'
+
+    def __init__(self, name: str, description: str, labels_names: tuple[str, ...] = (), buckets: tuple[float, ...] = DEFAULT_BUCKETS) -> None:
+        super().__init__(name, description, labels_names)
+        self.buckets = buckets
+        self._values: dict[tuple[str, ...], tuple[list[int], list[float]]] = {}
+
+    def observe(self, value: float, **labels: str) -> None:
+        key = self._key(labels)
+        if key not in self._values:
+            self._values[key] = ([0] * (len(self.buckets) + 1), [0.0])
+        counts, total = self._values[key]
+        counts[bisect_left(self.buckets, value)] += 1
+        total[0] += value
+
+    def time(self, **labels: str) -> '_Timer':
+        """
+        Измерить длительность блока `with`
+        """
+        return _Timer(self, labels)
+
+    def samples(self) -> list[str]:
+        samples = []
+        for key, (counts, total) in self._values.items():
+            cumulative = 0
+            for bound, count in zip((*self.buckets, float('inf')), counts):
+                cumulative += count
+                le = '+Inf' if bound == float('inf') else str(bound)
+                le_label = f'le="{le}"'
+                samples.append(f"{self.name}_bucket{_format_labels(self.labels_names, key, le_label)} {cumulative}")
+            samples.append(f"{self.name}_sum{_format_labels(self.labels_names, key)} {total[0]}")
+            samples.append(f"{self.name}_count{_format_labels(self.labels_names, key)} {cumulative}")
+        return samples
+
+class _Timer:
+    """
+    Внутренний контекстный менеджер измерения длительности для гистограммы
+    """
+
+    def __init__(self, histogram: Histogram, labels: dict[str, str]) -> None:
+        self._histogram = histogram
+        self._labels    = labels
+
+    def __enter__(self) -> '_Timer':
+        self._started = perf_counter()
+        return self
+
+    def __exit__(self, *_) -> None:
+        self._histogram.observe(perf_counter() - self._started, **self._labels)
+
+class MetricsRegistry:
+    """
+    Реестр метрик процесса с выдачей в текстовом формате Prometheus по HTTP
+    """
+
+    CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+    def __init__(self) -> None:
+        self._metrics: dict[str, _Metric] = {}
+        self._server: asyncio.Server | None = None
+
+    def _register(self, metric: _Metric) -> _Metric:
+        return self._metrics.setdefault(metric.name, metric)
+
+    def counter(self, name: str, description: str, labels_names: tuple[str, ...] = ()) -> Counter:
+        """
+        Получить или создать счётчик
+        """
+        return self._register(Counter(name, description, labels_names))
+
+    def histogram(self, name: str, description: str, labels_names: tuple[str, ...] = (), buckets: tuple[float, ...] = DEFAULT_BUCKETS) -> Histogram:
+        """
+        Получить или создать гистограмму
+        """
+        return self._register(Histogram(name, description, labels_names, buckets))
+
+    def gauge(self, name: str, description: str, collect: Callable[[], float]) -> Gauge:
+        """
+        Создать или заменить показатель, вычисляемый функцией при сборе метрик
+        """
+        gauge = Gauge(name, description, collect)
+        self._metrics[name] = gauge
+        return gauge
+
+    def render(self) -> str:
+        """
+        Выдать все метрики в текстовом формате Prometheus
+        """
+        return '\n'.join(metric.render() for metric in self._metrics.values()) + '\n'
+
+    async def _handle_scrape(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        """
+        Внутренняя функция ответа на HTTP запрос метрик
+        """
+        try:
+            await reader.readuntil(b'\r\n\r\n')
+            body = self.render().encode()
+            writer.write(
+                (
+                    "HTTP/1.1 200 OK\r\n"
+                    f"Content-Type: {self.CONTENT_TYPE}\r\n"
+                    f"Content-Length: {len(body)}\r\n"
+                    "Connection: close\r\n\r\n"
+                ).encode() + body
+            )
+            await writer.drain()
+        except (asyncio.IncompleteReadError, asyncio.LimitOverrunError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+
+    async def serve(self, host: str, port: int) -> None:
+        """
+        Начать выдачу метрик по HTTP на заданном адресе
+        """
+        if self._server:
+            return
+        self._server = await asyncio.start_server(self._handle_scrape, host, port)
+        logger.info(f"Serving metrics on http://{host}:{port}/metrics")
+
+    async def stop(self) -> None:
+        """
+        Остановить выдачу метрик
+        """
+        server, self._server = self._server, None
+        if server:
+            server.close()
+            await server.wait_closed()
+
+metrics = MetricsRegistry()
+"""Реестр метрик процесса"""
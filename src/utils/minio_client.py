@@ -1,17 +1,72 @@
 import asyncio
+import hashlib
+import multiprocessing
 from io import BytesIO
+from tempfile import SpooledTemporaryFile
+from concurrent.futures import ProcessPoolExecutor
+from typing import AsyncIterable, AsyncIterator, NamedTuple
 from minio import Minio, S3Error
+from minio.datatypes import Object
 from loguru import logger
 import filetype
 
+from utils.metrics import metrics
+
 from PIL import Image
 
+MINIO_REQUEST_DURATION = metrics.histogram(
+    'minio_request_duration_seconds', 'Длительность запросов к MinIO', ('operation',)
+)
+MINIO_TRANSFERRED_BYTES = metrics.counter(
+    'minio_transferred_bytes_total', 'Число байт, переданных в MinIO и полученных из него', ('direction',)
+)
+
+THUMBNAIL_SIZE = (256, 256)
+"""Максимальный размер уменьшенного изображения"""
+
+def _make_thumbnail(image_bytes: bytes, image_format: str) -> bytes:
+    """
+    Внутренняя функция построения уменьшенного изображения, выполняется в отдельном процессе
+
+    JPEG декодируется сразу в уменьшенном масштабе в режиме draft
+    """
+    with Image.open(BytesIO(image_bytes), formats=[image_format]) as image:
+        image.draft(image.mode, THUMBNAIL_SIZE)
+        image.thumbnail(THUMBNAIL_SIZE)
+
+        thumbnail_bio = BytesIO()
+        image.save(thumbnail_bio, format=image_format)
+        return thumbnail_bio.getvalue()
+
+class StagedFile(NamedTuple):
+    """
+    Файл, принятый во временное хранилище перед помещением в бакет
+    """
+    file:         SpooledTemporaryFile
+    content_hash: str
+    """SHA-256 содержимого файла"""
+    content_type: str
+    extension:    str
+    size:         int
+
 class MinIOClient:
     """
     Обёртка для удобного асинхронного взаимодействия с MINIO
     """
 
-    def __init__(self, access_key: str, secret_key: str, secure: bool, host: str) -> None:
+    STREAM_CHUNK_SIZE = 64 * 1024
+    """Размер части файла при потоковой загрузке из бакета"""
+
+    STREAM_PART_SIZE = 5 * 1024 * 1024
+    """Размер части multipart загрузки в бакет - минимально допустимый в S3"""
+
+    STAGE_MAX_MEMORY_SIZE = 5 * 1024 * 1024
+    """Размер принимаемого файла, после которого он сохраняется на диск"""
+
+    FILETYPE_HEAD_SIZE = 261
+    """Число первых байт файла, достаточное для определения его типа"""
+
+    def __init__(self, access_key: str, secret_key: str, secure: bool, host: str, thumbnail_workers: int = 2) -> None:
         self.host = host
         self.base_url = f"{'https' if secure else 'http'}://{self.host}"
         self._client = Minio(self.host,
@@ -20,67 +75,128 @@ class MinIOClient:
             secure=secure
         )
         self._semaphore = asyncio.Semaphore(50)
+        self._thumbnail_executor = ProcessPoolExecutor(
+            max_workers=thumbnail_workers,
+            mp_context=multiprocessing.get_context('spawn')
+        )
 
-    async def _put_object(self, bucket: str, filename: str, bio: BytesIO, content_type: str) -> None:
+    async def upload(self, bucket: str, filename: str, data: bytes, content_type: str) -> None:
         """
-        Внутренняя функция для асинхроанного помещения файла в заданный бакет
+        Асинхронное помещение небольшого файла из памяти в бакет, например уменьшенного изображения
         """
         def _put_object_sync():
-            bio.seek(0)
             self._client.put_object(
                 bucket_name=bucket,
                 object_name=filename,
-                data=bio,
-                length=bio.getbuffer().nbytes,
+                data=BytesIO(data),
+                length=len(data),
                 content_type=content_type
             )
-        await asyncio.get_event_loop().run_in_executor(None, _put_object_sync)
-
-    async def upload(self, bucket: str, filename: str, bio: BytesIO, content_type: str) -> None:
-        """
-        Асинхронное помещение файла в бакет
-        """
         async with self._semaphore:
             logger.info(f"Uploading {filename} to MinIO into bukcket {bucket}")
-            await self._put_object(bucket, filename, bio, content_type)
+            with MINIO_REQUEST_DURATION.time(operation='put'):
+                await asyncio.get_event_loop().run_in_executor(None, _put_object_sync)
+            MINIO_TRANSFERRED_BYTES.inc(len(data), direction='upload')
         logger.success(f"Done uploading {filename} to MinIO into bukcket {bucket}")
     
-    async def upload_with_thumbnail_and_return_filename(self, bucket: str, filename_wo_extension: str, bio: BytesIO) -> str:
+    async def _put_object_file(self, bucket: str, filename: str, staged: StagedFile) -> None:
+        """
+        Внутренняя функция для асинхронного помещения принятого файла в бакет multipart загрузкой
         """
-        Асинхронное помещение файла в бакет
+        def _put_object_sync():
+            staged.file.seek(0)
+            self._client.put_object(
+                bucket_name=bucket,
+                object_name=filename,
+                data=staged.file,
+                length=staged.size,
+                part_size=self.STREAM_PART_SIZE,
+                content_type=staged.content_type
+            )
+        with MINIO_REQUEST_DURATION.time(operation='put'):
+            await asyncio.get_event_loop().run_in_executor(None, _put_object_sync)
+        MINIO_TRANSFERRED_BYTES.inc(staged.size, direction='upload')
 
-        Если файл является изображением - вычисляется также уменьшенная версия и помещается рядом
+    async def stage_stream(self, chunks: AsyncIterable[bytes]) -> StagedFile:
+        """
+        Принять файл частями во временное хранилище, вычисляя хеш содержимого и определяя тип по первым байтам
 
-        Возвращается имя файла или уменьшенной версии для сохранения в БД 
+        В памяти хранится не больше `STAGE_MAX_MEMORY_SIZE`, остальное сохраняется на диск.
+        Временный файл закрывает вызывающий
         """
-        bio.seek(0)
+        loop   = asyncio.get_event_loop()
+        file   = SpooledTemporaryFile(max_size=self.STAGE_MAX_MEMORY_SIZE)
+        hasher = hashlib.sha256()
+        head   = b''
+        size   = 0
+
         try:
-            guessed_file = filetype.guess(bio)
-            content_type = guessed_file.mime if guessed_file else 'application/octet-stream'
-            extension    = guessed_file.extension if guessed_file else 'bin'
-        except TypeError:
-            content_type = 'application/octet-stream'
-            extension    = 'bin'
+            async for chunk in chunks:
+                hasher.update(chunk)
+                if len(head) < self.FILETYPE_HEAD_SIZE:
+                    head += chunk[:self.FILETYPE_HEAD_SIZE - len(head)]
+                await loop.run_in_executor(None, file.write, chunk)
+                size += len(chunk)
+        except BaseException:
+            file.close()
+            raise
+
+        guessed_file = filetype.guess(head) if head else None
+        return StagedFile(
+            file         = file,
+            content_hash = hasher.hexdigest(),
+            content_type = guessed_file.mime if guessed_file else 'application/octet-stream',
+            extension    = guessed_file.extension if guessed_file else 'bin',
+            size         = size
+        )
+
+    async def _upload_staged(self, bucket: str, filename: str, staged: StagedFile) -> None:
+        """
+        Внутренняя функция помещения принятого файла в бакет с ограничением числа одновременных загрузок
+        """
+        async with self._semaphore:
+            logger.info(f"Uploading {filename} to MinIO into bukcket {bucket}")
+            await self._put_object_file(bucket, filename, staged)
+        logger.success(f"Done uploading {filename} to MinIO into bukcket {bucket}")
+
+    async def upload_staged_with_thumbnail_and_return_filename(self, bucket: str, staged: StagedFile) -> str:
+        """
+        Асинхронное помещение принятого файла в бакет под именем по хешу содержимого multipart загрузкой
 
-        filename = f"{filename_wo_extension}.{extension}"
-        await self.upload(bucket, filename, bio, content_type)
+        Для изображений рядом помещается уменьшенная версия - в процесс её построения передаётся
+        единственная копия содержимого, сам файл загружается из временного хранилища
 
-        if not content_type.startswith('image'):
+        Возвращается имя файла или уменьшенной версии для сохранения в БД
+        """
+        filename = f"{staged.content_hash}.{staged.extension}"
+        if not staged.content_type.startswith('image'):
+            await self._upload_staged(bucket, filename, staged)
             return filename
-        
-        image_format = content_type.removeprefix('image/').upper()
-        
-        bio.seek(0)
-        with Image.open(bio, formats=[image_format]) as image:
-            image.thumbnail((256, 256))
 
-            thumbnail_bio = BytesIO()
-            image.save(thumbnail_bio, format=image_format)
-            
-            thumbnail_filename = f"{filename_wo_extension}_thumbnail.{extension}"
-            await self.upload(bucket, thumbnail_filename, thumbnail_bio, content_type)
+        def _read_staged() -> bytes:
+            staged.file.seek(0)
+            return staged.file.read()
+        image_bytes  = await asyncio.get_event_loop().run_in_executor(None, _read_staged)
+        image_format = staged.content_type.removeprefix('image/').upper()
+        thumbnail_filename = f"{staged.content_hash}_thumbnail.{staged.extension}"
 
-            return thumbnail_filename
+        async def _upload_thumbnail() -> None:
+            thumbnail_bytes = await asyncio.get_event_loop().run_in_executor(
+                self._thumbnail_executor, _make_thumbnail, image_bytes, image_format
+            )
+            await self.upload(bucket, thumbnail_filename, thumbnail_bytes, staged.content_type)
+
+        await asyncio.gather(
+            self._upload_staged(bucket, filename, staged),
+            _upload_thumbnail()
+        )
+        return thumbnail_filename
+
+    def shutdown(self) -> None:
+        """
+        Остановить процессы построения уменьшенных изображений
+        """
+        self._thumbnail_executor.shutdown(wait=False, cancel_futures=True)
 
     async def download(self, bucket: str, filename: str) -> tuple[BytesIO | None, str]:
         """
@@ -92,9 +208,11 @@ class MinIOClient:
             return self._client.get_object(bucket, filename)
 
         try:
-            response = await asyncio.get_event_loop().run_in_executor(None, _get_object)
+            with MINIO_REQUEST_DURATION.time(operation='get'):
+                response = await asyncio.get_event_loop().run_in_executor(None, _get_object)
+                file_bytes = BytesIO(response.read())
             logger.success(f"Done downloading {filename} from MinIO {bucket}")
-            file_bytes   = BytesIO(response.read())
+            MINIO_TRANSFERRED_BYTES.inc(file_bytes.getbuffer().nbytes, direction='download')
             content_type = response.getheader('content-type')
         except S3Error as e:
             if e.code == 'NoSuchKey':
@@ -109,6 +227,68 @@ class MinIOClient:
 
         return file_bytes, content_type
     
+    async def download_to_temporary_file(self, bucket: str, filename: str) -> SpooledTemporaryFile:
+        """
+        Асинхронная потоковая загрузка файла из бакета во временное хранилище
+
+        В памяти хранится не больше `STAGE_MAX_MEMORY_SIZE`, остальное сохраняется на диск.
+        Временный файл закрывает вызывающий
+        """
+        loop = asyncio.get_event_loop()
+        file = SpooledTemporaryFile(max_size=self.STAGE_MAX_MEMORY_SIZE)
+        try:
+            async for chunk in self.stream(bucket, filename):
+                await loop.run_in_executor(None, file.write, chunk)
+        except BaseException:
+            file.close()
+            raise
+        file.seek(0)
+        return file
+
+    async def stat(self, bucket: str, filename: str) -> Object | None:
+        """
+        Асинхронное получение сведений о файле в бакете: размер, тип содержимого, ETag
+
+        Возвращает `None` если файл не найден
+        """
+        def _stat_object():
+            return self._client.stat_object(bucket, filename)
+
+        try:
+            with MINIO_REQUEST_DURATION.time(operation='stat'):
+                return await asyncio.get_event_loop().run_in_executor(None, _stat_object)
+        except S3Error as e:
+            if e.code == 'NoSuchKey':
+                logger.info(f"File {filename} not found in MinIO {bucket}")
+                return None
+            raise e
+
+    async def stream(self, bucket: str, filename: str, offset: int = 0, length: int = 0) -> AsyncIterator[bytes]:
+        """
+        Асинхронная потоковая загрузка файла из бакета частями по `STREAM_CHUNK_SIZE`
+
+        * offset, length - загружаемый диапазон байт, `length=0` - до конца файла
+        """
+        logger.info(f"Streaming {filename} from MinIO bucket {bucket} with {offset=} {length=}")
+        loop = asyncio.get_event_loop()
+
+        def _get_object():
+            return self._client.get_object(bucket, filename, offset=offset, length=length)
+
+        with MINIO_REQUEST_DURATION.time(operation='get_stream'):
+            response = await loop.run_in_executor(None, _get_object)
+        try:
+            while True:
+                chunk = await loop.run_in_executor(None, response.read, self.STREAM_CHUNK_SIZE)
+                if not chunk:
+                    break
+                MINIO_TRANSFERRED_BYTES.inc(len(chunk), direction='download')
+                yield chunk
+            logger.success(f"Done streaming {filename} from MinIO {bucket}")
+        finally:
+            response.close()
+            response.release_conn()
+
     async def create_bucket(self, bucket: str) -> None:
         """
         Асинхронное создание бакета с доступом ко всем файлам по прямым ссылкам без авторизации
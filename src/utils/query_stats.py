@@ -0,0 +1,102 @@
+from time import perf_counter
+from collections import Counter
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Iterator, NamedTuple
+
+from sqlalchemy import event
+from sqlalchemy.ext.asyncio import AsyncEngine
+
+class QueryStats:
+    """
+    Запросы к БД, выполненные в рамках обработки одного обновления
+    """
+    __slots__ = ('name', 'statements', 'duration', 'statements_texts')
+
+    STATEMENT_TEXT_LENGTH = 120
+    """Длина текста запроса, по которой группируются повторяющиеся запросы"""
+
+    def __init__(self, name: str) -> None:
+        self.name       = name
+        self.statements = 0
+        self.duration   = 0.0
+        self.statements_texts: Counter[str] = Counter()
+
+    def record(self, statement: str, duration: float) -> None:
+        self.statements += 1
+        self.duration   += duration
+        self.statements_texts[' '.join(statement.split())[:self.STATEMENT_TEXT_LENGTH]] += 1
+
+_current_query_stats: ContextVar[QueryStats | None] = ContextVar('current_query_stats', default=None)
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany) -> None:
+    if _current_query_stats.get() is not None:
+        conn.info.setdefault('query_stats_started', []).append(perf_counter())
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany) -> None:
+    query_stats = _current_query_stats.get()
+    if query_stats is None or not conn.info.get('query_stats_started'):
+        return
+    query_stats.record(statement, perf_counter() - conn.info['query_stats_started'].pop())
+
+def install_query_stats(engine: AsyncEngine) -> None:
+    """
+    Подписаться на выполнение запросов движка БД для подсчёта запросов обновлений
+    """
+    event.listen(engine.sync_engine, 'before_cursor_execute', _before_cursor_execute)
+    event.listen(engine.sync_engine, 'after_cursor_execute', _after_cursor_execute)
+
+@contextmanager
+def track_queries(name: str) -> Iterator[QueryStats]:
+    """
+    Считать запросы к БД, выполненные внутри блока `with`, в том числе в порождённых им задачах
+    """
+    query_stats = QueryStats(name)
+    token = _current_query_stats.set(query_stats)
+    try:
+        yield query_stats
+    finally:
+        _current_query_stats.reset(token)
+
+class QueryStatsSummary(NamedTuple):
+    """
+    Накопленная статистика запросов к БД одного обработчика
+    """
+    name:        str
+    updates:     int
+    statements:  int
+    duration:    float
+    max_statements:  int
+    over_budget: int
+
+    @property
+    def statements_per_update(self) -> float:
+        return self.statements / self.updates if self.updates else 0.0
+
+class QueryStatsAggregator:
+    """
+    Накопление статистики запросов к БД по обработчикам для поиска самых затратных
+    """
+
+    def __init__(self) -> None:
+        self._summaries: dict[str, QueryStatsSummary] = {}
+
+    def add(self, query_stats: QueryStats, over_budget: bool) -> None:
+        summary = self._summaries.get(query_stats.name) or QueryStatsSummary(query_stats.name, 0, 0, 0.0, 0, 0)
+        self._summaries[query_stats.name] = QueryStatsSummary(
+            name           = summary.name,
+            updates        = summary.updates + 1,
+            statements     = summary.statements + query_stats.statements,
+            duration       = summary.duration + query_stats.duration,
+            max_statements = max(summary.max_statements, query_stats.statements),
+            over_budget    = summary.over_budget + int(over_budget)
+        )
+
+    def pop_top(self, count: int|None = None) -> list[QueryStatsSummary]:
+        """
+        Получить обработчики с наибольшим числом запросов на обновление и начать накопление заново
+
+        При `count=None` возвращаются все обработчики
+        """
+        summaries, self._summaries = self._summaries, {}
+        return sorted(summaries.values(), key=lambda summary: summary.statements_per_update, reverse=True)[:count]
@@ -0,0 +1,37 @@
+import asyncio
+
+import pytest
+
+pytest.importorskip('telegram')
+pytest.importorskip('pydantic_settings')
+
+from telegram.error import BadRequest, TimedOut
+
+from utils.config_model import Broadcast
+from utils.custom_types import DeliveryStatusEnum
+from bot.broadcaster import BBBroadcaster, BroadcastMessage
+
+class FakeBot:
+    def __init__(self, error: Exception) -> None:
+        self.error = error
+        self.calls = 0
+
+    async def send_message(self, **_) -> None:
+        self.calls += 1
+        raise self.error
+
+def _send(bot: FakeBot) -> DeliveryStatusEnum:
+    broadcaster = BBBroadcaster(bot, Broadcast(max_retries=3, private_chat_interval=0.0))
+    return asyncio.run(broadcaster.send(BroadcastMessage(chat_id=1, text='text')))
+
+def test_bad_request_is_not_retried():
+    bot = FakeBot(BadRequest('Chat not found'))
+    assert _send(bot) == DeliveryStatusEnum.FAILED
+    assert bot.calls == 1
+
+def test_timeout_is_retried(monkeypatch):
+    async def no_sleep(_): pass
+    monkeypatch.setattr(asyncio, 'sleep', no_sleep)
+    bot = FakeBot(TimedOut())
+    assert _send(bot) == DeliveryStatusEnum.FAILED
+    assert bot.calls == 4
@@ -0,0 +1,28 @@
+import json
+import base64
+
+import pytest
+
+pytest.importorskip('sqlalchemy')
+
+from ui.users_page import encode_users_cursor, decode_users_cursor
+
+def _raw_cursor(payload: object) -> str:
+    return base64.urlsafe_b64encode(json.dumps(payload).encode()).decode()
+
+def test_cursor_round_trip():
+    assert decode_users_cursor(encode_users_cursor(42, 7), int) == (42, 7)
+    assert decode_users_cursor(encode_users_cursor('name', 7), str) == ('name', 7)
+
+@pytest.mark.parametrize('cursor, sort_value_type', [
+    (encode_users_cursor('name', 7), int),
+    (encode_users_cursor(42, 7), str),
+    (encode_users_cursor(True, 7), int),
+    (encode_users_cursor(['nested'], 7), str),
+    (encode_users_cursor(42, 'x'), int),
+    (_raw_cursor([1, 2, 3]), int),
+    (_raw_cursor({'sort': 1}), int),
+    ('not a cursor', int),
+])
+def test_tampered_cursor_is_rejected(cursor, sort_value_type):
+    assert decode_users_cursor(cursor, sort_value_type) is None